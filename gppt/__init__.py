@@ -1,21 +1,79 @@
 """.. include:: ../README.md"""  # noqa: D415
 
+from __future__ import annotations
+
+import importlib
 import importlib.metadata
+from typing import TYPE_CHECKING, Any
 
-from gppt.api import get_token, login, refresh
-from gppt.browser import LoginError
-from gppt.token import Token, TokenError
+if TYPE_CHECKING:
+    from gppt.api import get_token, login, refresh
+    from gppt.browser import LoginError
+    from gppt.cache import TokenCache
+    from gppt.deadline import DeadlineExceededError
+    from gppt.endpoints import Endpoints
+    from gppt.pool import BrowserPool
+    from gppt.retry import RetryPolicy
+    from gppt.scheduler import RefreshScheduler
+    from gppt.secrets import SecretCache
+    from gppt.timing import Trace
+    from gppt.token import Token, TokenError, TokenUnavailableError
+    from gppt.transport import Transport
 
 try:
     __version__ = importlib.metadata.version(__name__)
 except importlib.metadata.PackageNotFoundError:
     __version__ = "0.0.0"
 
+# Where each public name lives. They are imported on first use, so that
+# `import gppt` does not pay for requests, threads and the rest up front.
+_EXPORTS = {
+    "BrowserPool": "gppt.pool",
+    "DeadlineExceededError": "gppt.deadline",
+    "Endpoints": "gppt.endpoints",
+    "LoginError": "gppt.browser",
+    "RefreshScheduler": "gppt.scheduler",
+    "RetryPolicy": "gppt.retry",
+    "SecretCache": "gppt.secrets",
+    "Token": "gppt.token",
+    "TokenCache": "gppt.cache",
+    "TokenError": "gppt.token",
+    "TokenUnavailableError": "gppt.token",
+    "Trace": "gppt.timing",
+    "Transport": "gppt.transport",
+    "get_token": "gppt.api",
+    "login": "gppt.api",
+    "refresh": "gppt.api",
+}
+
+
+def __getattr__(name: str) -> Any:  # noqa: ANN401 -- whichever public name was asked for
+    if name not in _EXPORTS:
+        msg = f"module {__name__!r} has no attribute {name!r}"
+        raise AttributeError(msg)
+    value = getattr(importlib.import_module(_EXPORTS[name]), name)
+    globals()[name] = value  # later lookups skip this function
+    return value
+
+
+def __dir__() -> list[str]:
+    return sorted([*globals(), *_EXPORTS])
+
 
 __all__ = [
+    "BrowserPool",
+    "DeadlineExceededError",
+    "Endpoints",
     "LoginError",
+    "RefreshScheduler",
+    "RetryPolicy",
+    "SecretCache",
     "Token",
+    "TokenCache",
     "TokenError",
+    "TokenUnavailableError",
+    "Trace",
+    "Transport",
     "__version__",
     "get_token",
     "login",
@@ -0,0 +1,721 @@
+"""Asyncio counterparts of :mod:`gppt.api`.
+
+:func:`refresh`, :func:`login` and :func:`get_token` behave exactly like their
+synchronous namesakes, but never block the event loop: ``/auth/token`` is
+called through ``httpx``, the browser is driven through
+``playwright.async_api``, and the remaining blocking work (``op read``, a
+verification-code prompt, the Chromium installer) runs in worker threads. So
+an asyncio application can refresh many profiles concurrently on one loop::
+
+    tokens = await asyncio.gather(*(gppt.aio.refresh(rt, client=client) for rt in refresh_tokens))
+
+Needs the ``aio`` extra for its HTTP client: ``pip install 'gppt[aio]'``.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import re
+import sys
+from time import perf_counter
+from typing import TYPE_CHECKING, Final
+
+try:
+    import httpx
+except ImportError as exc:  # pragma: no cover - depends on the installed extras
+    msg = "gppt.aio needs httpx. Install it with: pip install 'gppt[aio]'"
+    raise ImportError(msg) from exc
+from playwright.async_api import Error as PWError
+from playwright.async_api import TimeoutError as PWTimeoutError
+from playwright.async_api import async_playwright
+
+from gppt import config, token
+from gppt.api import (
+    cache_step,
+    load_cached,
+    login_headless,
+    profile_endpoints,
+    progress,
+    resolve_credentials,
+    save_token,
+)
+from gppt.browser import (
+    BROWSER_ARGS,
+    DEFAULT_TYPING,
+    FIELD_OR_REDIRECT_JS,
+    FORM_MISSING_MSG,
+    FORM_TIMEOUT_MS,
+    LOGIN_FAILED_MSG,
+    MANUAL_TIMEOUT_MS,
+    NO_TOTP_MSG,
+    PASSWORD_SELECTOR,
+    REDIRECT_TIMEOUT_MS,
+    SETTLE_MS,
+    SUBMIT_SELECTOR,
+    TOTP_SELECTOR,
+    TOTP_TIMEOUT_MS,
+    USERNAME_SELECTOR,
+    Authorization,
+    Credentials,
+    LoginError,
+    LoginState,
+    TotpProvider,
+    code_from_callback,
+    context_options,
+    ends_callback_wait,
+    ensure_chromium,
+    field_shown,
+    keystroke_pause_ms,
+    reinstall_needed,
+    typing_mode,
+    will_install,
+    write_storage_state,
+)
+from gppt.endpoints import PIXIV, Endpoints
+from gppt.lock import ProfileLock
+from gppt.retry import DEFAULT_POLICY, RetryPolicy
+from gppt.secrets import is_op_reference
+from gppt.token import HEADERS, Token, TokenRequest, exchange_form, refresh_form
+
+if TYPE_CHECKING:
+    from collections.abc import Callable
+    from pathlib import Path
+
+    from playwright.async_api import Browser, BrowserContext, BrowserType, Locator, Page, Request, Response, Route
+
+    from gppt.browser import TypingMode
+    from gppt.cache import TokenCache
+    from gppt.model_types import LoginInfo
+    from gppt.secrets import SecretCache
+
+# Longest a single off-loop attempt at a profile lock waits before trying again.
+LOCK_POLL_S: Final = 0.1
+
+
+async def refresh(
+    refresh_token: str,
+    *,
+    client: httpx.AsyncClient | None = None,
+    endpoints: Endpoints | None = None,
+    retry: RetryPolicy = DEFAULT_POLICY,
+) -> Token:
+    """Obtain a fresh token pair from a refresh token.
+
+    Args:
+        refresh_token (str): Refresh token from a previous login.
+        client (httpx.AsyncClient | None): Client to send the request with,
+            shared to pool connections across calls. None opens a client for
+            this request alone.
+        endpoints (Endpoints | None): Where to send it. None means pixiv,
+            unless the environment says otherwise.
+        retry (RetryPolicy): How to retry a failed request.
+
+    Returns:
+        Token: The issued token.
+
+    Raises:
+        TokenError: If pixiv rejects the refresh token.
+        TokenUnavailableError: If pixiv cannot be reached, or is failing.
+    """
+    form = refresh_form(refresh_token)
+    return Token.from_response(await _post(form, client, endpoints or Endpoints.from_env(), retry))
+
+
+async def exchange(
+    authorization: Authorization,
+    *,
+    client: httpx.AsyncClient | None = None,
+    endpoints: Endpoints | None = None,
+    retry: RetryPolicy = DEFAULT_POLICY,
+) -> Token:
+    """Exchange an authorization code for a token pair.
+
+    Args:
+        authorization (Authorization): Code and PKCE verifier from the browser login.
+        client (httpx.AsyncClient | None): Client to send the request with.
+            None opens a client for this request alone.
+        endpoints (Endpoints | None): Where to send it. None means pixiv,
+            unless the environment says otherwise.
+        retry (RetryPolicy): How to retry a failed request.
+
+    Returns:
+        Token: The issued token.
+
+    Raises:
+        TokenError: If pixiv rejects the exchange.
+        TokenUnavailableError: If pixiv cannot be reached, or is failing.
+    """
+    endpoints = endpoints or Endpoints.from_env()
+    form = exchange_form(authorization, endpoints.callback_uri)
+    return Token.from_response(await _post(form, client, endpoints, retry))
+
+
+async def login(
+    username: str = "",
+    password: str = "",
+    totp_secret: str = "",
+    *,
+    headless: bool | None = None,
+    totp_prompt: Callable[[], str] | None = None,
+    typing: TypingMode = DEFAULT_TYPING,
+    client: httpx.AsyncClient | None = None,
+    secret_cache: SecretCache | None = None,
+    endpoints: Endpoints | None = None,
+) -> Token:
+    """Log in through the browser and return the issued token.
+
+    The async form of :func:`gppt.api.login`: nothing is read from or written
+    to disk, and every credential may be an ``op://`` 1Password reference.
+
+    Args:
+        username (str): pixiv ID / e-mail address. Empty means a manual login.
+        password (str): pixiv password. Empty means a manual login.
+        totp_secret (str): Base32 TOTP secret or ``otpauth://`` URI.
+        headless (bool | None): Run the browser without a visible window.
+            Defaults to True when both credentials are given, False otherwise.
+        totp_prompt (Callable[[], str] | None): Called (in a worker thread) for
+            a verification code when 2FA is requested and no ``totp_secret``
+            is set.
+        typing (TypingMode): How the credentials are entered: ``"human"``,
+            ``"fast"`` or ``"instant"``.
+        client (httpx.AsyncClient | None): Client for the code exchange.
+        secret_cache (SecretCache | None): Reuse recently resolved ``op://``
+            references instead of running ``op`` again.
+        endpoints (Endpoints | None): Login page and token endpoint to use.
+            None means pixiv's, unless the environment says otherwise.
+
+    Returns:
+        Token: The issued token.
+
+    Raises:
+        ValueError: If ``headless`` is True without both credentials, if
+            ``totp_secret`` is not a usable TOTP secret, or if ``typing`` is
+            unknown.
+        LoginError: If the browser login does not yield an authorization code.
+        TokenError: If pixiv rejects the authorization code.
+    """
+    headless = login_headless(username, password, headless=headless)
+    typing = typing_mode(typing)
+    endpoints = endpoints or Endpoints.from_env()
+    known, pending = _credentials(username, password, totp_secret, totp_prompt=totp_prompt, secret_cache=secret_cache)
+
+    authorization = await fetch_authorization(
+        known.username,
+        known.password,
+        headless=headless,
+        totp=known.totp,
+        typing=typing,
+        credentials=pending,
+        endpoints=endpoints,
+    )
+    return await exchange(authorization, client=client, endpoints=endpoints)
+
+
+async def get_token(
+    profile: str = config.DEFAULT_PROFILE,
+    *,
+    headless: bool = True,
+    force: bool = False,
+    save: bool = True,
+    notify: Callable[[str], None] | None = None,
+    totp_prompt: Callable[[], str] | None = None,
+    typing: TypingMode | None = None,
+    keep_session: bool | None = None,
+    client: httpx.AsyncClient | None = None,
+    cache: TokenCache | None = None,
+    secret_cache: SecretCache | None = None,
+    endpoints: Endpoints | None = None,
+) -> Token:
+    """Return a usable token for a stored profile, logging in only if needed.
+
+    The async form of :func:`gppt.api.get_token`: reuse the cached token,
+    else refresh it, else open the browser.
+
+    Args:
+        profile (str): Profile name, as created by ``gppt configure``.
+        headless (bool): Run the browser without a visible window. Forced to
+            False when the profile has no credentials to type in.
+        force (bool): Ignore the cached token and log in through the browser.
+        save (bool): Write the issued token back to the profile's cache.
+        notify (Callable[[str], None] | None): Called with progress messages.
+        totp_prompt (Callable[[], str] | None): Called (in a worker thread) for
+            a verification code when the profile has no TOTP secret.
+        typing (TypingMode | None): How the credentials are entered. None
+            uses the profile's ``typing`` setting.
+        keep_session (bool | None): Restore and save the profile's browser
+            session. None uses the profile's ``keep_session`` setting.
+        client (httpx.AsyncClient | None): Client for the refresh and the code
+            exchange.
+        cache (TokenCache | None): In-memory layer over the token cache.
+        secret_cache (SecretCache | None): Reuse recently resolved ``op://``
+            references instead of running ``op`` again.
+        endpoints (Endpoints | None): Login page and token endpoint to use.
+            None means the profile's ``endpoints``, under any set in the
+            environment.
+
+    Returns:
+        Token: A token that is valid now.
+
+    Raises:
+        ValueError: If ``typing`` (or the profile's setting) is unknown.
+        LoginError: If the browser login does not yield an authorization code.
+        TokenError: If pixiv rejects the authorization code.
+        TokenUnavailableError: If pixiv cannot be reached, or is failing.
+    """
+    say = progress(notify)
+
+    issued = None if force else await _from_cache(profile, say, client, save=save, cache=cache, endpoints=endpoints)
+    if issued is None:
+        profile_config = config.load_or_default(profile)
+        if keep_session is None:
+            keep_session = profile_config.keep_session
+        issued = await _browser_login(
+            profile_config,
+            headless=headless,
+            say=say,
+            totp_prompt=totp_prompt,
+            typing=typing,
+            storage_state=config.state_path(profile) if keep_session else None,
+            client=client,
+            secret_cache=secret_cache,
+            endpoints=endpoints or Endpoints.from_env(profile_config.endpoints),
+        )
+        if save:
+            save_token(profile, issued, cache)
+    return issued
+
+
+async def _from_cache(
+    profile: str,
+    say: Callable[[str], None],
+    client: httpx.AsyncClient | None,
+    *,
+    save: bool,
+    cache: TokenCache | None,
+    endpoints: Endpoints | None = None,
+) -> Token | None:
+    """Return a still-usable token from the profile's cache, refreshing it (single-flight) if needed."""
+    cached = load_cached(profile, cache)
+    step = cache_step(cached)
+    if step == "reuse":
+        say("Reusing the cached token.")
+        return cached
+    if cached is None or step == "login":
+        return None
+
+    lock = ProfileLock(profile)
+    await _acquire(lock)
+    try:
+        latest = load_cached(profile, cache)
+        if cache_step(latest) == "reuse":
+            say("Reusing the token refreshed by another caller.")
+            return latest
+        if latest is not None and latest.refresh_token:
+            cached = latest
+
+        say("Cached token expired; refreshing ...")
+        try:
+            issued = await refresh(
+                cached.refresh_token,
+                client=client,
+                endpoints=endpoints or profile_endpoints(profile),
+            )
+        except token.TokenUnavailableError:
+            raise  # pixiv is down: a browser login would fail too, only 30 seconds later
+        except token.TokenError as exc:
+            say(f"Refresh failed ({exc}); falling back to a browser login.")
+            return None
+        if save:
+            save_token(profile, issued, cache)
+        return issued
+    finally:
+        lock.release()
+
+
+async def _acquire(lock: ProfileLock) -> None:
+    """Wait for ``lock`` off the event loop, without leaking it to a cancelled task.
+
+    Waiting for another caller's refresh blocks, so each attempt runs in a
+    thread and gives up after :data:`LOCK_POLL_S`. A cancelled task stops
+    waiting at once; the attempt still running in its thread is left to
+    finish, and whatever it took is released.
+    """
+    while True:
+        attempt = asyncio.ensure_future(asyncio.to_thread(lock.acquire, LOCK_POLL_S))
+        try:
+            if await asyncio.shield(attempt):
+                return
+        except asyncio.CancelledError:
+            attempt.add_done_callback(lambda done: _release_if_taken(lock, done))
+            raise
+
+
+def _release_if_taken(lock: ProfileLock, attempt: asyncio.Future[bool]) -> None:
+    if not attempt.cancelled() and attempt.exception() is None and attempt.result():
+        lock.release()
+
+
+async def _browser_login(
+    profile_config: config.ProfileConfig,
+    *,
+    headless: bool,
+    say: Callable[[str], None],
+    totp_prompt: Callable[[], str] | None,
+    typing: TypingMode | None,
+    storage_state: Path | None,
+    client: httpx.AsyncClient | None,
+    secret_cache: SecretCache | None,
+    endpoints: Endpoints,
+) -> Token:
+    """Run the browser login for a profile, downgrading headless when it cannot work."""
+    typing = typing_mode(typing or profile_config.typing)
+    username, password = profile_config.username, profile_config.password
+    known, pending = _credentials(
+        username,
+        password,
+        profile_config.totp_secret,
+        totp_prompt=totp_prompt,
+        secret_cache=secret_cache,
+    )
+
+    if headless and not (username and password):
+        say("No stored credentials: falling back to a visible browser window.")
+        headless = False
+
+    say("Opening browser for pixiv login ...")
+    if will_install(install_browser=True):
+        say("(The first run may take a while to download the headless browser.)")
+
+    authorization = await fetch_authorization(
+        known.username,
+        known.password,
+        headless=headless,
+        totp=known.totp,
+        typing=typing,
+        storage_state=storage_state,
+        credentials=pending,
+        endpoints=endpoints,
+    )
+    if authorization.session_reused:
+        say("Signed in with the saved browser session.")
+    elif username and password:
+        say(f"Filled in the login form in {authorization.form_entry_s:.1f}s ({typing} typing).")
+    return await exchange(authorization, client=client, endpoints=endpoints)
+
+
+async def fetch_authorization(
+    username: str,
+    password: str,
+    *,
+    headless: bool,
+    totp: TotpProvider | None = None,
+    install_browser: bool = True,
+    block_resources: bool = False,
+    typing: TypingMode = DEFAULT_TYPING,
+    storage_state: Path | None = None,
+    credentials: asyncio.Future[Credentials] | None = None,
+    endpoints: Endpoints | None = None,
+) -> Authorization:
+    """Run the browser login on the event loop and return the captured authorization code.
+
+    The async form of :func:`gppt.browser.fetch_authorization`.
+
+    Args:
+        username (str): pixiv ID / e-mail address, or an empty string.
+        password (str): pixiv password, or an empty string.
+        headless (bool): Run the browser without a visible window.
+        totp (TotpProvider | None): Source of two-factor verification codes.
+        install_browser (bool): Install Chromium on the first run (once per
+            Playwright version).
+        block_resources (bool): Abort image, media, font, stylesheet and
+            analytics requests during an unattended login.
+        typing (TypingMode): How the credentials are entered.
+        storage_state (Path | None): Saved browser session to restore, and
+            to rewrite after a successful login.
+        credentials (asyncio.Future[Credentials] | None): Credentials still
+            being resolved while the browser starts, awaited once the form is
+            on screen and used in place of ``username``, ``password`` and
+            ``totp``.
+        endpoints (Endpoints | None): Login page and redirect to expect.
+            None means pixiv's, unless the environment says otherwise.
+
+    Returns:
+        Authorization: The captured code, its PKCE verifier, the login's
+            network traffic, the time spent filling in the form and whether
+            a saved session skipped it.
+
+    Raises:
+        LoginError: If the login form never appears, the login fails, 2FA is
+            required but unavailable, or no authorization code is captured.
+    """
+    state = LoginState(endpoints or Endpoints.from_env())
+    captured = state.captured
+
+    async with async_playwright() as pw:
+        await asyncio.to_thread(ensure_chromium, pw.chromium, install_browser=install_browser)
+        browser = await _launch(pw.chromium, headless=headless, install_browser=install_browser)
+        context = await browser.new_context(**context_options(storage_state))
+        if block_resources:
+            await _block_resources(context, state)
+
+        page = await context.new_page()
+
+        def on_request(request: Request) -> None:
+            state.on_request(request.url)
+
+        def on_response(response: Response) -> None:
+            state.on_response(response.headers)
+
+        page.on("request", on_request)
+        page.on("response", on_response)
+
+        try:
+            await page.goto(state.login_url)
+            timeout_ms = REDIRECT_TIMEOUT_MS
+            if not await _wait_for_form(page, captured, endpoints=state.endpoints):
+                state.session_reused = True
+            else:
+                if credentials is not None:
+                    resolved = await credentials
+                    username, password, totp = resolved.username, resolved.password, resolved.totp
+                if username and password:
+                    state.form_entry_s = await _enter_credentials(
+                        page,
+                        username,
+                        password,
+                        totp=totp,
+                        captured=captured,
+                        typing=typing,
+                        endpoints=state.endpoints,
+                    )
+                else:
+                    print("Waiting for manual login in the browser window ...", file=sys.stderr)  # noqa: T201
+                    timeout_ms = MANUAL_TIMEOUT_MS
+            await _wait_for_callback(page, captured, timeout_ms, endpoints=state.endpoints)
+            if storage_state is not None and "code" in captured:
+                write_storage_state(storage_state, await context.storage_state())
+        finally:
+            await context.close()
+            await browser.close()
+
+    return state.authorization()
+
+
+async def _post(
+    form: dict[str, str],
+    client: httpx.AsyncClient | None,
+    endpoints: Endpoints,
+    retry: RetryPolicy = DEFAULT_POLICY,
+) -> LoginInfo:
+    """POST ``form`` to the token endpoint, retrying as :func:`gppt.token.refresh` does."""
+    if client is None:
+        # A one-off client still honours ALL_PROXY / HTTPS_PROXY / HTTP_PROXY.
+        async with httpx.AsyncClient() as one_shot:
+            return await _post(form, one_shot, endpoints, retry)
+    # The breakers are per process, shared with the sync API: one outage, one breaker.
+    request = TokenRequest(endpoints.auth_token_url, retry)
+    while True:
+        connect, read = request.start()
+        try:
+            response = await client.post(
+                request.url,
+                data=form,
+                headers=HEADERS,
+                timeout=httpx.Timeout(read, connect=connect),
+            )
+        except (httpx.ConnectError, httpx.ConnectTimeout, httpx.PoolTimeout, httpx.ProxyError) as exc:
+            request.unreachable(exc)  # never sent
+        except httpx.TransportError as exc:
+            request.lost(exc)
+        except httpx.HTTPError:
+            request.broken()
+            raise
+        except BaseException:  # a cancelled task included
+            request.interrupted()
+            raise
+        else:
+            if (body := request.answered(response)) is not None:
+                return body
+        await asyncio.sleep(request.backoff())
+
+
+async def _launch(browser_type: BrowserType, *, headless: bool, install_browser: bool) -> Browser:
+    """Launch Chromium, installing it once more if its install stamp was stale."""
+    try:
+        return await browser_type.launch(headless=headless, args=BROWSER_ARGS)
+    except PWError as exc:
+        if not reinstall_needed(exc, install_browser=install_browser):
+            raise
+    await asyncio.to_thread(ensure_chromium, browser_type, install_browser=install_browser)
+    return await browser_type.launch(headless=headless, args=BROWSER_ARGS)
+
+
+async def _block_resources(context: BrowserContext, state: LoginState) -> None:
+    async def on_route(route: Route) -> None:
+        if state.blocks(route.request.url, route.request.resource_type):
+            await route.abort()
+        else:
+            await route.continue_()
+
+    await context.route("**/*", on_route)
+
+
+async def _wait_for_form(page: Page, captured: dict[str, str], *, endpoints: Endpoints = PIXIV) -> bool:
+    """Wait for the login form; return False if the login redirected past it instead."""
+    try:
+        handle = await page.wait_for_function(
+            FIELD_OR_REDIRECT_JS,
+            arg=[USERNAME_SELECTOR, endpoints.redirect_uri],
+            timeout=FORM_TIMEOUT_MS,
+        )
+        outcome = await handle.json_value()
+    except (PWTimeoutError, PWError) as exc:
+        if "code" in captured:
+            return False
+        raise LoginError(FORM_MISSING_MSG.format(login_url=endpoints.login_url)) from exc
+    return field_shown(outcome, captured)
+
+
+async def _enter_credentials(
+    page: Page,
+    username: str,
+    password: str,
+    *,
+    totp: TotpProvider | None,
+    captured: dict[str, str],
+    typing: TypingMode,
+    endpoints: Endpoints = PIXIV,
+) -> float:
+    """Fill in and submit the login form, then the 2FA code if asked; return the seconds spent typing."""
+    started = perf_counter()
+    await _type(page.locator(USERNAME_SELECTOR), username, typing)
+    await _type(page.locator(PASSWORD_SELECTOR), password, typing)
+    form_entry_s = perf_counter() - started
+    await _submit(page)
+    return form_entry_s + await _handle_totp(page, totp, captured, typing, endpoints=endpoints)
+
+
+async def _handle_totp(
+    page: Page,
+    totp: TotpProvider | None,
+    captured: dict[str, str],
+    typing: TypingMode,
+    *,
+    endpoints: Endpoints = PIXIV,
+) -> float:
+    """Fill in the two-factor verification code, if pixiv asks for one; return the seconds spent typing it."""
+    if "code" in captured:
+        return 0.0
+    try:
+        handle = await page.wait_for_function(
+            FIELD_OR_REDIRECT_JS,
+            arg=[TOTP_SELECTOR, endpoints.redirect_uri],
+            timeout=TOTP_TIMEOUT_MS,
+        )
+        outcome = await handle.json_value()
+    except (PWTimeoutError, PWError):
+        return 0.0
+    if not field_shown(outcome, captured):
+        return 0.0
+
+    if totp is None:
+        raise LoginError(NO_TOTP_MSG)
+
+    # The prompt may block on stdin; keep it off the event loop.
+    code = await asyncio.to_thread(totp.code)
+    started = perf_counter()
+    await _type(page.locator(TOTP_SELECTOR), code, typing)
+    await _submit(page)
+    return perf_counter() - started
+
+
+async def _type(element: Locator, text: str, typing: TypingMode) -> None:
+    """Enter ``text`` into ``element`` at the given cadence."""
+    if typing == "instant":
+        await element.fill(text)
+        return
+    for character in text:
+        await element.type(character)
+        await element.page.wait_for_timeout(keystroke_pause_ms(typing))
+
+
+async def _submit(page: Page) -> None:
+    await page.locator(SUBMIT_SELECTOR).press("Enter")
+
+
+async def _wait_for_callback(
+    page: Page,
+    captured: dict[str, str],
+    timeout_ms: int,
+    *,
+    endpoints: Endpoints = PIXIV,
+) -> None:
+    """Return as soon as the ``pixiv://`` callback request has been captured.
+
+    As :func:`gppt.browser._wait_for_callback`: the redirect page is watched
+    for too, and both share one ``timeout_ms``.
+    """
+    if "code" in captured:
+        return
+    started = perf_counter()
+
+    def left_ms() -> int:
+        return max(1, timeout_ms - round((perf_counter() - started) * 1000))
+
+    if page.url.startswith(endpoints.redirect_uri):
+        await _wait_for_redirect(page, left_ms(), endpoints=endpoints)
+        if "code" not in captured:
+            await page.wait_for_timeout(min(SETTLE_MS, left_ms()))
+        return
+
+    try:
+        request = await page.wait_for_event(
+            "request",
+            predicate=lambda request: ends_callback_wait(request.url, endpoints),
+            timeout=timeout_ms,
+        )
+        if code_from_callback(request.url) is None and "code" not in captured:
+            request = await page.wait_for_event(
+                "request",
+                predicate=lambda request: code_from_callback(request.url) is not None,
+                timeout=left_ms(),
+            )
+    except (PWTimeoutError, PWError) as exc:
+        raise LoginError(LOGIN_FAILED_MSG) from exc
+    if code := code_from_callback(request.url):
+        captured.setdefault("code", code)
+
+
+async def _wait_for_redirect(page: Page, timeout_ms: int, *, endpoints: Endpoints = PIXIV) -> None:
+    try:
+        await page.wait_for_url(
+            re.compile(f"^{re.escape(endpoints.redirect_uri)}"),
+            wait_until="networkidle",
+            timeout=timeout_ms,
+        )
+    except (PWTimeoutError, PWError) as exc:
+        raise LoginError(LOGIN_FAILED_MSG) from exc
+
+
+def _credentials(
+    username: str,
+    password: str,
+    totp_secret: str,
+    *,
+    totp_prompt: Callable[[], str] | None,
+    secret_cache: SecretCache | None,
+) -> tuple[Credentials, asyncio.Future[Credentials] | None]:
+    """Split the credentials into those known now and those still being resolved.
+
+    op:// references are resolved in a worker thread while the browser starts.
+    """
+    values = (username, password, totp_secret)
+    if not any(map(is_op_reference, values)):
+        return Credentials(username, password, TotpProvider(totp_secret, totp_prompt)), None
+
+    pending = asyncio.ensure_future(
+        asyncio.to_thread(resolve_credentials, values, totp_prompt=totp_prompt, secret_cache=secret_cache),
+    )
+    # A saved session may skip the form, leaving a failure nobody awaits.
+    pending.add_done_callback(lambda done: done.cancelled() or done.exception())
+    return Credentials(), pending
@@ -7,36 +7,103 @@ Three entry points, in increasing order of how much they do for you:
 - :func:`get_token` is what ``gppt login`` runs: reuse the cached token,
   else refresh it, else open the browser -- against a stored profile.
 
-Everything here is synchronous and returns a :class:`gppt.token.Token`.
+:func:`refresh_many` is what ``gppt refresh-all`` runs: refresh every cached
+profile that is about to expire, concurrently and without a browser.
+
+Everything here is synchronous; see :mod:`gppt.aio` for coroutines. The
+decisions both flavours make alike -- what to do with a cached token, where
+it is saved, when a login may run headless, how credentials are resolved --
+are the public helpers after those, which :mod:`gppt.aio` calls too.
 """
 
 from __future__ import annotations
 
-from typing import TYPE_CHECKING
+import atexit
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor, wait
+from concurrent.futures import TimeoutError as FutureTimeoutError  # not the builtin one before 3.11
+from contextlib import contextmanager
+from dataclasses import dataclass
+from datetime import timedelta
+from typing import TYPE_CHECKING, Final, Literal, TypeVar
 
 from gppt import config, token
-from gppt.browser import TotpProvider, fetch_authorization, is_chromium_installed
-from gppt.secrets import resolve_secret
+from gppt.browser import (
+    DEFAULT_TYPING,
+    Credentials,
+    TotpProvider,
+    fetch_authorization,
+    typing_mode,
+    will_install,
+)
+from gppt.deadline import Deadline, DeadlineExceededError, wait_s
+from gppt.endpoints import Endpoints
+from gppt.lock import ProfileLock
+from gppt.secrets import is_op_reference, resolve_secrets
+from gppt.timing import span
+from gppt.transport import Transport
 
 if TYPE_CHECKING:
-    from collections.abc import Callable
-
+    from collections.abc import Callable, Generator, Iterable
+    from pathlib import Path
+
+    from gppt.browser import Authorization, TypingMode
+    from gppt.cache import TokenCache
+    from gppt.pool import BrowserPool
+    from gppt.retry import RetryPolicy
+    from gppt.secrets import SecretCache
+    from gppt.timing import Trace
     from gppt.token import Token
 
+T = TypeVar("T")
+
+DEFAULT_WORKERS: Final = 8
+
+# refresh_many() also renews tokens this close to expiry, so a batch run
+# leaves every profile with a useful lifetime rather than a minute or two.
+REFRESH_LEAD: Final = timedelta(minutes=5)
+
+# How long the interpreter waits at exit for a background refresh to save
+# what it got: pixiv may already have rotated the refresh token it used.
+REVALIDATE_EXIT_WAIT_S: Final = 15.0  # one try's connect and read timeouts, and some
+
 
-def refresh(refresh_token: str) -> Token:
+def refresh(
+    refresh_token: str,
+    *,
+    transport: Transport | None = None,
+    endpoints: Endpoints | None = None,
+    retry: RetryPolicy | None = None,
+    deadline: timedelta | None = None,
+) -> Token:
     """Obtain a fresh token pair from a refresh token.
 
     Args:
         refresh_token (str): Refresh token from a previous login.
+        transport (Transport | None): Pooled HTTP session to reuse across
+            calls. None makes a one-shot request.
+        endpoints (Endpoints | None): Token endpoint to use. None means
+            pixiv's, unless the environment says otherwise.
+        retry (RetryPolicy | None): How to retry a failed request. None
+            means the transport's policy, or the default one.
+        deadline (timedelta | None): Give up, retries and all, after this
+            long. None leaves each request its own timeouts.
 
     Returns:
         Token: The issued token.
 
     Raises:
         TokenError: If pixiv rejects the refresh token.
+        TokenUnavailableError: If pixiv cannot be reached, or is failing.
+        DeadlineExceededError: If ``deadline`` passes first.
     """
-    return token.refresh(refresh_token)
+    return token.refresh(
+        refresh_token,
+        transport=transport,
+        endpoints=endpoints,
+        retry=retry,
+        deadline=_start(deadline),
+    )
 
 
 def login(
@@ -46,6 +113,16 @@ def login(
     *,
     headless: bool | None = None,
     totp_prompt: Callable[[], str] | None = None,
+    install_browser: bool = True,
+    pool: BrowserPool | None = None,
+    block_resources: bool = False,
+    typing: TypingMode = DEFAULT_TYPING,
+    transport: Transport | None = None,
+    secret_cache: SecretCache | None = None,
+    pipelined: bool = False,
+    trace: Trace | None = None,
+    endpoints: Endpoints | None = None,
+    deadline: timedelta | None = None,
 ) -> Token:
     """Log in through the browser and return the issued token.
 
@@ -62,31 +139,60 @@ def login(
             Defaults to True when both credentials are given, False otherwise.
         totp_prompt (Callable[[], str] | None): Called for a verification code
             when 2FA is requested and no ``totp_secret`` is set.
+        install_browser (bool): Install Chromium if gppt has not done so yet
+            for this Playwright version. False never runs the installer.
+        pool (BrowserPool | None): Warm browsers to log in with, instead of
+            launching Chromium for this login alone.
+        block_resources (bool): Skip images, fonts, stylesheets and analytics
+            during an unattended login, so the page finishes loading sooner.
+        typing (TypingMode): How the credentials are entered: ``"human"``,
+            ``"fast"`` or ``"instant"``.
+        transport (Transport | None): Pooled HTTP session for the code
+            exchange. None makes a one-shot request.
+        secret_cache (SecretCache | None): Reuse recently resolved ``op://``
+            references instead of running ``op`` again.
+        pipelined (bool): Launch the browser and load the login page on a
+            worker thread while the credentials are resolved, and look for
+            the form before the page has finished loading.
+        trace (Trace | None): Record how long each phase of the login took.
+        endpoints (Endpoints | None): Login page and token endpoint to use.
+            None means pixiv's, unless the environment says otherwise.
+        deadline (timedelta | None): Give up after this long. Each phase --
+            browser launch, page load, form, redirect, code exchange -- waits
+            at most what is left of it. None leaves each phase its own
+            timeout.
 
     Returns:
         Token: The issued token.
 
     Raises:
         ValueError: If ``headless`` is True without both credentials -- nobody
-            can type into a window that is not drawn -- or if ``totp_secret``
-            is not a usable TOTP secret.
+            can type into a window that is not drawn -- if ``totp_secret``
+            is not a usable TOTP secret, or if ``typing`` is unknown.
         LoginError: If the browser login does not yield an authorization code.
         TokenError: If pixiv rejects the authorization code.
+        TokenUnavailableError: If pixiv cannot be reached, or is failing.
+        DeadlineExceededError: If ``deadline`` passes first.
     """
-    username = resolve_secret(username)
-    password = resolve_secret(password)
-    has_credentials = bool(username and password)
-
-    if headless is None:
-        headless = has_credentials
-    elif headless and not has_credentials:
-        msg = "headless=True needs both a username and a password; a manual login needs a visible window."
-        raise ValueError(msg)
-
-    # Built before the browser starts, so a malformed secret fails immediately.
-    totp = TotpProvider(resolve_secret(totp_secret), totp_prompt)
-
-    return token.exchange(fetch_authorization(username, password, headless=headless, totp=totp))
+    running = _start(deadline)
+    endpoints = endpoints or Endpoints.from_env()
+    authorization = _authorize(
+        (username, password, totp_secret),
+        totp_prompt=totp_prompt,
+        secret_cache=secret_cache,
+        headless=login_headless(username, password, headless=headless),
+        install_browser=install_browser,
+        pool=pool,
+        block_resources=block_resources,
+        typing=typing_mode(typing),
+        storage_state=None,
+        pipelined=pipelined,
+        trace=trace,
+        endpoints=endpoints,
+        deadline=running,
+    )
+    with span(trace, "token exchange"):
+        return token.exchange(authorization, transport=transport, endpoints=endpoints, deadline=running)
 
 
 def get_token(
@@ -97,6 +203,19 @@ def get_token(
     save: bool = True,
     notify: Callable[[str], None] | None = None,
     totp_prompt: Callable[[], str] | None = None,
+    install_browser: bool = True,
+    pool: BrowserPool | None = None,
+    block_resources: bool = False,
+    typing: TypingMode | None = None,
+    keep_session: bool | None = None,
+    transport: Transport | None = None,
+    cache: TokenCache | None = None,
+    secret_cache: SecretCache | None = None,
+    pipelined: bool = False,
+    trace: Trace | None = None,
+    endpoints: Endpoints | None = None,
+    deadline: timedelta | None = None,
+    stale_while_revalidate: bool = False,
 ) -> Token:
     """Return a usable token for a stored profile, logging in only if needed.
 
@@ -104,6 +223,10 @@ def get_token(
     its refresh token, and only then is the browser opened. This is exactly
     what ``gppt login`` does.
 
+    Refreshes are single-flight: when many threads or processes find the same
+    expired cache, one refreshes and saves while the others wait for it and
+    reuse the token it wrote.
+
     Args:
         profile (str): Profile name, as created by ``gppt configure``.
             ``GPPT_USERNAME`` / ``GPPT_PASSWORD`` override its credentials.
@@ -115,54 +238,548 @@ def get_token(
             ("Reusing the cached token.", ...). Silent by default.
         totp_prompt (Callable[[], str] | None): Called for a verification code
             when 2FA is requested and the profile has no TOTP secret.
+        install_browser (bool): Install Chromium if gppt has not done so yet
+            for this Playwright version. False never runs the installer.
+        pool (BrowserPool | None): Warm browsers to log in with, instead of
+            launching Chromium for this login alone.
+        block_resources (bool): Skip images, fonts, stylesheets and analytics
+            during an unattended login, so the page finishes loading sooner.
+        typing (TypingMode | None): How the credentials are entered. None
+            uses the profile's ``typing`` setting.
+        keep_session (bool | None): Restore the browser session saved by the
+            last login, and save it again afterwards, so pixiv may skip the
+            credential form. None uses the profile's ``keep_session`` setting.
+        transport (Transport | None): Pooled HTTP session for the refresh and
+            the code exchange. None makes one-shot requests.
+        cache (TokenCache | None): In-memory layer over the token cache, so
+            a still-valid token is handed out without reading the file.
+        secret_cache (SecretCache | None): Reuse recently resolved ``op://``
+            references instead of running ``op`` again.
+        pipelined (bool): Launch the browser and load the login page on a
+            worker thread while the credentials are resolved, and look for
+            the form before the page has finished loading.
+        trace (Trace | None): Record how long each phase took: the cache
+            read, a refresh, and every step of a browser login.
+        endpoints (Endpoints | None): Login page and token endpoint to use.
+            None means the profile's ``endpoints``, under any set in the
+            environment.
+        deadline (timedelta | None): Give up after this long, so a caller
+            serving requests has an upper bound on the latency. Waiting for
+            another caller's refresh, the refresh and every phase of a
+            browser login each get what is left of it. None leaves each
+            phase its own timeout.
+        stale_while_revalidate (bool): Hand out a cached token that is within
+            ``EXPIRY_MARGIN`` of its expiry, but not past it, at once, and
+            refresh and save it on a background thread. Only a token that
+            has actually expired is then refreshed on the caller's time.
+            ``notify`` is never called from that thread: a failed background
+            refresh is reported by the next call that hands out the token.
+            At exit, the interpreter waits up to ``REVALIDATE_EXIT_WAIT_S``
+            for a refresh still running to save its token. Ignored when
+            ``save`` is False.
 
     Returns:
         Token: A token that is valid now.
 
     Raises:
+        ValueError: If ``typing`` (or the profile's setting) is unknown.
         LoginError: If the browser login does not yield an authorization code.
         TokenError: If pixiv rejects the authorization code.
+        TokenUnavailableError: If pixiv cannot be reached, or is failing. A
+            cached token that needs refreshing then raises this rather than
+            falling back to a browser login.
+        DeadlineExceededError: If ``deadline`` passes first.
     """
-    say = notify or _silent
-
-    issued = None if force else _from_cache(profile, say)
+    say = progress(notify)
+    running = _start(deadline)
+
+    issued = None
+    if not force:
+        issued = _from_cache(
+            profile,
+            say,
+            transport,
+            save=save,
+            cache=cache,
+            trace=trace,
+            endpoints=endpoints,
+            deadline=running,
+            revalidate=stale_while_revalidate and save,
+        )
     if issued is None:
+        profile_config = config.load_or_default(profile)
+        if keep_session is None:
+            keep_session = profile_config.keep_session
         issued = _browser_login(
-            config.load_or_default(profile),
+            profile_config,
             headless=headless,
             say=say,
             totp_prompt=totp_prompt,
+            install_browser=install_browser,
+            pool=pool,
+            block_resources=block_resources,
+            typing=typing,
+            storage_state=config.state_path(profile) if keep_session else None,
+            transport=transport,
+            secret_cache=secret_cache,
+            pipelined=pipelined,
+            trace=trace,
+            endpoints=endpoints or Endpoints.from_env(profile_config.endpoints),
+            deadline=running,
         )
-
-    if save:
-        token.save(profile, issued)
+        if save:
+            save_token(profile, issued, cache)
     return issued
 
 
-def _silent(_: str) -> None:
-    """Swallow progress messages, so a library call prints nothing."""
+@dataclass
+class RefreshResult:
+    """What :func:`refresh_many` did for one profile."""
 
+    profile: str
+    # "valid": the cached token had enough life left and was kept;
+    # "refreshed": a new token was issued; "failed": see `error`.
+    status: Literal["valid", "refreshed", "failed"]
+    token: Token | None = None
+    error: str = ""
 
-def _from_cache(profile: str, say: Callable[[str], None]) -> Token | None:
-    """Return a still-usable token from the profile's cache, refreshing it if needed."""
-    cached = token.load(profile)
+
+def refresh_many(
+    profiles: Iterable[str] | None = None,
+    *,
+    lead: timedelta = REFRESH_LEAD,
+    max_workers: int = DEFAULT_WORKERS,
+    save: bool = True,
+    transport: Transport | None = None,
+    cache: TokenCache | None = None,
+) -> list[RefreshResult]:
+    """Refresh the cached tokens of many profiles concurrently.
+
+    Only tokens expiring within ``lead`` are refreshed. No browser is ever
+    opened: a profile without a usable refresh token, or whose refresh pixiv
+    rejects, is reported as failed and left for ``gppt login``.
+
+    Args:
+        profiles (Iterable[str] | None): Profile names. None means every
+            profile with a cached token under the config directory.
+        lead (timedelta): Refresh tokens expiring within this window.
+        max_workers (int): Refreshes running at once.
+        save (bool): Write refreshed tokens back to their profile's cache.
+        transport (Transport | None): HTTP session to share between the
+            workers. None opens a pool sized for ``max_workers`` for this call.
+        cache (TokenCache | None): In-memory layer over the token caches.
+
+    Returns:
+        list[RefreshResult]: One result per profile, in the order given.
+    """
+    names = config.cached_profiles() if profiles is None else list(profiles)
+    if not names:
+        return []
+
+    def run(via: Transport) -> list[RefreshResult]:
+        def one(profile: str) -> RefreshResult:
+            return refresh_profile(profile, lead, save=save, transport=via, cache=cache)
+
+        with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="gppt-refresh") as executor:
+            return list(executor.map(one, names))
+
+    if transport is not None:
+        return run(transport)
+    with Transport(pool_size=max_workers) as pooled:
+        return run(pooled)
+
+
+def cached_token(
+    profile: str,
+    *,
+    transport: Transport | None = None,
+    cache: TokenCache | None = None,
+    save: bool = True,
+) -> Token | None:
+    """Return the profile's cached token, refreshed (single-flight) if it has expired; never opens a browser.
+
+    The cache half of :func:`get_token`, for callers that cannot run a login
+    themselves, such as the token server.
+
+    Args:
+        profile (str): Profile name.
+        transport (Transport | None): HTTP session for a refresh. None sends
+            a one-off request.
+        cache (TokenCache | None): In-memory layer over the token cache.
+        save (bool): Write a refreshed token back to the profile's cache.
+
+    Returns:
+        Token | None: A valid token, or None if only a browser login would
+            yield one: nothing is cached, or pixiv rejected the refresh.
+
+    Raises:
+        TokenUnavailableError: If the token needs refreshing and pixiv
+            cannot be reached, or is failing.
+    """
+    return _from_cache(profile, _silent, transport, save=save, cache=cache)
+
+
+def refresh_profile(
+    profile: str,
+    lead: timedelta = REFRESH_LEAD,
+    *,
+    save: bool = True,
+    transport: Transport | None = None,
+    cache: TokenCache | None = None,
+) -> RefreshResult:
+    """Refresh one profile's cached token if it expires within ``lead``; never opens a browser.
+
+    What :func:`refresh_many` and the refresh scheduler run for each profile.
+    The refresh is single-flight: a caller that waited for another one's
+    refresh reuses the token it saved.
+
+    Args:
+        profile (str): Profile name.
+        lead (timedelta): Refresh the token if it expires within this window.
+        save (bool): Write a refreshed token back to the profile's cache.
+        transport (Transport | None): HTTP session for the refresh. None
+            sends a one-off request.
+        cache (TokenCache | None): In-memory layer over the token cache.
+
+    Returns:
+        RefreshResult: What happened to the profile.
+    """
+    cached = load_cached(profile, cache)
     if cached is None:
-        return None
+        return RefreshResult(profile, "failed", error="no cached token")
+    if not cached.expires_within(lead):
+        return RefreshResult(profile, "valid", cached)
 
-    if not cached.is_expired:
-        say("Reusing the cached token.")
-        return cached
+    with ProfileLock(profile):
+        # Someone else may have refreshed it while we waited for the lock.
+        cached = load_cached(profile, cache) or cached
+        if not cached.expires_within(lead):
+            return RefreshResult(profile, "valid", cached)
+        return _refresh_locked(profile, cached, save=save, transport=transport, cache=cache)
+
+
+CacheStep = Literal["reuse", "refresh", "login"]
+
+
+def cache_step(cached: Token | None) -> CacheStep:
+    """Decide what :func:`get_token` does with a profile's cached token.
+
+    Args:
+        cached (Token | None): The cached token, if there is one.
+
+    Returns:
+        CacheStep: ``"reuse"`` it while it is valid, ``"refresh"`` it once it
+            has expired, or ``"login"`` through the browser without a token
+            or a refresh token.
+    """
+    if cached is not None and not cached.is_expired:
+        return "reuse"
+    if cached is None or not cached.refresh_token:
+        return "login"
+    return "refresh"
+
+
+def load_cached(profile: str, cache: TokenCache | None) -> Token | None:
+    """Read the profile's cached token, through ``cache`` if there is one.
+
+    Args:
+        profile (str): Profile name.
+        cache (TokenCache | None): In-memory layer over the token cache.
+
+    Returns:
+        Token | None: The cached token, or None if absent or unreadable.
+    """
+    return token.load(profile) if cache is None else cache.load(profile)
+
+
+def save_token(profile: str, issued: Token, cache: TokenCache | None) -> None:
+    """Write the profile's token cache, through ``cache`` if there is one.
+
+    Args:
+        profile (str): Profile name.
+        issued (Token): Token to store.
+        cache (TokenCache | None): In-memory layer over the token cache.
+    """
+    if cache is None:
+        token.save(profile, issued)
+    else:
+        cache.save(profile, issued)
+
+
+def profile_endpoints(profile: str) -> Endpoints:
+    """Return the profile's endpoints, under any set in the environment.
+
+    Read only when a request is due, so reusing a cached token never parses
+    the profile.
+
+    Args:
+        profile (str): Profile name.
+
+    Returns:
+        Endpoints: Where the profile's requests go.
+    """
+    return Endpoints.from_env(config.load_or_default(profile).endpoints)
+
+
+def login_headless(username: str, password: str, *, headless: bool | None) -> bool:
+    """Decide whether :func:`login` runs the browser headless.
 
+    Args:
+        username (str): pixiv ID / e-mail address, or an ``op://`` reference.
+        password (str): pixiv password, or an ``op://`` reference.
+        headless (bool | None): What the caller asked for. None means headless
+            exactly when both credentials are given.
+
+    Returns:
+        bool: Whether to hide the browser window.
+
+    Raises:
+        ValueError: If ``headless`` is True without both credentials -- nobody
+            can type into a window that is not drawn.
+    """
+    # An op:// reference is never empty, so this holds before it is resolved.
+    has_credentials = bool(username and password)
+    if headless is None:
+        return has_credentials
+    if headless and not has_credentials:
+        msg = "headless=True needs both a username and a password; a manual login needs a visible window."
+        raise ValueError(msg)
+    return headless
+
+
+def resolve_credentials(
+    values: tuple[str, str, str],
+    *,
+    totp_prompt: Callable[[], str] | None,
+    secret_cache: SecretCache | None,
+) -> Credentials:
+    """Resolve ``(username, password, totp_secret)`` into what a login types in.
+
+    Blocks while ``op`` runs, if any of the three is an ``op://`` reference.
+
+    Args:
+        values (tuple[str, str, str]): Plain values or ``op://`` references.
+        totp_prompt (Callable[[], str] | None): Asked for a verification code
+            when there is no TOTP secret.
+        secret_cache (SecretCache | None): Reuse recently resolved references.
+
+    Returns:
+        Credentials: The resolved credentials.
+
+    Raises:
+        ValueError: If the TOTP secret is not usable.
+    """
+    # One `op` run for every op:// reference among the three.
+    username, password, totp_secret = resolve_secrets(values, cache=secret_cache)
+    return Credentials(username, password, TotpProvider(totp_secret, totp_prompt))
+
+
+def progress(notify: Callable[[str], None] | None) -> Callable[[str], None]:
+    """Return where progress messages go: ``notify``, or nowhere.
+
+    Args:
+        notify (Callable[[str], None] | None): The caller's callback.
+
+    Returns:
+        Callable[[str], None]: ``notify``, or a callable that swallows every
+            message, so a library call prints nothing by default.
+    """
+    return notify or _silent
+
+
+def _refresh_locked(
+    profile: str,
+    cached: Token,
+    *,
+    save: bool,
+    transport: Transport | None,
+    cache: TokenCache | None,
+) -> RefreshResult:
+    """Refresh and save ``cached``; the caller holds the profile's lock."""
     if not cached.refresh_token:
-        return None
+        return RefreshResult(profile, "failed", error="the cached token has no refresh token")
 
-    say("Cached token expired; refreshing ...")
     try:
-        return token.refresh(cached.refresh_token)
+        issued = token.refresh(cached.refresh_token, transport=transport, endpoints=profile_endpoints(profile))
     except token.TokenError as exc:
-        say(f"Refresh failed ({exc}); falling back to a browser login.")
+        return RefreshResult(profile, "failed", error=str(exc))
+
+    if save:
+        save_token(profile, issued, cache)
+    return RefreshResult(profile, "refreshed", issued)
+
+
+def _start(budget: timedelta | None) -> Deadline | None:
+    return None if budget is None else Deadline(budget)
+
+
+@contextmanager
+def _locked(profile: str, deadline: Deadline | None) -> Generator[None]:
+    """Hold the profile's lock, waiting for it no longer than ``deadline`` allows."""
+    lock = ProfileLock(profile)
+    if not lock.acquire(timeout=wait_s(deadline, "the profile lock")):
+        msg = f"Ran out of the deadline waiting for another caller to refresh '{profile}'."
+        raise DeadlineExceededError(msg)
+    try:
+        yield
+    finally:
+        lock.release()
+
+
+def _from_cache(
+    profile: str,
+    say: Callable[[str], None],
+    transport: Transport | None,
+    *,
+    save: bool,
+    cache: TokenCache | None,
+    trace: Trace | None = None,
+    endpoints: Endpoints | None = None,
+    deadline: Deadline | None = None,
+    revalidate: bool = False,
+) -> Token | None:
+    """Return a still-usable token from the profile's cache, refreshing it if needed."""
+    with span(trace, "cache read"):
+        cached = load_cached(profile, cache)
+    step = cache_step(cached)
+    if step == "reuse":
+        say("Reusing the cached token.")
+        return cached
+    if cached is None or step == "login":
         return None
 
+    if revalidate and not cached.expires_within(timedelta(0)):
+        _revalidate(profile, say, transport, cache=cache, endpoints=endpoints)
+        say("Reusing the cached token; refreshing it in the background.")
+        return cached
+
+    return _refresh_cached(
+        profile,
+        cached,
+        say,
+        transport,
+        save=save,
+        cache=cache,
+        trace=trace,
+        endpoints=endpoints,
+        deadline=deadline,
+    )
+
+
+def _refresh_cached(
+    profile: str,
+    cached: Token,
+    say: Callable[[str], None],
+    transport: Transport | None,
+    *,
+    save: bool,
+    cache: TokenCache | None,
+    trace: Trace | None,
+    endpoints: Endpoints | None,
+    deadline: Deadline | None,
+) -> Token | None:
+    """Refresh the profile's expired ``cached`` token, once for all callers; None to log in instead."""
+    with _locked(profile, deadline):
+        # Whoever held the lock before us may have refreshed the cache already.
+        latest = load_cached(profile, cache)
+        if cache_step(latest) == "reuse":
+            say("Reusing the token refreshed by another caller.")
+            return latest
+        if latest is not None and latest.refresh_token:
+            cached = latest
+
+        say("Cached token expired; refreshing ...")
+        try:
+            with span(trace, "refresh"):
+                issued = token.refresh(
+                    cached.refresh_token,
+                    transport=transport,
+                    endpoints=endpoints or profile_endpoints(profile),
+                    deadline=deadline,
+                )
+        except token.TokenUnavailableError:
+            raise  # pixiv is down: a browser login would fail too, only 30 seconds later
+        except token.TokenError as exc:
+            say(f"Refresh failed ({exc}); falling back to a browser login.")
+            return None
+        if save:
+            save_token(profile, issued, cache)
+        return issued
+
+
+# The background refresh of each profile running in this process, if any.
+_revalidating: dict[str, Future[Token | None]] = {}
+_revalidating_lock = threading.Lock()
+
+
+def _revalidate(
+    profile: str,
+    say: Callable[[str], None],
+    transport: Transport | None,
+    *,
+    cache: TokenCache | None,
+    endpoints: Endpoints | None,
+) -> Future[Token | None]:
+    """Refresh the profile's cached token on a daemon thread, unless one already is.
+
+    ``say`` is only called here, on the caller's thread: how the last
+    background refresh went is reported by the next call that gets here.
+    """
+    with _revalidating_lock:
+        running = _revalidating.get(profile)
+        if running is None or running.done():
+            if running is not None and (failure := running.exception()) is not None:
+                say(f"Background refresh failed ({failure}).")
+            running = _in_thread(
+                lambda: _refresh_in_background(profile, transport, cache=cache, endpoints=endpoints),
+                name="gppt-revalidate",
+            )
+            _revalidating[profile] = running
+        return running
+
+
+def _refresh_in_background(
+    profile: str,
+    transport: Transport | None,
+    *,
+    cache: TokenCache | None,
+    endpoints: Endpoints | None,
+) -> Token | None:
+    """Refresh and save the profile's cached token, unless another caller is at it; None if nothing was issued.
+
+    A failed refresh is left on the future, for :func:`_revalidate` to report.
+    The cached token stays in place; once it expires, a caller refreshes it in
+    the foreground.
+    """
+    lock = ProfileLock(profile)
+    if not lock.acquire(timeout=0):
+        return None  # another process is refreshing it, and will save what it gets
+    try:
+        latest = load_cached(profile, cache)
+        if latest is None or cache_step(latest) != "refresh":
+            return None
+        issued = token.refresh(
+            latest.refresh_token,
+            transport=transport,
+            endpoints=endpoints or profile_endpoints(profile),
+        )
+        save_token(profile, issued, cache)
+        return issued
+    finally:
+        lock.release()
+
+
+@atexit.register
+def _finish_revalidating() -> None:
+    """Give background refreshes still running a moment to save their tokens before the interpreter exits.
+
+    Their threads are daemons, so a refresh stuck on the network cannot hold
+    up the exit for longer than this.
+    """
+    with _revalidating_lock:
+        running = list(_revalidating.values())
+    wait(running, timeout=REVALIDATE_EXIT_WAIT_S)
+
 
 def _browser_login(
     profile_config: config.ProfileConfig,
@@ -170,19 +787,158 @@ def _browser_login(
     headless: bool,
     say: Callable[[str], None],
     totp_prompt: Callable[[], str] | None,
+    install_browser: bool,
+    pool: BrowserPool | None,
+    block_resources: bool,
+    typing: TypingMode | None,
+    storage_state: Path | None,
+    transport: Transport | None,
+    secret_cache: SecretCache | None,
+    pipelined: bool,
+    trace: Trace | None,
+    endpoints: Endpoints,
+    deadline: Deadline | None,
 ) -> Token:
     """Run the browser login for a profile, downgrading headless when it cannot work."""
-    # Any field may be a 1Password `op://` reference; expand them here.
-    username = resolve_secret(profile_config.username)
-    password = resolve_secret(profile_config.password)
-    totp = TotpProvider(resolve_secret(profile_config.totp_secret), totp_prompt)
+    typing = typing_mode(typing or profile_config.typing)
+    username, password = profile_config.username, profile_config.password
 
     if headless and not (username and password):
         say("No stored credentials: falling back to a visible browser window.")
         headless = False
 
     say("Opening browser for pixiv login ...")
-    if not is_chromium_installed():
+    if will_install(install_browser=install_browser):
         say("(The first run may take a while to download the headless browser.)")
 
-    return token.exchange(fetch_authorization(username, password, headless=headless, totp=totp))
+    authorization = _authorize(
+        (username, password, profile_config.totp_secret),
+        totp_prompt=totp_prompt,
+        secret_cache=secret_cache,
+        headless=headless,
+        install_browser=install_browser,
+        pool=pool,
+        block_resources=block_resources,
+        typing=typing,
+        storage_state=storage_state,
+        pipelined=pipelined,
+        trace=trace,
+        endpoints=endpoints,
+        deadline=deadline,
+    )
+    if authorization.session_reused:
+        say("Signed in with the saved browser session.")
+    elif username and password:
+        say(f"Filled in the login form in {authorization.form_entry_s:.1f}s ({typing} typing).")
+    if block_resources:
+        say(authorization.traffic.summary())
+    with span(trace, "token exchange"):
+        return token.exchange(authorization, transport=transport, endpoints=endpoints, deadline=deadline)
+
+
+def _authorize(
+    values: tuple[str, str, str],
+    *,
+    totp_prompt: Callable[[], str] | None,
+    secret_cache: SecretCache | None,
+    headless: bool,
+    install_browser: bool,
+    pool: BrowserPool | None,
+    block_resources: bool,
+    typing: TypingMode,
+    storage_state: Path | None,
+    pipelined: bool,
+    trace: Trace | None,
+    endpoints: Endpoints,
+    deadline: Deadline | None,
+) -> Authorization:
+    """Resolve ``(username, password, totp_secret)`` and run the browser login, overlapping the two."""
+
+    def fetch(known: Credentials, pending: Future[Credentials] | None) -> Authorization:
+        return fetch_authorization(
+            known.username,
+            known.password,
+            headless=headless,
+            totp=known.totp,
+            install_browser=install_browser,
+            pool=pool,
+            block_resources=block_resources,
+            typing=typing,
+            storage_state=storage_state,
+            credentials=pending,
+            pipelined=pipelined,
+            trace=trace,
+            endpoints=endpoints,
+            deadline=deadline,
+        )
+
+    if not pipelined or pool is not None:  # a pool's browsers belong to this thread
+        return fetch(*_credentials(values, totp_prompt=totp_prompt, secret_cache=secret_cache, trace=trace))
+
+    # The browser starts first, on its own thread, and waits for the
+    # credentials only once the form is on screen.
+    pending: Future[Credentials] = Future()
+    browser = _in_thread(lambda: fetch(Credentials(), pending), name="gppt-browser")
+    try:
+        pending.set_result(_resolve(values, totp_prompt=totp_prompt, secret_cache=secret_cache, trace=trace))
+    except BaseException as exc:
+        pending.set_exception(exc)  # the browser gives up at the form
+        raise
+    try:
+        return browser.result(timeout=wait_s(deadline, "the browser login"))
+    except FutureTimeoutError as exc:
+        # Left running on its daemon thread; the deadline is up either way.
+        msg = "Ran out of the deadline waiting for the browser login."
+        raise DeadlineExceededError(msg) from exc
+
+
+def _credentials(
+    values: tuple[str, str, str],
+    *,
+    totp_prompt: Callable[[], str] | None,
+    secret_cache: SecretCache | None,
+    trace: Trace | None,
+) -> tuple[Credentials, Future[Credentials] | None]:
+    """Split the credentials into those known now and those still being resolved.
+
+    Plain values are ready at once, so a malformed TOTP secret fails before
+    the browser starts. op:// references are resolved on a worker thread
+    instead: ``op`` takes hundreds of milliseconds, and the browser launch does
+    not need the credentials until the form is on screen.
+    """
+
+    def resolve() -> Credentials:
+        return _resolve(values, totp_prompt=totp_prompt, secret_cache=secret_cache, trace=trace)
+
+    if not any(map(is_op_reference, values)):
+        return resolve(), None
+    return Credentials(), _in_thread(resolve, name="gppt-secrets")
+
+
+def _resolve(
+    values: tuple[str, str, str],
+    *,
+    totp_prompt: Callable[[], str] | None,
+    secret_cache: SecretCache | None,
+    trace: Trace | None,
+) -> Credentials:
+    with span(trace, "secrets"):
+        return resolve_credentials(values, totp_prompt=totp_prompt, secret_cache=secret_cache)
+
+
+def _in_thread(work: Callable[[], T], *, name: str) -> Future[T]:
+    """Run ``work`` on a daemon thread, which an interrupted caller need not wait for."""
+    future: Future[T] = Future()
+
+    def run() -> None:
+        try:
+            future.set_result(work())
+        except BaseException as exc:  # noqa: BLE001 -- handed to whoever waits on the future
+            future.set_exception(exc)
+
+    threading.Thread(target=run, name=name, daemon=True).start()
+    return future
+
+
+def _silent(_: str) -> None:
+    """Swallow progress messages."""
@@ -11,53 +11,131 @@ Based on:
 
 from __future__ import annotations
 
+import importlib.metadata
+import json
+import os
 import re
 import sys
 from base64 import urlsafe_b64encode
-from dataclasses import dataclass
+from concurrent.futures import TimeoutError as FutureTimeoutError  # not the builtin one before 3.11
+from contextlib import ExitStack, contextmanager
+from dataclasses import dataclass, field
 from hashlib import sha256
 from pathlib import Path
 from random import uniform
 from secrets import token_urlsafe
-from typing import TYPE_CHECKING, Final
-from urllib.parse import urlencode
+from time import perf_counter
+from typing import TYPE_CHECKING, Any, Final, Literal, TypeVar
+from urllib.parse import urlencode, urlsplit
 from urllib.request import getproxies
 
-import pyotp
-from install_playwright import install
-from playwright.sync_api import Error as PWError
-from playwright.sync_api import TimeoutError as PWTimeoutError
-from playwright.sync_api import sync_playwright
-
-from gppt.consts import LOGIN_URL, REDIRECT_URI, USER_AGENT
+from gppt import config
+from gppt.consts import USER_AGENT
+from gppt.deadline import DeadlineExceededError, cap_ms, wait_s
+from gppt.endpoints import PIXIV, Endpoints
+from gppt.timing import span
 
+# Playwright, its installer and pyotp are imported where they are used, not
+# here: `import gppt` and the refresh-only paths never need a browser, and the
+# Playwright import alone costs more than the rest of gppt put together.
 if TYPE_CHECKING:
-    from collections.abc import Callable
-
-    from playwright.sync_api import Locator, Page, ProxySettings, Request
+    from collections.abc import Callable, Generator
+    from concurrent.futures import Future
+
+    import pyotp
+    from playwright.async_api import BrowserType as AsyncBrowserType
+    from playwright.sync_api import (
+        Browser,
+        BrowserContext,
+        BrowserType,
+        Locator,
+        Page,
+        ProxySettings,
+        Request,
+        Response,
+        Route,
+        StorageState,
+    )
+
+    from gppt.deadline import Deadline
+    from gppt.pool import BrowserPool
+    from gppt.timing import Trace
 
 PROXIES: Final = getproxies()
 
+# Playwright's ``chromium`` from either API: the installer accepts a list of one kind.
+_BrowserTypeT = TypeVar("_BrowserTypeT", "BrowserType", "AsyncBrowserType")
+
+# Set (to anything) where the browser is provisioned out of band, e.g. a
+# container image with Chromium baked in, to never run the installer.
+SKIP_INSTALL_ENV: Final = "GPPT_SKIP_BROWSER_INSTALL"
+# How Playwright says a browser is missing, e.g. after its cache was wiped.
+MISSING_EXECUTABLE: Final = "Executable doesn't exist"
+
+LAUNCH_TIMEOUT_MS: Final = 30_000  # start Chromium (Playwright's default)
+NAVIGATION_TIMEOUT_MS: Final = 30_000  # open the login page (Playwright's default)
 FORM_TIMEOUT_MS: Final = 20_000  # wait for the login form to render
 REDIRECT_TIMEOUT_MS: Final = 60_000  # wait for the redirect after a filled-in form
 MANUAL_TIMEOUT_MS: Final = 300_000  # ditto, but a human is typing (and maybe solving a captcha)
 SETTLE_MS: Final = 1_000  # let the deep-link request fire after the redirect
 TOTP_TIMEOUT_MS: Final = 15_000  # how long to wait before concluding 2FA was not asked for
-POLL_INTERVAL_MS: Final = 200  # step size when polling for a selector
 
-# Human-like randomised waits (seconds) between keystrokes, to avoid an
-# obviously robotic input cadence.
-TYPE_DELAY_S: Final = (0.3, 0.7)
+# How the credentials are entered: "human" types one key at a time with
+# human-like randomised pauses, to avoid an obviously robotic input cadence;
+# "fast" keeps the per-key jitter at a fraction of the pause; "instant" fills
+# each field in one go.
+TypingMode = Literal["instant", "fast", "human"]
+TYPING_MODES: Final[tuple[TypingMode, ...]] = ("instant", "fast", "human")
+DEFAULT_TYPING: Final[TypingMode] = "human"
+TYPE_DELAY_S: Final = (0.3, 0.7)  # seconds between keystrokes, "human"
+FAST_TYPE_DELAY_S: Final = (0.02, 0.06)  # ditto, "fast"
 
 USERNAME_SELECTOR: Final = "input[autocomplete^='username']"
 PASSWORD_SELECTOR: Final = "input[autocomplete^='current-password']"  # noqa: S105
 # Shown only when the account has two-factor authentication enabled.
 TOTP_SELECTOR: Final = "input[autocomplete='one-time-code']"
+# Evaluated in the page on every animation frame (and again after each
+# navigation) until a field matching `selector` is attached or the page has
+# reached the redirect, returning which came first. Both the login form (a
+# saved session skips it) and the 2FA field (most accounts never see it) may
+# never appear.
+FIELD_OR_REDIRECT_JS: Final = """([selector, redirect]) =>
+    location.href.startsWith(redirect) ? "redirect" : document.querySelector(selector) ? "field" : false"""
 
 OTPAUTH_PREFIX: Final = "otpauth://"
 
 # The submit button is only identifiable by its label, which is localised.
 SUBMIT_LABELS: Final[list[str]] = ["ログイン", "Log In", "登录", "로그인", "登入"]
+SUBMIT_SELECTOR: Final = "xpath=//button[@type='submit'][{}]".format(
+    " or ".join(f"contains(text(), '{label}')" for label in SUBMIT_LABELS),
+)
+
+# pixiv hands the authorization code to the app through this deep link.
+CALLBACK_SCHEME: Final = "pixiv://"
+
+# How a login that went wrong is reported, by this driver and gppt.aio's alike.
+FORM_MISSING_MSG: Final = "Login form did not appear. Please check connectivity for {login_url}"
+LOGIN_FAILED_MSG: Final = "Failed to login. Please check your credentials or proxy. (Maybe restricted by pixiv?)"
+NO_TOTP_MSG: Final = (
+    "pixiv is asking for a two-factor verification code, but none is available. "
+    "Run `gppt configure` and set a TOTP secret."
+)
+NO_CODE_MSG: Final = "Did not capture an authorization code from the pixiv:// callback."
+
+# With block_resources, requests of these types are aborted: the login form
+# works without them, and each one is otherwise awaited by `networkidle`.
+BLOCKED_RESOURCE_TYPES: Final = frozenset({"image", "media", "font", "stylesheet"})
+# ... and so is anything sent to these analytics / ad hosts (or subdomains).
+BLOCKED_HOSTS: Final = (
+    "google-analytics.com",
+    "googletagmanager.com",
+    "googleadservices.com",
+    "googlesyndication.com",
+    "doubleclick.net",
+    "facebook.net",
+    "scorecardresearch.com",
+    "ads-pixiv.net",
+)
 
 BROWSER_ARGS: Final[list[str]] = [
     "--disable-gpu",
@@ -75,12 +153,136 @@ class LoginError(RuntimeError):
     """Raised when the browser login does not yield an authorization code."""
 
 
+@dataclass
+class TrafficStats:
+    """Network traffic of one browser login."""
+
+    requests: int = 0  # every request the page made, blocked ones included
+    # Requests aborted by block_resources, by Playwright resource type. An
+    # aborted request never says how big it would have been, so this is the
+    # measure of what blocking saved.
+    blocked_by_type: dict[str, int] = field(default_factory=dict)
+    # Response bodies that did come through, as declared by their Content-Length.
+    bytes_received: int = 0
+
+    @property
+    def blocked(self) -> int:
+        """Number of requests aborted by block_resources.
+
+        Returns:
+            int: Blocked requests, of every type.
+        """
+        return sum(self.blocked_by_type.values())
+
+    def summary(self) -> str:
+        """Describe what blocking skipped and what still came through.
+
+        Returns:
+            str: E.g. ``Blocked 12 of 40 requests (8 image, 4 font); 98,765
+                bytes still came through.``
+        """
+        counts = sorted(self.blocked_by_type.items(), key=lambda item: (-item[1], item[0]))
+        by_type = f" ({', '.join(f'{count} {kind}' for kind, count in counts)})" if counts else ""
+        return (
+            f"Blocked {self.blocked} of {self.requests} requests{by_type}; "
+            f"{self.bytes_received:,} bytes still came through."
+        )
+
+
 @dataclass
 class Authorization:
     """An authorization code plus the PKCE verifier it must be exchanged with."""
 
     code: str
     code_verifier: str
+    traffic: TrafficStats = field(default_factory=TrafficStats)
+    form_entry_s: float = 0.0  # time spent typing credentials and the 2FA code
+    session_reused: bool = False  # a saved browser session skipped the login form
+
+
+class LoginState:
+    """What one browser login has seen so far, whichever driver runs it.
+
+    The driver here and the asyncio one in :mod:`gppt.aio` feed it the page's
+    requests and responses and let it decide what to block, so both agree on
+    the login URL, the callback, the traffic and the outcome.
+    """
+
+    def __init__(self, endpoints: Endpoints) -> None:
+        """Start a login with a fresh PKCE pair.
+
+        Args:
+            endpoints (Endpoints): Login page and redirect to expect.
+        """
+        self.endpoints = endpoints
+        self.code_verifier, code_challenge = _oauth_pkce()
+        self.login_url = f"{endpoints.login_url}?{urlencode(_login_params(code_challenge))}"
+        self.captured: dict[str, str] = {}
+        self.traffic = TrafficStats()
+        self.form_entry_s = 0.0
+        self.session_reused = False
+
+    def on_request(self, url: str) -> None:
+        """Count a request the page made, and capture the code if it is the callback.
+
+        Args:
+            url (str): The request's URL.
+        """
+        self.traffic.requests += 1
+        if code := code_from_callback(url):
+            self.captured["code"] = code
+
+    def on_response(self, headers: dict[str, str]) -> None:
+        """Count a response the page received.
+
+        Args:
+            headers (dict[str, str]): Its headers, names in lower case.
+        """
+        self.traffic.bytes_received += _content_length(headers)
+
+    def blocks(self, url: str, resource_type: str) -> bool:
+        """Whether block_resources aborts this request; counted if so.
+
+        Args:
+            url (str): The request's URL.
+            resource_type (str): Playwright's resource type for it.
+
+        Returns:
+            bool: True to abort the request.
+        """
+        if not _should_block(url, resource_type):
+            return False
+        by_type = self.traffic.blocked_by_type
+        by_type[resource_type] = by_type.get(resource_type, 0) + 1
+        return True
+
+    def authorization(self) -> Authorization:
+        """Return what the login yielded.
+
+        Returns:
+            Authorization: The captured code and everything measured on the way.
+
+        Raises:
+            LoginError: If no authorization code was captured.
+        """
+        if "code" not in self.captured:
+            raise LoginError(NO_CODE_MSG)
+        return Authorization(
+            code=self.captured["code"],
+            code_verifier=self.code_verifier,
+            traffic=self.traffic,
+            form_entry_s=self.form_entry_s,
+            session_reused=self.session_reused,
+        )
+
+
+@dataclass(frozen=True)
+class Credentials:
+    """What an unattended login types into pixiv's form."""
+
+    username: str = ""
+    password: str = ""
+    totp: TotpProvider | None = None
 
 
 class TotpProvider:
@@ -127,6 +329,8 @@ class TotpProvider:
 
 def _parse_totp(secret: str) -> pyotp.TOTP:
     """Accept either an ``otpauth://`` URI or a bare base32 secret."""
+    import pyotp  # noqa: PLC0415 -- only needed once a secret is configured
+
     if secret.startswith(OTPAUTH_PREFIX):
         parsed = pyotp.parse_uri(secret)
         if not isinstance(parsed, pyotp.TOTP):
@@ -145,14 +349,194 @@ def _parse_totp(secret: str) -> pyotp.TOTP:
     return totp
 
 
+def typing_mode(value: str) -> TypingMode:
+    """Validate a typing cadence name.
+
+    Args:
+        value (str): One of ``TYPING_MODES``.
+
+    Returns:
+        TypingMode: The same name, typed.
+
+    Raises:
+        ValueError: If ``value`` is not a known cadence.
+    """
+    for mode in TYPING_MODES:
+        if value == mode:
+            return mode
+    msg = f"typing must be one of {', '.join(TYPING_MODES)}; got {value!r}."
+    raise ValueError(msg)
+
+
+def keystroke_pause_ms(typing: TypingMode) -> float:
+    """Return a random pause to leave after one keystroke.
+
+    Args:
+        typing (TypingMode): ``"fast"`` or ``"human"``; ``"instant"`` fills a
+            field at once and never pauses.
+
+    Returns:
+        float: Milliseconds.
+    """
+    low, high = FAST_TYPE_DELAY_S if typing == "fast" else TYPE_DELAY_S
+    return uniform(low, high) * 1000  # noqa: S311 -- a cadence, not a secret
+
+
+def field_shown(outcome: object, captured: dict[str, str]) -> bool:
+    """Whether :data:`FIELD_OR_REDIRECT_JS` found the field, and the login is not already past it.
+
+    Args:
+        outcome (object): What the script returned.
+        captured (dict[str, str]): The login's captured callback, if any.
+
+    Returns:
+        bool: True if the field is waiting to be filled in.
+    """
+    return outcome == "field" and "code" not in captured
+
+
 def is_chromium_installed() -> bool:
-    """Whether the Chromium build Playwright needs is already downloaded locally.
+    """Whether Chromium is already installed for the current Playwright version.
+
+    Answered from a stamp file in the config directory, written once the
+    browser is known to be there, so usually no Playwright driver is started
+    to check. Without the stamp, Playwright is asked whether its Chromium
+    executable exists, so a browser it provisioned itself counts too.
 
     Returns:
-        bool: True if the browser binary is present.
+        bool: True if the browser is present.
     """
+    return _install_stamp_path().exists() or _playwright_has_chromium()
+
+
+def _playwright_has_chromium() -> bool:
+    """Start a Playwright driver to ask whether its Chromium executable exists."""
+    from playwright.sync_api import sync_playwright  # noqa: PLC0415 -- see the note on the imports
+
     with sync_playwright() as pw:
-        return Path(pw.chromium.executable_path).exists()
+        return _executable_exists(pw.chromium)
+
+
+def _executable_exists(browser_type: BrowserType | AsyncBrowserType) -> bool:
+    return Path(browser_type.executable_path).exists()
+
+
+def _install_stamp_path() -> Path:
+    """Return ``<config dir>/chromium-<playwright version>.installed``.
+
+    The name carries the Playwright version, since each release pins its own
+    Chromium build: upgrading Playwright runs the installer once more.
+    """
+    try:
+        version = importlib.metadata.version("playwright")
+    except importlib.metadata.PackageNotFoundError:
+        version = "unknown"
+    return config.CONFIG_DIR / f"chromium-{version}.installed"
+
+
+def will_install(*, install_browser: bool) -> bool:
+    """Whether :func:`ensure_chromium` may run the installer.
+
+    Answered from the install stamp alone, so it is safe to ask from inside a
+    running Playwright or event loop; :func:`ensure_chromium` still finds a
+    browser that Playwright provisioned without gppt and installs nothing.
+
+    Args:
+        install_browser (bool): The caller's ``install_browser``.
+
+    Returns:
+        bool: False when installing is disabled, by the argument or by
+            ``GPPT_SKIP_BROWSER_INSTALL``, or already done for this version.
+    """
+    return install_browser and not os.environ.get(SKIP_INSTALL_ENV) and not _install_stamp_path().exists()
+
+
+def ensure_chromium(browser_type: _BrowserTypeT, *, install_browser: bool) -> None:
+    """Run the Playwright installer, unless the browser is already there or installing is disabled.
+
+    A Chromium executable that Playwright already has, from an earlier
+    ``playwright install`` or a prepared image, is only stamped: the
+    installer, and the system packages it asks for, which may need root, are
+    left alone.
+
+    Args:
+        browser_type (BrowserType | AsyncBrowserType): Playwright's ``chromium``.
+        install_browser (bool): False never runs the installer.
+    """
+    if not will_install(install_browser=install_browser):
+        return
+    if _executable_exists(browser_type):
+        _write_install_stamp()
+        return
+
+    from install_playwright import install  # noqa: PLC0415 -- see the note on the imports
+
+    # A failed install is not fatal here: launching then reports what is missing.
+    if install([browser_type], with_deps=True):
+        _write_install_stamp()
+
+
+def _write_install_stamp() -> None:
+    stamp = _install_stamp_path()
+    stamp.parent.mkdir(parents=True, exist_ok=True)
+    stamp.touch()
+
+
+def reinstall_needed(exc: Exception, *, install_browser: bool) -> bool:
+    """Whether a failed launch calls for running the installer once more.
+
+    The install stamp is trusted without asking Playwright, so a browser
+    cache wiped since it was written (a fresh container, a cleaned
+    ``~/.cache``) only shows when the launch fails. The stale stamp is then
+    removed, and the next :func:`ensure_chromium` installs again.
+
+    Args:
+        exc (Exception): What the launch raised.
+        install_browser (bool): The caller's ``install_browser``.
+
+    Returns:
+        bool: True to install and launch again.
+    """
+    stamp = _install_stamp_path()
+    if MISSING_EXECUTABLE not in str(exc) or not stamp.exists():
+        return False
+    stamp.unlink(missing_ok=True)
+    return will_install(install_browser=install_browser)
+
+
+def launch_chromium(
+    browser_type: BrowserType,
+    *,
+    headless: bool,
+    install_browser: bool,
+    deadline: Deadline | None = None,
+) -> Browser:
+    """Launch Chromium, installing it once more if its install stamp was stale.
+
+    Args:
+        browser_type (BrowserType): Playwright's ``chromium``.
+        headless (bool): Run the browser without a visible window.
+        install_browser (bool): False never runs the installer.
+        deadline (Deadline | None): Bounds each launch. The installer cannot
+            be cut short; the deadline is checked again once it is done.
+
+    Returns:
+        Browser: The running browser.
+    """
+    from playwright.sync_api import Error  # noqa: PLC0415 -- see the note on the imports
+
+    try:
+        return _launch(browser_type, headless=headless, deadline=deadline)
+    except Error as exc:
+        if not reinstall_needed(exc, install_browser=install_browser):
+            raise
+    ensure_chromium(browser_type, install_browser=install_browser)
+    return _launch(browser_type, headless=headless, deadline=deadline)
+
+
+def _launch(browser_type: BrowserType, *, headless: bool, deadline: Deadline | None) -> Browser:
+    timeout = cap_ms(deadline, LAUNCH_TIMEOUT_MS, "the browser launch")
+    return browser_type.launch(headless=headless, args=BROWSER_ARGS, timeout=timeout)
 
 
 def fetch_authorization(
@@ -161,67 +545,310 @@ def fetch_authorization(
     *,
     headless: bool,
     totp: TotpProvider | None = None,
+    install_browser: bool = True,
+    pool: BrowserPool | None = None,
+    block_resources: bool = False,
+    typing: TypingMode = DEFAULT_TYPING,
+    storage_state: Path | None = None,
+    credentials: Future[Credentials] | None = None,
+    pipelined: bool = False,
+    trace: Trace | None = None,
+    endpoints: Endpoints | None = None,
+    deadline: Deadline | None = None,
 ) -> Authorization:
     """Run the browser login and return the captured authorization code.
 
     When ``username`` and ``password`` are both set the login form is filled in
     automatically, including the two-factor verification code if pixiv asks for
-    one; otherwise the browser is left open for a manual login.
+    one; otherwise the browser is left open for a manual login. A browser
+    session restored from ``storage_state`` that pixiv still accepts skips the
+    form altogether.
 
     Args:
         username (str): pixiv ID / e-mail address, or an empty string.
         password (str): pixiv password, or an empty string.
         headless (bool): Run the browser without a visible window.
         totp (TotpProvider | None): Source of two-factor verification codes.
+        install_browser (bool): Install Chromium on the first run. The
+            installer runs once per Playwright version; False (or setting
+            ``GPPT_SKIP_BROWSER_INSTALL``) never runs it.
+        pool (BrowserPool | None): Warm browsers to borrow a fresh context
+            from, instead of launching Chromium for this login alone. Ignored
+            when the pool's headless mode differs from ``headless``.
+        block_resources (bool): Abort image, media, font and stylesheet
+            requests, and those to known analytics hosts, so the login waits
+            on fewer downloads. Meant for unattended logins: a human typing
+            into the window would see an unstyled page.
+        typing (TypingMode): How the credentials are entered: ``"human"``
+            key by key with human-like pauses, ``"fast"`` key by key with
+            short pauses, or ``"instant"`` a whole field at once.
+        storage_state (Path | None): File holding the browser session
+            (cookies and localStorage). Restored from when it exists, and
+            rewritten (mode 0600) after a successful login. None starts from,
+            and leaves behind, nothing.
+        credentials (Future[Credentials] | None): Credentials still being
+            resolved (from 1Password, say) while the browser starts. Waited
+            for only once the form is on screen, and then used in place of
+            ``username``, ``password`` and ``totp``.
+        pipelined (bool): Look for the form as soon as the login page starts
+            arriving, instead of after it (with every image, font and
+            analytics script) has finished loading.
+        trace (Trace | None): Record how long each phase of the login took.
+        endpoints (Endpoints | None): Login page and redirect to expect.
+            None means pixiv's, unless the environment says otherwise.
+        deadline (Deadline | None): Wait in each phase -- launch, page load,
+            form, 2FA, redirect -- at most what is left of it.
 
     Returns:
-        Authorization: The captured code and its PKCE verifier.
+        Authorization: The captured code, its PKCE verifier, the login's
+            network traffic, the time spent filling in the form and whether
+            a saved session skipped it.
 
     Raises:
         LoginError: If the login form never appears, the login fails, 2FA is
             required but unavailable, or no authorization code is captured.
+        DeadlineExceededError: If ``deadline`` passes first.
     """
-    code_verifier, code_challenge = _oauth_pkce()
-    captured: dict[str, str] = {}
+    state = LoginState(endpoints or Endpoints.from_env())
+    captured = state.captured
+
+    with (
+        _out_of_time(deadline),
+        _browser_context(
+            headless=headless,
+            install_browser=install_browser,
+            pool=pool,
+            storage_state=storage_state,
+            trace=trace,
+            deadline=deadline,
+        ) as context,
+    ):
+        if block_resources:
+            _block_resources(context, state)
 
-    with sync_playwright() as pw:
-        # Ensure the Chromium browser is present (installs on first run).
-        install([pw.chromium], with_deps=True)
-        browser = pw.chromium.launch(headless=headless, args=BROWSER_ARGS)
-        proxy = _proxy_settings()
-        context = browser.new_context(proxy=proxy) if proxy else browser.new_context()
         page = context.new_page()
+        _bound_page(page, deadline)
 
         def on_request(request: Request) -> None:
-            if not request.url.startswith("pixiv://"):
-                return
-            if match := re.search(r"code=([^&]*)", request.url):
-                captured["code"] = match.group(1)
+            state.on_request(request.url)
 
-        page.on("request", on_request)
+        def on_response(response: Response) -> None:
+            state.on_response(response.headers)
 
-        try:
-            page.goto(f"{LOGIN_URL}?{urlencode(_login_params(code_challenge))}")
-            _wait_for_form(page)
+        page.on("request", on_request)
+        page.on("response", on_response)
+
+        with span(trace, "page load"):
+            # "commit" returns as soon as the response starts; the form wait below does the rest.
+            wait_until = "commit" if pipelined else "load"
+            page.goto(
+                state.login_url,
+                wait_until=wait_until,
+                timeout=cap_ms(deadline, NAVIGATION_TIMEOUT_MS, "the login page"),
+            )
+        timeout_ms = REDIRECT_TIMEOUT_MS
+        with span(trace, "form wait"):
+            form_shown = _wait_for_form(page, captured, endpoints=state.endpoints, deadline=deadline)
+        if not form_shown:
+            state.session_reused = True  # the saved session went straight to the callback
+        else:
+            if credentials is not None:
+                with span(trace, "credentials wait"):
+                    resolved = _await_credentials(credentials, deadline)
+                username, password, totp = resolved.username, resolved.password, resolved.totp
             if username and password:
-                _fill_login_form(page, username, password)
-                _submit(page)
-                _handle_totp(page, totp, captured)
-                timeout_ms = REDIRECT_TIMEOUT_MS
+                state.form_entry_s = _enter_credentials(
+                    page,
+                    username,
+                    password,
+                    totp=totp,
+                    captured=captured,
+                    typing=typing,
+                    trace=trace,
+                    endpoints=state.endpoints,
+                    deadline=deadline,
+                )
             else:
                 print("Waiting for manual login in the browser window ...", file=sys.stderr)  # noqa: T201
                 timeout_ms = MANUAL_TIMEOUT_MS
-            _wait_for_redirect(page, timeout_ms)
-            page.wait_for_timeout(SETTLE_MS)
+        with span(trace, "redirect wait"):
+            _wait_for_callback(page, captured, timeout_ms, endpoints=state.endpoints, deadline=deadline)
+        if storage_state is not None and "code" in captured:
+            write_storage_state(storage_state, context.storage_state())
+
+    return state.authorization()
+
+
+def _bound_page(page: Page, deadline: Deadline | None) -> None:
+    """Keep typing and clicking, which wait on the page too, within ``deadline``."""
+    if deadline is not None:
+        page.set_default_timeout(cap_ms(deadline, NAVIGATION_TIMEOUT_MS, "the login page"))
+
+
+def _await_credentials(credentials: Future[Credentials], deadline: Deadline | None) -> Credentials:
+    """Wait for credentials still being resolved, within ``deadline``."""
+    if deadline is None:
+        return credentials.result()
+    return credentials.result(timeout=wait_s(deadline, "the credentials"))
+
+
+@contextmanager
+def _out_of_time(deadline: Deadline | None) -> Generator[None]:
+    """Report a login that failed because ``deadline`` passed as exactly that, not as a login failure."""
+    try:
+        yield
+    except (LoginError, FutureTimeoutError, *_playwright_errors()) as exc:
+        if deadline is None or not deadline.expired:
+            raise
+        msg = f"Ran out of the {deadline.budget.total_seconds():g}s deadline during the browser login ({exc})."
+        raise DeadlineExceededError(msg) from exc
+
+
+@contextmanager
+def _browser_context(
+    *,
+    headless: bool,
+    install_browser: bool,
+    pool: BrowserPool | None,
+    storage_state: Path | None = None,
+    trace: Trace | None = None,
+    deadline: Deadline | None = None,
+) -> Generator[BrowserContext]:
+    """Yield a fresh browser context: borrowed from ``pool``, or from a one-off browser."""
+    if deadline is not None:
+        deadline.check("the browser launch")
+    if pool is not None and pool.headless == headless:
+        with ExitStack() as borrowed:
+            with span(trace, "context"):
+                context = borrowed.enter_context(pool.context(storage_state=storage_state, deadline=deadline))
+            yield context
+        return
+
+    with span(trace, "driver start"):
+        if deadline is not None:
+            deadline.check("the browser driver start")
+        from playwright.sync_api import sync_playwright  # noqa: PLC0415 -- see the note on the imports
+
+        stack = ExitStack()
+        pw = stack.enter_context(sync_playwright())
+    with stack:
+        with span(trace, "install check"):
+            # Ensure the Chromium browser is present (installs on first run).
+            # The installer cannot be cut short: the deadline is checked
+            # before it, and the launch after it gets only what is left.
+            if deadline is not None:
+                deadline.check("the browser install check")
+            ensure_chromium(pw.chromium, install_browser=install_browser)
+        with span(trace, "launch"):
+            browser = launch_chromium(
+                pw.chromium,
+                headless=headless,
+                install_browser=install_browser,
+                deadline=deadline,
+            )
+        with span(trace, "context"):
+            context = browser.new_context(**context_options(storage_state))
+        try:
+            yield context
         finally:
             context.close()
             browser.close()
 
-    if "code" not in captured:
-        msg = "Did not capture an authorization code from the pixiv:// callback."
-        raise LoginError(msg)
 
-    return Authorization(code=captured["code"], code_verifier=code_verifier)
+def context_options(storage_state: Path | None) -> dict[str, Any]:
+    """Return the ``new_context`` options: the proxy, and the saved session if there is one.
+
+    Args:
+        storage_state (Path | None): Saved browser session, used if the file exists.
+
+    Returns:
+        dict[str, Any]: Keyword arguments for ``Browser.new_context``.
+    """
+    options: dict[str, Any] = {}
+    if proxy := _proxy_settings():
+        options["proxy"] = proxy
+    if storage_state is not None and storage_state.exists():
+        options["storage_state"] = storage_state
+    return options
+
+
+def write_storage_state(path: Path, state: StorageState) -> None:
+    """Write a context's cookies and localStorage to ``path``, readable by the owner only.
+
+    Args:
+        path (Path): Where to keep the session.
+        state (StorageState): What ``BrowserContext.storage_state()`` returned.
+    """
+    # Session cookies log in as the account, just like the tokens.
+    config.write_private_file(path, json.dumps(state))
+
+
+def _block_resources(context: BrowserContext, state: LoginState) -> None:
+    """Abort, and count, every request of the context that :func:`_should_block` rejects."""
+
+    def on_route(route: Route) -> None:
+        if state.blocks(route.request.url, route.request.resource_type):
+            route.abort()
+        else:
+            route.continue_()
+
+    context.route("**/*", on_route)
+
+
+def _should_block(url: str, resource_type: str) -> bool:
+    """Whether block_resources aborts this request. The deep link always goes through."""
+    if url.startswith(CALLBACK_SCHEME):
+        return False
+    if resource_type in BLOCKED_RESOURCE_TYPES:
+        return True
+    host = urlsplit(url).hostname or ""
+    return any(host == blocked or host.endswith(f".{blocked}") for blocked in BLOCKED_HOSTS)
+
+
+def _content_length(headers: dict[str, str]) -> int:
+    try:
+        return int(headers.get("content-length", 0))
+    except ValueError:
+        return 0
+
+
+def code_from_callback(url: str) -> str | None:
+    """Return the authorization code if ``url`` is the ``pixiv://`` callback.
+
+    Args:
+        url (str): A request's URL.
+
+    Returns:
+        str | None: The code, or None for any other request.
+    """
+    if not url.startswith(CALLBACK_SCHEME):
+        return None
+    match = re.search(r"code=([^&]*)", url)
+    return match.group(1) if match else None
+
+
+def ends_callback_wait(url: str, endpoints: Endpoints = PIXIV) -> bool:
+    """Whether a request ends the wait for the callback: the callback itself, or the redirect page before it.
+
+    Args:
+        url (str): A request's URL.
+        endpoints (Endpoints): Where the redirect page is.
+
+    Returns:
+        bool: True for either request.
+    """
+    return code_from_callback(url) is not None or url.startswith(endpoints.redirect_uri)
+
+
+def _playwright_errors() -> tuple[type[Exception], ...]:
+    """Return Playwright's exception types, for an ``except`` clause.
+
+    An ``except`` expression is only evaluated once an exception is in flight,
+    and by then Playwright is already loaded -- so this costs nothing upfront.
+    """
+    from playwright.sync_api import Error, TimeoutError  # noqa: A004, PLC0415
+
+    return (TimeoutError, Error)
 
 
 def _login_params(code_challenge: str) -> dict[str, str]:
@@ -247,78 +874,173 @@ def _oauth_pkce() -> tuple[str, str]:
     return code_verifier, digest.decode("ascii")
 
 
-def _wait_for_form(page: Page) -> None:
+def _wait_for_form(
+    page: Page,
+    captured: dict[str, str],
+    *,
+    endpoints: Endpoints = PIXIV,
+    deadline: Deadline | None = None,
+) -> bool:
+    """Wait for the login form; return False if the login redirected past it instead."""
     try:
-        page.wait_for_selector(USERNAME_SELECTOR, timeout=FORM_TIMEOUT_MS)
-    except (PWTimeoutError, PWError) as exc:
-        msg = f"Login form did not appear. Please check connectivity for {LOGIN_URL}"
-        raise LoginError(msg) from exc
-
-
-def _fill_login_form(page: Page, username: str, password: str) -> None:
-    _slow_type(page.locator(USERNAME_SELECTOR), username)
-    _slow_type(page.locator(PASSWORD_SELECTOR), password)
-
-
-def _handle_totp(page: Page, totp: TotpProvider | None, captured: dict[str, str]) -> None:
+        outcome = page.wait_for_function(
+            FIELD_OR_REDIRECT_JS,
+            arg=[USERNAME_SELECTOR, endpoints.redirect_uri],
+            timeout=cap_ms(deadline, FORM_TIMEOUT_MS, "the login form"),
+        ).json_value()
+    except _playwright_errors() as exc:
+        if "code" in captured:
+            return False
+        raise LoginError(FORM_MISSING_MSG.format(login_url=endpoints.login_url)) from exc
+    return field_shown(outcome, captured)
+
+
+def _enter_credentials(
+    page: Page,
+    username: str,
+    password: str,
+    *,
+    totp: TotpProvider | None,
+    captured: dict[str, str],
+    typing: TypingMode,
+    trace: Trace | None = None,
+    endpoints: Endpoints = PIXIV,
+    deadline: Deadline | None = None,
+) -> float:
+    """Fill in and submit the login form, then the 2FA code if asked; return the seconds spent typing."""
+    if deadline is not None:
+        deadline.check("filling in the login form")
+    with span(trace, "form fill"):
+        started = perf_counter()
+        _type(page.locator(USERNAME_SELECTOR), username, typing, deadline=deadline)
+        _type(page.locator(PASSWORD_SELECTOR), password, typing, deadline=deadline)
+        form_entry_s = perf_counter() - started
+        _submit(page)
+    with span(trace, "2FA"):
+        return form_entry_s + _handle_totp(page, totp, captured, typing, endpoints=endpoints, deadline=deadline)
+
+
+def _handle_totp(
+    page: Page,
+    totp: TotpProvider | None,
+    captured: dict[str, str],
+    typing: TypingMode,
+    *,
+    endpoints: Endpoints = PIXIV,
+    deadline: Deadline | None = None,
+) -> float:
     """Fill in the two-factor verification code, if pixiv asks for one.
 
     An account without 2FA never renders the field: the password submit
-    redirects straight through instead. So this polls for either outcome and
-    returns quietly when the login is already on its way, rather than blocking
-    on a field that will never appear.
+    redirects straight through instead. So this waits for whichever comes
+    first -- the field, or the redirect -- in a single round trip to the
+    browser, and returns quietly when the login is already on its way rather
+    than blocking on a field that will never appear.
+
+    Returns the seconds spent typing the code, 0 if none was asked for.
     """
-    totp_input = page.locator(TOTP_SELECTOR)
-
-    waited = 0
-    while waited < TOTP_TIMEOUT_MS:
-        if "code" in captured or page.url.startswith(REDIRECT_URI):
-            return  # logged in without a 2FA challenge
-        if _is_visible(totp_input):
-            break
-        page.wait_for_timeout(POLL_INTERVAL_MS)
-        waited += POLL_INTERVAL_MS
-    else:
-        # No challenge and no redirect yet -- let _wait_for_redirect decide.
-        return
+    if "code" in captured:
+        return 0.0  # logged in without a 2FA challenge
+    try:
+        outcome = page.wait_for_function(
+            FIELD_OR_REDIRECT_JS,
+            arg=[TOTP_SELECTOR, endpoints.redirect_uri],
+            timeout=cap_ms(deadline, TOTP_TIMEOUT_MS, "2FA"),
+        ).json_value()
+    except _playwright_errors():
+        # No challenge and no redirect yet -- let _wait_for_callback decide.
+        return 0.0
+    if not field_shown(outcome, captured):
+        return 0.0
 
     if totp is None:
-        msg = (
-            "pixiv is asking for a two-factor verification code, but none is available. "
-            "Run `gppt configure` and set a TOTP secret."
-        )
-        raise LoginError(msg)
+        raise LoginError(NO_TOTP_MSG)
 
-    _slow_type(totp_input, totp.code())
+    code = totp.code()  # may wait on a human at the prompt; not form entry
+    started = perf_counter()
+    _type(page.locator(TOTP_SELECTOR), code, typing, deadline=deadline)
     _submit(page)
+    return perf_counter() - started
 
 
-def _is_visible(locator: Locator) -> bool:
-    try:
-        return locator.first.is_visible()
-    except (PWTimeoutError, PWError):
-        return False
+def _type(element: Locator, text: str, typing: TypingMode, *, deadline: Deadline | None = None) -> None:
+    """Enter ``text`` into ``element`` at the given cadence, within ``deadline``.
 
-
-def _slow_type(element: Locator, text: str) -> None:
-    """Type ``text`` one character at a time with a random pause per keystroke."""
+    The page's default timeout is re-capped for each field, and a keyed
+    cadence checks the deadline before every key: typing at a human pace
+    can otherwise outlast the budget one short wait at a time.
+    """
+    _bound_page(element.page, deadline)
+    if typing == "instant":
+        element.fill(text)
+        return
     for character in text:
+        if deadline is not None:
+            deadline.check("typing into the login form")
         element.type(character)
-        element.page.wait_for_timeout(uniform(*TYPE_DELAY_S) * 1000)  # noqa: S311
+        element.page.wait_for_timeout(keystroke_pause_ms(typing))
 
 
 def _submit(page: Page) -> None:
-    conditions = " or ".join(f"contains(text(), '{label}')" for label in SUBMIT_LABELS)
-    page.locator(f"xpath=//button[@type='submit'][{conditions}]").press("Enter")
+    page.locator(SUBMIT_SELECTOR).press("Enter")
+
 
+def _wait_for_callback(
+    page: Page,
+    captured: dict[str, str],
+    timeout_ms: int,
+    *,
+    endpoints: Endpoints = PIXIV,
+    deadline: Deadline | None = None,
+) -> None:
+    """Return as soon as the ``pixiv://`` callback request has been captured.
+
+    The code arrives with that request, so there is nothing to gain from
+    waiting for the network to go idle afterwards. The wait watches for the
+    redirect page too, within the same ``timeout_ms``: once it is seen, the
+    callback is waited for only as long as is left. A page already on the
+    redirect -- its callback fired before anything was listening, say -- is
+    left to settle instead, and the code is read from ``captured``.
+    """
+    if "code" in captured:
+        return
+    timeout_ms = cap_ms(deadline, timeout_ms, "the redirect")
+    started = perf_counter()
 
-def _wait_for_redirect(page: Page, timeout_ms: int) -> None:
+    def left_ms() -> int:
+        return max(1, timeout_ms - round((perf_counter() - started) * 1000))
+
+    if page.url.startswith(endpoints.redirect_uri):
+        _wait_for_redirect(page, left_ms(), endpoints=endpoints)
+        if "code" not in captured:
+            page.wait_for_timeout(min(SETTLE_MS, left_ms()))
+        return
+
+    try:
+        request = page.wait_for_event(
+            "request",
+            predicate=lambda request: ends_callback_wait(request.url, endpoints),
+            timeout=timeout_ms,
+        )
+        if code_from_callback(request.url) is None and "code" not in captured:
+            # The redirect page: its deep link is the callback.
+            request = page.wait_for_event(
+                "request",
+                predicate=lambda request: code_from_callback(request.url) is not None,
+                timeout=left_ms(),
+            )
+    except _playwright_errors() as exc:
+        raise LoginError(LOGIN_FAILED_MSG) from exc
+    if code := code_from_callback(request.url):
+        captured.setdefault("code", code)
+
+
+def _wait_for_redirect(page: Page, timeout_ms: int, *, endpoints: Endpoints = PIXIV) -> None:
     try:
         page.wait_for_url(
-            re.compile(f"^{re.escape(REDIRECT_URI)}"),
+            re.compile(f"^{re.escape(endpoints.redirect_uri)}"),
             wait_until="networkidle",
             timeout=timeout_ms,
         )
-    except (PWTimeoutError, PWError) as exc:
-        msg = "Failed to login. Please check your credentials or proxy. (Maybe restricted by pixiv?)"
-        raise LoginError(msg) from exc
+    except _playwright_errors() as exc:
+        raise LoginError(LOGIN_FAILED_MSG) from exc
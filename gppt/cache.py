@@ -0,0 +1,131 @@
+"""Keep cached tokens in memory between calls.
+
+Every :func:`gppt.get_token` reads ``<profile>.token.json`` and parses it
+again, which is most of the work of handing out a token that is still valid.
+A long-running process can keep one :class:`TokenCache` and pass it along::
+
+    cache = TokenCache()
+    ...
+    token = gppt.get_token("work", cache=cache)  # a stat(), no read or parse
+
+An entry is served only while the file on disk is the one it was read from --
+same inode, size and mtime, so a save by another process is picked up on the
+next call -- and is dropped once the token comes within ``EXPIRY_MARGIN`` of
+its expiry, handing that call back to the refresh path.
+"""
+
+from __future__ import annotations
+
+import threading
+from dataclasses import dataclass
+from typing import TYPE_CHECKING
+
+from gppt import config, token
+from gppt.token import EXPIRY_MARGIN, utc_now
+
+if TYPE_CHECKING:
+    from datetime import datetime, timedelta
+    from os import stat_result
+    from pathlib import Path
+
+    from gppt.token import Token
+
+
+@dataclass(frozen=True)
+class _Entry:
+    token: Token
+    stamp: tuple[int, int, int]  # (inode, size, mtime) of the file it was read from
+    evict_at: datetime
+
+
+class TokenCache:
+    """Process-wide, thread-safe memory of each profile's cached token."""
+
+    def __init__(self, *, margin: timedelta = EXPIRY_MARGIN) -> None:
+        """Start empty.
+
+        Args:
+            margin (timedelta): Forget a token this long before it expires.
+        """
+        self.margin = margin
+        self._entries: dict[Path, _Entry] = {}
+        self._lock = threading.Lock()
+
+    def load(self, profile: str) -> Token | None:
+        """Return the profile's cached token, from memory if the file is unchanged.
+
+        A drop-in for :func:`gppt.token.load`.
+
+        Args:
+            profile (str): Profile name.
+
+        Returns:
+            Token | None: The cached token, or None if absent or unreadable.
+        """
+        path = config.token_path(profile)
+        try:
+            stamp = _stamp(path.stat())
+        except FileNotFoundError:
+            self._forget(path)
+            return None
+
+        with self._lock:
+            entry = self._entries.get(path)
+        if entry is not None and entry.stamp == stamp and utc_now() < entry.evict_at:
+            return entry.token
+
+        loaded = token.load(profile)
+        if loaded is None:
+            self._forget(path)
+        else:
+            self._remember(path, loaded, stamp)
+        return loaded
+
+    def save(self, profile: str, issued: Token, *, fsync: bool = False) -> Path:
+        """Write the profile's token cache and remember what was written.
+
+        A drop-in for :func:`gppt.token.save`.
+
+        Args:
+            profile (str): Profile name.
+            issued (Token): Token to store.
+            fsync (bool): Flush the cache to disk before returning.
+
+        Returns:
+            Path: Path the token was written to.
+        """
+        path = token.save(profile, issued, fsync=fsync)
+        self._remember(path, issued, _stamp(path.stat()))
+        return path
+
+    def clear(self) -> None:
+        """Forget every token."""
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self) -> int:
+        """Return the number of remembered tokens.
+
+        Returns:
+            int: Remembered tokens.
+        """
+        with self._lock:
+            return len(self._entries)
+
+    def _remember(self, path: Path, issued: Token, stamp: tuple[int, int, int]) -> None:
+        expires_at = issued.expiry
+        if expires_at is None:
+            self._forget(path)
+            return
+        with self._lock:
+            self._entries[path] = _Entry(issued, stamp, expires_at - self.margin)
+
+    def _forget(self, path: Path) -> None:
+        with self._lock:
+            self._entries.pop(path, None)
+
+
+def _stamp(stat: stat_result) -> tuple[int, int, int]:
+    # Saves replace the file, so a new inode alone tells writes apart even
+    # where mtime is coarse.
+    return (stat.st_ino, stat.st_size, stat.st_mtime_ns)
@@ -1,17 +1,24 @@
-"""Command-line interface: ``gppt configure`` and ``gppt login``."""
+"""Command-line interface: ``gppt configure``, ``login``, ``refresh-all``, ``daemon`` and ``serve``."""
 
 from __future__ import annotations
 
 import argparse
 import getpass
 import json
+import signal
 import sys
+from dataclasses import replace
+from datetime import timedelta
 from typing import TYPE_CHECKING
 
 from gppt import __version__, api, config, token
-from gppt.browser import LoginError
+from gppt.browser import TYPING_MODES, LoginError
+from gppt.scheduler import DEFAULT_JITTER, RefreshScheduler
+from gppt.server import DEFAULT_HOST, DEFAULT_PORT, TokenServer
+from gppt.timing import Trace
 
 if TYPE_CHECKING:
+    from gppt.api import RefreshResult
     from gppt.token import Token
 
 
@@ -48,6 +55,21 @@ def main(argv: list[str] | None = None) -> int:
         action="store_false",
         help="Show the browser window. The default is a headless run.",
     )
+    login.add_argument(
+        "--block-resources",
+        action="store_true",
+        help="Skip images, fonts, stylesheets and analytics during an unattended browser login.",
+    )
+    login.add_argument(
+        "--typing",
+        choices=TYPING_MODES,
+        help="How to enter the credentials (default: the profile's setting, else human).",
+    )
+    login.add_argument(
+        "--keep-session",
+        action=argparse.BooleanOptionalAction,
+        help="Save the browser session for the next login to reuse (default: the profile's setting, else off).",
+    )
     login.add_argument(
         "-f",
         "--force",
@@ -60,12 +82,112 @@ def main(argv: list[str] | None = None) -> int:
         action="store_true",
         help="Print the token as JSON.",
     )
+    login.add_argument(
+        "--timings",
+        action="store_true",
+        help="Print how long each phase of the login took to stderr.",
+    )
     login.set_defaults(func=cmd_login)
 
+    refresh_all = sub.add_parser(
+        "refresh-all",
+        help="Refresh every cached token that is about to expire.",
+    )
+    refresh_all.add_argument(
+        "profiles",
+        nargs="*",
+        metavar="PROFILE",
+        help="Profiles to refresh (default: every profile with a cached token).",
+    )
+    refresh_all.add_argument(
+        "-w",
+        "--workers",
+        type=_positive_int,
+        default=api.DEFAULT_WORKERS,
+        help=f"Refreshes to run at once (default: {api.DEFAULT_WORKERS}).",
+    )
+    refresh_all.add_argument(
+        "--lead",
+        type=_positive_int,
+        default=int(api.REFRESH_LEAD.total_seconds()),
+        metavar="SECONDS",
+        help="Refresh tokens expiring within this many seconds (default: %(default)s).",
+    )
+    refresh_all.set_defaults(func=cmd_refresh_all)
+
+    daemon = sub.add_parser(
+        "daemon",
+        help="Keep cached tokens refreshed ahead of their expiry, until stopped.",
+    )
+    daemon.add_argument(
+        "profiles",
+        nargs="*",
+        metavar="PROFILE",
+        help="Profiles to keep fresh (default: every profile with a cached token).",
+    )
+    daemon.add_argument(
+        "-w",
+        "--workers",
+        type=_positive_int,
+        default=api.DEFAULT_WORKERS,
+        help=f"Refreshes to run at once (default: {api.DEFAULT_WORKERS}).",
+    )
+    daemon.add_argument(
+        "--lead",
+        type=_positive_int,
+        default=int(api.REFRESH_LEAD.total_seconds()),
+        metavar="SECONDS",
+        help="Refresh each token this many seconds before it expires (default: %(default)s).",
+    )
+    daemon.add_argument(
+        "--jitter",
+        type=_non_negative_int,
+        default=int(DEFAULT_JITTER.total_seconds()),
+        metavar="SECONDS",
+        help="Refresh up to this many seconds earlier still, at random (default: %(default)s).",
+    )
+    daemon.set_defaults(func=cmd_daemon)
+
+    serve = sub.add_parser(
+        "serve",
+        help="Answer GET /token/<profile> for local processes, keeping the tokens fresh.",
+    )
+    where = serve.add_mutually_exclusive_group()
+    where.add_argument(
+        "--socket",
+        metavar="PATH",
+        help="Unix socket to listen on, readable by this user only (default: <config dir>/serve.sock).",
+    )
+    where.add_argument(
+        "--port",
+        type=int,
+        help=f"Listen on this TCP port instead, which any local user can reach (e.g. {DEFAULT_PORT}).",
+    )
+    serve.add_argument(
+        "--host",
+        default=DEFAULT_HOST,
+        help=f"Address to listen on with --port (default: {DEFAULT_HOST}).",
+    )
+    serve.add_argument(
+        "-w",
+        "--workers",
+        type=_positive_int,
+        default=api.DEFAULT_WORKERS,
+        help=f"Background refreshes to run at once (default: {api.DEFAULT_WORKERS}).",
+    )
+    serve.add_argument(
+        "--lead",
+        type=_positive_int,
+        default=int(api.REFRESH_LEAD.total_seconds()),
+        metavar="SECONDS",
+        help="Refresh each token this many seconds before it expires (default: %(default)s).",
+    )
+    serve.set_defaults(func=cmd_serve)
+
     args = parser.parse_args(argv)
     try:
         exit_code: int = args.func(args)
-    except (LoginError, token.TokenError, FileNotFoundError, ValueError) as exc:
+    except (LoginError, token.TokenError, OSError, ValueError) as exc:
         print(f"error: {exc}", file=sys.stderr)
         return 1
     except (KeyboardInterrupt, EOFError):
@@ -83,6 +205,22 @@ def _add_profile_argument(parser: argparse.ArgumentParser) -> None:
     )
 
 
+def _positive_int(value: str) -> int:
+    number = int(value)
+    if number < 1:
+        msg = f"must be at least 1, got {number}"
+        raise argparse.ArgumentTypeError(msg)
+    return number
+
+
+def _non_negative_int(value: str) -> int:
+    number = int(value)
+    if number < 0:
+        msg = f"must not be negative, got {number}"
+        raise argparse.ArgumentTypeError(msg)
+    return number
+
+
 def _prompt(text: str, default: str = "") -> str:
     suffix = f" [{default}]" if default else ""
     return input(f"{text}{suffix}: ").strip() or default
@@ -118,9 +256,10 @@ def cmd_configure(args: argparse.Namespace) -> int:
         or existing.totp_secret
     )
 
+    # replace() keeps the settings edited by hand in the JSON file.
     path = config.save(
         args.profile,
-        config.ProfileConfig(username=username, password=password, totp_secret=totp_secret),
+        replace(existing, username=username, password=password, totp_secret=totp_secret),
     )
     print(f"\nSaved: {path}")
     return 0
@@ -138,13 +277,23 @@ def cmd_login(args: argparse.Namespace) -> int:
     Returns:
         int: Process exit code.
     """
-    issued = api.get_token(
-        args.profile,
-        headless=args.headless,
-        force=args.force,
-        notify=_to_stderr,
-        totp_prompt=_prompt_totp,
-    )
+    trace = Trace() if args.timings else None
+    try:
+        issued = api.get_token(
+            args.profile,
+            headless=args.headless,
+            force=args.force,
+            block_resources=args.block_resources,
+            typing=args.typing,
+            keep_session=args.keep_session,
+            notify=_to_stderr,
+            totp_prompt=_prompt_totp,
+            trace=trace,
+        )
+    finally:
+        if trace is not None:
+            # Also after a failed login: that is when the timings matter most.
+            print(f"Timings:\n{trace.report()}", file=sys.stderr)
 
     path = config.token_path(args.profile)
     _print_token(issued, as_json=args.json)
@@ -155,6 +304,101 @@ def cmd_login(args: argparse.Namespace) -> int:
     return 0
 
 
+def cmd_refresh_all(args: argparse.Namespace) -> int:
+    """Refresh the cached tokens of many profiles at once.
+
+    Never opens a browser: a profile whose token cannot be refreshed is
+    reported, and needs a ``gppt login`` of its own.
+
+    Args:
+        args (argparse.Namespace): Parsed ``refresh-all`` arguments.
+
+    Returns:
+        int: Process exit code -- 1 if any profile failed.
+    """
+    results = api.refresh_many(
+        args.profiles or None,
+        lead=timedelta(seconds=args.lead),
+        max_workers=args.workers,
+    )
+    if not results:
+        print(f"No cached tokens under {config.CONFIG_DIR}.", file=sys.stderr)
+        return 0
+
+    width = max(len(result.profile) for result in results)
+    for result in results:
+        detail = result.error if result.token is None else f"expires at {result.token.expires_at}"
+        print(f"{result.profile:<{width}}  {result.status:<9}  {detail}")
+
+    failed = sum(result.status == "failed" for result in results)
+    print(f"{len(results)} profiles: {len(results) - failed} ok, {failed} failed", file=sys.stderr)
+    return 1 if failed else 0
+
+
+def cmd_daemon(args: argparse.Namespace) -> int:
+    """Refresh cached tokens ahead of their expiry until interrupted or terminated.
+
+    Never opens a browser: a failed refresh is reported and retried later.
+
+    Args:
+        args (argparse.Namespace): Parsed ``daemon`` arguments.
+
+    Returns:
+        int: Process exit code.
+    """
+    if not args.profiles and not config.cached_profiles():
+        print(f"No cached tokens under {config.CONFIG_DIR}.", file=sys.stderr)
+        return 0
+
+    scheduler = RefreshScheduler(
+        args.profiles or None,
+        lead=timedelta(seconds=args.lead),
+        jitter=timedelta(seconds=args.jitter),
+        max_workers=args.workers,
+        on_result=_print_refresh,
+    )
+    previous = signal.signal(signal.SIGTERM, lambda *_: scheduler.stop())
+    print("Keeping tokens fresh; press Ctrl-C to stop.", file=sys.stderr)
+    try:
+        scheduler.run()
+    finally:
+        signal.signal(signal.SIGTERM, previous)
+    return 0
+
+
+def cmd_serve(args: argparse.Namespace) -> int:
+    """Serve cached tokens to local processes until interrupted or terminated.
+
+    Args:
+        args (argparse.Namespace): Parsed ``serve`` arguments.
+
+    Returns:
+        int: Process exit code.
+    """
+    server = TokenServer(
+        (args.host, args.port) if args.port is not None else args.socket,
+        lead=timedelta(seconds=args.lead),
+        max_workers=args.workers,
+    )
+    address = server.address
+    where = address if isinstance(address, str) else f"http://{address[0]}:{address[1]}"
+    previous = signal.signal(signal.SIGTERM, lambda *_: server.stop())
+    print(f"Serving tokens on {where}; press Ctrl-C to stop.", file=sys.stderr)
+    try:
+        server.run()
+    finally:
+        signal.signal(signal.SIGTERM, previous)
+    return 0
+
+
+def _print_refresh(result: RefreshResult) -> None:
+    """Report what the daemon did; a token that was still valid is not news."""
+    if result.status == "refreshed" and result.token is not None:
+        print(f"{result.profile}  refreshed  expires at {result.token.expires_at}", flush=True)
+    elif result.status == "failed":
+        print(f"{result.profile}  failed  {result.error}", flush=True)
+
+
 def _to_stderr(message: str) -> None:
     print(message, file=sys.stderr)
 
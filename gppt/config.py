@@ -4,9 +4,14 @@ from __future__ import annotations
 
 import json
 import os
-from dataclasses import asdict, dataclass
+import tempfile
+from contextlib import suppress
+from dataclasses import asdict, dataclass, field
 from pathlib import Path
-from typing import Any
+from typing import TYPE_CHECKING, Any
+
+if TYPE_CHECKING:
+    from gppt.browser import TypingMode
 
 CONFIG_DIR = Path(
     os.environ.get("GPPT_CONFIG_DIR") or (Path(os.environ.get("XDG_CONFIG_HOME", Path.home() / ".config")) / "gppt"),
@@ -30,6 +35,16 @@ class ProfileConfig:
     # Base32 secret or otpauth:// URI, for accounts with two-factor
     # authentication enabled. Empty means "ask when pixiv asks".
     totp_secret: str = ""
+    # How an unattended login enters the credentials: "human" (key by key,
+    # with human-like pauses), "fast" (key by key, short pauses) or
+    # "instant" (a whole field at once).
+    typing: TypingMode = "human"
+    # Keep the browser session (cookies, localStorage) in <profile>.state.json
+    # between logins, so pixiv can skip the credential form and 2FA.
+    keep_session: bool = False
+    # URLs to use in place of pixiv's, by name: "auth_token_url", "login_url",
+    # "redirect_uri", "callback_uri". See gppt.endpoints.
+    endpoints: dict[str, str] = field(default_factory=dict)
 
     @classmethod
     def from_dict(cls, data: dict[str, Any]) -> ProfileConfig:
@@ -41,7 +56,7 @@ class ProfileConfig:
         Returns:
             ProfileConfig: The parsed configuration.
         """
-        known = {field: data[field] for field in cls.__dataclass_fields__ if field in data}
+        known = {name: data[name] for name in cls.__dataclass_fields__ if name in data}
         return cls(**known)
 
     def to_dict(self) -> dict[str, Any]:
@@ -77,6 +92,49 @@ def token_path(profile: str) -> Path:
     return CONFIG_DIR / f"{profile}.token.json"
 
 
+def state_path(profile: str) -> Path:
+    """Return the path of the profile's saved browser session.
+
+    Args:
+        profile (str): Profile name.
+
+    Returns:
+        Path: Path to ``<config dir>/<profile>.state.json``.
+    """
+    return CONFIG_DIR / f"{profile}.state.json"
+
+
+def lock_path(profile: str) -> Path:
+    """Return the path of the lock file guarding the profile's token cache.
+
+    Args:
+        profile (str): Profile name.
+
+    Returns:
+        Path: Path to ``<config dir>/<profile>.token.lock``.
+    """
+    return CONFIG_DIR / f"{profile}.token.lock"
+
+
+def socket_path() -> Path:
+    """Return where ``gppt serve`` listens by default.
+
+    Returns:
+        Path: Path to ``<config dir>/serve.sock``.
+    """
+    return CONFIG_DIR / "serve.sock"
+
+
+def cached_profiles() -> list[str]:
+    """Return the names of every profile with a cached token.
+
+    Returns:
+        list[str]: Profile names, sorted, one per ``<profile>.token.json``.
+    """
+    suffix = ".token.json"
+    return sorted(path.name.removesuffix(suffix) for path in CONFIG_DIR.glob(f"*{suffix}"))
+
+
 def load(profile: str) -> ProfileConfig:
     """Load the profile's configuration file.
 
@@ -122,21 +180,53 @@ def load_or_default(profile: str) -> ProfileConfig:
     return config
 
 
-def save(profile: str, config: ProfileConfig) -> Path:
+def save(profile: str, config: ProfileConfig, *, fsync: bool = False) -> Path:
     """Write the profile's configuration file.
 
     Args:
         profile (str): Profile name.
         config (ProfileConfig): Configuration to store.
+        fsync (bool): Flush the file to disk before returning.
 
     Returns:
         Path: Path the configuration was written to.
     """
-    CONFIG_DIR.mkdir(parents=True, exist_ok=True)
     path = profile_path(profile)
-    with path.open("w", encoding="utf-8") as fp:
-        json.dump(config.to_dict(), fp, indent=2, ensure_ascii=False)
-        fp.write("\n")
     # The config may hold a plaintext password -- keep it private.
-    path.chmod(0o600)
+    write_private_file(path, json.dumps(config.to_dict(), indent=2, ensure_ascii=False) + "\n", fsync=fsync)
     return path
+
+
+def write_private_file(path: Path, text: str, *, fsync: bool = False) -> None:
+    """Atomically replace ``path`` with ``text``, readable by the owner only.
+
+    The text goes to a mode 0600 temporary file in the same directory, which
+    then replaces ``path`` in one rename. A concurrent reader sees either the
+    old file or the new one, never a truncated one, and a crash mid-write
+    leaves the old file in place.
+
+    Args:
+        path (Path): File to write.
+        text (str): Its new content.
+        fsync (bool): Flush the file, and the rename, to disk before
+            returning, so the new content also survives a power loss.
+    """
+    path.parent.mkdir(parents=True, exist_ok=True)
+    fd, temp = tempfile.mkstemp(dir=path.parent, prefix=f".{path.name}.", suffix=".tmp")
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8") as fp:
+            fp.write(text)
+            if fsync:
+                fp.flush()
+                os.fsync(fp.fileno())
+        Path(temp).replace(path)
+    except BaseException:
+        with suppress(FileNotFoundError):
+            Path(temp).unlink()
+        raise
+    if fsync and hasattr(os, "O_DIRECTORY"):
+        directory = os.open(path.parent, os.O_RDONLY | os.O_DIRECTORY)
+        try:
+            os.fsync(directory)
+        finally:
+            os.close(directory)
@@ -0,0 +1,122 @@
+"""Bound how long a whole call may take, across all of its phases.
+
+A :class:`Deadline` starts its clock when it is made. Every phase of the call
+-- waiting for the profile lock, each token request and the pause before a
+retry, the browser launch, the page load, the form, the redirect -- then
+waits at most what is left of the budget, and a phase that finds nothing left
+raises :class:`DeadlineExceededError` instead of starting::
+
+    token = gppt.get_token("work", deadline=timedelta(seconds=5))
+
+Without a deadline, every phase keeps its own timeout, and :func:`cap`
+hands those back unchanged.
+"""
+
+from __future__ import annotations
+
+from time import monotonic
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from datetime import timedelta
+
+
+class DeadlineExceededError(TimeoutError):
+    """Raised when a call runs out of the time it was given."""
+
+
+class Deadline:
+    """A time budget, counting down from its creation."""
+
+    def __init__(self, budget: timedelta) -> None:
+        """Start the clock.
+
+        Args:
+            budget (timedelta): How long the call may take in all.
+        """
+        self.budget = budget
+        self._end = monotonic() + budget.total_seconds()
+
+    @property
+    def remaining_s(self) -> float:
+        """What is left of the budget.
+
+        Returns:
+            float: Seconds, never negative.
+        """
+        return max(0.0, self._end - monotonic())
+
+    @property
+    def expired(self) -> bool:
+        """Whether the budget is used up."""
+        return self.remaining_s <= 0
+
+    def check(self, phase: str) -> None:
+        """Raise unless there is time left to start ``phase``.
+
+        Args:
+            phase (str): What is about to start, for the error message.
+
+        Raises:
+            DeadlineExceededError: If the budget is used up.
+        """
+        if self.expired:
+            msg = f"Ran out of the {self.budget.total_seconds():g}s deadline before {phase}."
+            raise DeadlineExceededError(msg)
+
+    def cap(self, seconds: float, phase: str) -> float:
+        """Shorten a timeout of ``seconds`` to what is left of the budget.
+
+        Args:
+            seconds (float): The phase's own timeout.
+            phase (str): What is about to start, for the error message.
+
+        Returns:
+            float: The timeout to use: positive, and at most ``seconds``.
+
+        Raises:
+            DeadlineExceededError: If the budget is used up.
+        """
+        self.check(phase)
+        return min(seconds, self.remaining_s)
+
+
+def cap(deadline: Deadline | None, seconds: float, phase: str) -> float:
+    """Shorten a timeout to what is left of ``deadline``, if there is one.
+
+    Args:
+        deadline (Deadline | None): The call's deadline.
+        seconds (float): The phase's own timeout.
+        phase (str): What is about to start, for the error message.
+
+    Returns:
+        float: The timeout to use.
+    """
+    return seconds if deadline is None else deadline.cap(seconds, phase)
+
+
+def cap_ms(deadline: Deadline | None, timeout_ms: int, phase: str) -> int:
+    """:func:`cap` for a Playwright timeout in milliseconds, where 0 would mean none at all.
+
+    Args:
+        deadline (Deadline | None): The call's deadline.
+        timeout_ms (int): The phase's own timeout.
+        phase (str): What is about to start, for the error message.
+
+    Returns:
+        int: The timeout to use, at least 1 ms.
+    """
+    return max(1, int(cap(deadline, timeout_ms / 1000, phase) * 1000))
+
+
+def wait_s(deadline: Deadline | None, phase: str) -> float | None:
+    """How long ``phase`` may wait: all that is left of ``deadline``, or for ever without one.
+
+    Args:
+        deadline (Deadline | None): The call's deadline.
+        phase (str): What is about to start, for the error message.
+
+    Returns:
+        float | None: Seconds, or None for no limit.
+    """
+    return None if deadline is None else deadline.cap(deadline.remaining_s, phase)
@@ -0,0 +1,70 @@
+"""Where gppt sends the browser login and the token requests.
+
+pixiv's own URLs are the defaults. Any of them can be replaced -- to point a
+load test at a local stand-in, or to route traffic through a nearby egress
+proxy -- in three places, the first one set winning:
+
+1. per call, with ``endpoints=``;
+2. for the whole process, with an environment variable (see :data:`ENV`);
+3. per profile, with an ``"endpoints"`` object in ``<profile>.json``::
+
+       {"username": "...", "endpoints": {"auth_token_url": "https://egress.internal/auth/token"}}
+"""
+
+from __future__ import annotations
+
+import os
+from dataclasses import dataclass, fields
+from typing import TYPE_CHECKING, Final
+
+from gppt.consts import AUTH_TOKEN_URL, CALLBACK_URI, LOGIN_URL, REDIRECT_URI
+
+if TYPE_CHECKING:
+    from collections.abc import Mapping
+
+# Endpoint name -> the environment variable overriding it.
+ENV: Final[dict[str, str]] = {
+    "auth_token_url": "GPPT_AUTH_TOKEN_URL",
+    "login_url": "GPPT_LOGIN_URL",
+    "redirect_uri": "GPPT_REDIRECT_URI",
+    "callback_uri": "GPPT_CALLBACK_URI",
+}
+
+
+@dataclass(frozen=True)
+class Endpoints:
+    """The URLs of one pixiv login."""
+
+    # OAuth token endpoint: code exchanges and refreshes are POSTed here.
+    auth_token_url: str = AUTH_TOKEN_URL
+    # Login page the browser opens, with the PKCE challenge in its query.
+    login_url: str = LOGIN_URL
+    # Page the login form redirects to once the account is signed in.
+    redirect_uri: str = REDIRECT_URI
+    # ``redirect_uri`` sent with a code exchange; must match the login's.
+    callback_uri: str = CALLBACK_URI
+
+    @classmethod
+    def from_env(cls, configured: Mapping[str, str] | None = None) -> Endpoints:
+        """Return pixiv's endpoints with ``configured`` and then the environment applied.
+
+        Args:
+            configured (Mapping[str, str] | None): Overrides by endpoint
+                name, such as a profile's ``endpoints``.
+
+        Returns:
+            Endpoints: The endpoints to use.
+
+        Raises:
+            ValueError: If ``configured`` names an unknown endpoint.
+        """
+        values = dict(configured or {})
+        if unknown := sorted(values.keys() - {field.name for field in fields(cls)}):
+            msg = f"Unknown endpoint(s) {', '.join(unknown)}; expected some of {', '.join(ENV)}."
+            raise ValueError(msg)
+        values.update({name: value for name, variable in ENV.items() if (value := os.environ.get(variable))})
+        return cls(**values)
+
+
+# pixiv's own endpoints, whatever the environment says.
+PIXIV: Final = Endpoints()
@@ -0,0 +1,144 @@
+"""Single-flight coordination for a profile's token cache.
+
+Refreshing rotates the refresh token, so two callers refreshing the same
+expired cache at once waste a request each and may leave one of them holding
+a token pixiv has already invalidated. :class:`ProfileLock` lets exactly one
+caller refresh while the others wait, then reload the cache it wrote.
+
+The lock has two layers: a ``threading.Lock`` per profile for the threads of
+this process, and an advisory ``fcntl.flock`` on ``<profile>.token.lock`` for
+other processes sharing the config directory. The lock file sits beside the
+token cache rather than being the cache itself, since the cache is replaced
+(not rewritten) on save and a lock on a replaced inode guards nothing. Where
+``fcntl`` is unavailable (Windows), only the in-process layer applies.
+"""
+
+from __future__ import annotations
+
+import os
+import threading
+from time import monotonic, sleep
+from typing import TYPE_CHECKING, Final
+
+from gppt import config
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover - Windows
+    fcntl = None
+
+if TYPE_CHECKING:
+    from pathlib import Path
+    from types import TracebackType
+
+# How often a bounded acquire() retries another process's flock: doubling up to this.
+_MAX_POLL_S: Final = 0.05
+
+_registry = threading.Lock()
+_thread_locks: dict[Path, threading.Lock] = {}
+
+
+class ProfileLock:
+    """Exclusive, blocking lock on one profile's token cache.
+
+    Not re-entrant: a thread already holding the lock for a profile must not
+    acquire it again.
+    """
+
+    def __init__(self, profile: str) -> None:
+        """Prepare the lock. Nothing is acquired until :meth:`acquire`.
+
+        Args:
+            profile (str): Profile name.
+        """
+        self.path = config.lock_path(profile)
+        with _registry:
+            self._thread_lock = _thread_locks.setdefault(self.path, threading.Lock())
+        self._fd: int | None = None
+
+    def acquire(self, timeout: float | None = None) -> bool:
+        """Wait until this caller holds the profile, in this process and across processes.
+
+        Args:
+            timeout (float | None): Seconds to wait at most. None waits for
+                as long as it takes.
+
+        Returns:
+            bool: Whether the lock was acquired; False only once ``timeout``
+                has passed.
+        """
+        started = monotonic()
+        if not self._thread_lock.acquire(timeout=-1 if timeout is None else max(0.0, timeout)):
+            return False
+        if fcntl is None:
+            return True
+        try:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o600)
+            try:
+                locked = _flock(fd, None if timeout is None else started + timeout)
+            except BaseException:
+                os.close(fd)
+                raise
+        except BaseException:
+            self._thread_lock.release()
+            raise
+        if not locked:
+            os.close(fd)
+            self._thread_lock.release()
+            return False
+        self._fd = fd
+        return True
+
+    def release(self) -> None:
+        """Let the next waiter in."""
+        if self._fd is not None:
+            fd, self._fd = self._fd, None
+            # Closing the descriptor drops the flock with it.
+            os.close(fd)
+        self._thread_lock.release()
+
+    def __enter__(self) -> ProfileLock:  # noqa: PYI034 -- Self needs Python 3.11
+        """Acquire the lock.
+
+        Returns:
+            ProfileLock: This lock.
+        """
+        self.acquire()
+        return self
+
+    def __exit__(
+        self,
+        exc_type: type[BaseException] | None,
+        exc: BaseException | None,
+        traceback: TracebackType | None,
+    ) -> None:
+        """Release the lock."""
+        self.release()
+
+
+def _flock(fd: int, until: float | None) -> bool:
+    """Lock ``fd`` exclusively, giving up at the monotonic time ``until``; None never gives up."""
+    if fcntl is None:  # pragma: no cover - Windows; acquire() does not get here
+        return True
+    if until is None:
+        fcntl.flock(fd, fcntl.LOCK_EX)
+        return True
+    poll = 0.001
+    while not _try_flock(fd):
+        left = until - monotonic()
+        if left <= 0:
+            return False
+        sleep(min(poll, left))
+        poll = min(poll * 2, _MAX_POLL_S)
+    return True
+
+
+def _try_flock(fd: int) -> bool:
+    if fcntl is None:  # pragma: no cover - Windows; acquire() does not get here
+        return True
+    try:
+        fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except BlockingIOError:
+        return False
+    return True
@@ -0,0 +1,203 @@
+"""Keep Chromium running between browser logins.
+
+Every :func:`gppt.browser.fetch_authorization` normally starts a Playwright
+driver, launches Chromium, logs in and tears it all down again. A
+:class:`BrowserPool` launches the browser once and hands each login a fresh,
+isolated ``BrowserContext`` in it -- no cookies or storage leak between
+logins -- so only the first login pays for the launch::
+
+    with BrowserPool() as pool:
+        for username, password in accounts:
+            tokens.append(gppt.login(username, password, pool=pool))
+
+Playwright's synchronous API is bound to the thread that started it: create,
+use and close a pool on one thread. Logins on that thread run one at a time,
+so a second browser would never be used; parallel logins need one pool per
+worker thread.
+"""
+
+from __future__ import annotations
+
+import threading
+from contextlib import contextmanager
+from dataclasses import dataclass
+from time import monotonic
+from typing import TYPE_CHECKING, Final
+
+from gppt.browser import context_options, ensure_chromium, launch_chromium
+
+if TYPE_CHECKING:
+    from collections.abc import Generator
+    from pathlib import Path
+    from types import TracebackType
+
+    from playwright.sync_api import Browser, BrowserContext, Playwright
+
+    from gppt.deadline import Deadline
+
+# A browser left idle this long is closed, and relaunched when next needed, so
+# a long-lived pool neither holds memory forever nor hands out a stale process.
+DEFAULT_TTL_S: Final = 600.0
+
+
+@dataclass
+class _Slot:
+    """The running browser and how it is being used."""
+
+    browser: Browser
+    in_use: int = 0  # contexts currently open in it
+    idle_since: float = 0.0
+
+
+class BrowserPool:
+    """A warm Chromium browser that hands out isolated contexts.
+
+    The browser is launched by the first login. Once idle for longer than
+    ``ttl`` seconds, or once it has crashed or been closed behind the pool's
+    back, it is dropped when the pool is next used (or on :meth:`prune`) and
+    relaunched on demand.
+    """
+
+    def __init__(
+        self,
+        *,
+        headless: bool = True,
+        ttl: float = DEFAULT_TTL_S,
+        install_browser: bool = True,
+    ) -> None:
+        """Configure a pool. Nothing is started until the first login.
+
+        Args:
+            headless (bool): Launch the browser without a visible window. A
+                login asking for the other mode launches a one-off browser.
+            ttl (float): Seconds the browser may sit idle before it is recycled.
+            install_browser (bool): Install Chromium on first use (once per
+                Playwright version).
+
+        Raises:
+            ValueError: If ``ttl`` is negative.
+        """
+        if ttl < 0:
+            msg = f"ttl must not be negative, got {ttl}."
+            raise ValueError(msg)
+
+        self.headless = headless
+        self.ttl = ttl
+        self.install_browser = install_browser
+        self._playwright: Playwright | None = None
+        self._owner: int | None = None
+        self._slot: _Slot | None = None
+
+    @property
+    def running(self) -> bool:
+        """Whether the browser is currently launched.
+
+        Returns:
+            bool: True between a launch and the next recycle or close.
+        """
+        return self._slot is not None
+
+    @contextmanager
+    def context(
+        self,
+        *,
+        storage_state: Path | None = None,
+        deadline: Deadline | None = None,
+    ) -> Generator[BrowserContext]:
+        """Borrow a fresh browser context, closed again on exit.
+
+        Args:
+            storage_state (Path | None): Saved browser session to restore into
+                the context, if the file exists.
+            deadline (Deadline | None): Bounds the driver start and the launch,
+                should the browser need one. A first-run install cannot be cut
+                short; the deadline is only checked before it.
+
+        Yields:
+            BrowserContext: A new context with the proxy settings applied.
+
+        Raises:
+            RuntimeError: If called from a thread other than the pool's.
+            DeadlineExceededError: If ``deadline`` passes before the browser is up.
+        """
+        self._check_thread()
+        self.prune()
+        if self._slot is None:
+            self._slot = _Slot(self._launch(deadline))
+        slot = self._slot
+        context = slot.browser.new_context(**context_options(storage_state))
+        slot.in_use += 1
+        try:
+            yield context
+        finally:
+            slot.in_use -= 1
+            slot.idle_since = monotonic()
+            context.close()
+
+    def prune(self) -> bool:
+        """Close the browser if it has been idle for longer than ``ttl``, or has gone away.
+
+        A browser that crashed or was killed is dropped whether idle or not,
+        so the next login launches a new one instead of failing on it.
+
+        Returns:
+            bool: True if it was closed.
+        """
+        slot = self._slot
+        if slot is None:
+            return False
+        if slot.browser.is_connected() and (slot.in_use or monotonic() - slot.idle_since <= self.ttl):
+            return False
+        self._slot = None
+        slot.browser.close()
+        return True
+
+    def close(self) -> None:
+        """Close the browser and stop the Playwright driver."""
+        if self._slot is not None:
+            self._slot.browser.close()
+            self._slot = None
+        if self._playwright is not None:
+            self._playwright.stop()
+            self._playwright = None
+            self._owner = None
+
+    def __enter__(self) -> BrowserPool:  # noqa: PYI034 -- Self needs Python 3.11
+        """Return the pool itself, to be closed on exit.
+
+        Returns:
+            BrowserPool: This pool.
+        """
+        return self
+
+    def __exit__(
+        self,
+        exc_type: type[BaseException] | None,
+        exc: BaseException | None,
+        traceback: TracebackType | None,
+    ) -> None:
+        """Close the pool."""
+        self.close()
+
+    def _launch(self, deadline: Deadline | None) -> Browser:
+        if self._playwright is None:
+            from playwright.sync_api import sync_playwright  # noqa: PLC0415 -- keep `import gppt` light
+
+            if deadline is not None:
+                deadline.check("the browser driver start")
+            self._playwright = sync_playwright().start()
+            self._owner = threading.get_ident()
+            if deadline is not None:
+                deadline.check("the browser install check")
+            ensure_chromium(self._playwright.chromium, install_browser=self.install_browser)
+        return launch_chromium(
+            self._playwright.chromium,
+            headless=self.headless,
+            install_browser=self.install_browser,
+            deadline=deadline,
+        )
+
+    def _check_thread(self) -> None:
+        if self._owner is not None and self._owner != threading.get_ident():
+            msg = "A BrowserPool can only be used from the thread that started it."
+            raise RuntimeError(msg)
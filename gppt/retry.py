@@ -0,0 +1,242 @@
+"""Retry failed token requests, and stop sending them while pixiv is down.
+
+A request to ``/auth/token`` that fails for a reason worth retrying -- a
+connection refused or timed out before anything was sent, HTTP 429 or a 5xx
+-- is sent again after an exponential backoff with full jitter, as
+:class:`RetryPolicy` describes. Other failures, such as a revoked refresh
+token, fail at once; so does a request that was sent but never answered,
+since pixiv may already have redeemed its single-use grant.
+
+Every process keeps one :class:`CircuitBreaker` per token endpoint. After
+``threshold`` requests in a row have failed, the breaker opens and further
+requests fail at once with :class:`~gppt.token.TokenUnavailableError`, for
+``cooldown``. A single trial request then decides whether it closes again.
+During a pixiv outage, a fleet of workers then stops hammering the endpoint
+instead of retrying, or falling back to browser logins, in lockstep.
+"""
+
+from __future__ import annotations
+
+import random
+import threading
+import time
+from dataclasses import dataclass
+from datetime import datetime, timedelta, timezone
+from email.utils import parsedate_to_datetime
+from typing import TYPE_CHECKING, Final
+
+if TYPE_CHECKING:
+    from collections.abc import Mapping
+
+DEFAULT_THRESHOLD: Final = 5
+DEFAULT_COOLDOWN: Final = timedelta(seconds=30)
+
+# Rate-limited, or failed on pixiv's side: the same request may well succeed later.
+RETRYABLE_STATUSES: Final = frozenset({408, 425, 429, 500, 502, 503, 504})
+
+
+@dataclass(frozen=True)
+class RetryPolicy:
+    """How often, and how patiently, to resend a failed token request."""
+
+    # Tries in all, the first one included. 1 never retries.
+    attempts: int = 3
+    # The n-th retry waits a random time of up to base * 2**(n-1) seconds...
+    base: float = 0.5
+    # ...and never longer than this.
+    cap: float = 8.0
+
+    def __post_init__(self) -> None:
+        """Check the policy.
+
+        Raises:
+            ValueError: If ``attempts`` is not positive, or a delay is negative.
+        """
+        if self.attempts < 1:
+            msg = f"attempts must be at least 1, got {self.attempts}."
+            raise ValueError(msg)
+        if self.base < 0 or self.cap < 0:
+            msg = f"delays must not be negative, got base={self.base}, cap={self.cap}."
+            raise ValueError(msg)
+
+    def delay(self, retry: int, *, retry_after: float | None = None) -> float:
+        """Return the seconds to wait before the ``retry``-th retry (from 1).
+
+        Args:
+            retry (int): Which retry this is.
+            retry_after (float | None): What the server asked for in its
+                ``Retry-After`` header, honoured up to ``cap``.
+
+        Returns:
+            float: Seconds to sleep.
+        """
+        if retry_after is not None:
+            return min(retry_after, self.cap)
+        return random.uniform(0.0, min(self.cap, self.base * 2 ** (retry - 1)))  # noqa: S311 -- not for security
+
+
+DEFAULT_POLICY: Final = RetryPolicy()
+
+
+@dataclass(frozen=True)
+class Permit:
+    """Leave from :meth:`CircuitBreaker.allow` to send one request.
+
+    Hand it back with the outcome: only the trial request it names may give
+    back, or fail, the trial that an open breaker is letting through.
+    """
+
+    # Which trial this request is; None for one sent while the breaker was closed.
+    trial: int | None = None
+
+
+class CircuitBreaker:
+    """Fail fast once an endpoint has failed ``threshold`` times in a row.
+
+    Safe to share between threads.
+    """
+
+    def __init__(self, *, threshold: int = DEFAULT_THRESHOLD, cooldown: timedelta = DEFAULT_COOLDOWN) -> None:
+        """Start closed: every request goes through.
+
+        Args:
+            threshold (int): Consecutive failures that open the breaker.
+            cooldown (timedelta): How long it stays open before a trial
+                request is let through.
+
+        Raises:
+            ValueError: If ``threshold`` is not positive.
+        """
+        if threshold < 1:
+            msg = f"threshold must be at least 1, got {threshold}."
+            raise ValueError(msg)
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self._failures = 0
+        self._opened_at: float | None = None  # monotonic; None while closed
+        self._trial: int | None = None  # the trial request in flight, if any
+        self._trials = 0  # trials let through so far, to number the next
+        self._lock = threading.Lock()
+
+    @property
+    def is_open(self) -> bool:
+        """Whether requests are being refused right now."""
+        with self._lock:
+            return self._opened_at is not None and (self._trial is not None or self._remaining() > 0)
+
+    def allow(self) -> Permit | None:
+        """Whether a request may be sent now.
+
+        Once the cooldown has passed, one caller is let through as a trial;
+        the others keep being refused until it reports back.
+
+        Returns:
+            Permit | None: What to report the outcome with, or None while
+                the breaker is open.
+        """
+        with self._lock:
+            if self._opened_at is None:
+                return Permit()
+            if self._remaining() <= 0 and self._trial is None:
+                self._trials += 1
+                self._trial = self._trials
+                return Permit(self._trial)
+            return None
+
+    @property
+    def retry_in(self) -> float:
+        """Seconds until the next trial request is let through.
+
+        Returns:
+            float: 0.0 unless the breaker is open and cooling down.
+        """
+        with self._lock:
+            return 0.0 if self._opened_at is None else max(0.0, self._remaining())
+
+    def record_success(self) -> None:
+        """Close the breaker: the endpoint answered, whoever asked it."""
+        with self._lock:
+            self._failures = 0
+            self._opened_at = None
+            self._trial = None
+
+    def release(self, permit: Permit) -> None:
+        """Give back a request that ended without a verdict on the endpoint.
+
+        Args:
+            permit (Permit): What :meth:`allow` returned for it. Only the
+                trial in flight is given back, for the next caller.
+        """
+        with self._lock:
+            if self._owns_trial(permit):
+                self._trial = None
+
+    def record_failure(self, permit: Permit | None = None) -> None:
+        """Count a failure, opening the breaker at ``threshold`` (or after a failed trial).
+
+        Args:
+            permit (Permit | None): What :meth:`allow` returned for the
+                request; None for one sent while the breaker was closed. A
+                request that started before the breaker opened and fails
+                only now neither counts nor restarts the cooldown.
+        """
+        with self._lock:
+            if permit is not None and self._owns_trial(permit):
+                self._failures += 1
+                self._opened_at = time.monotonic()
+                self._trial = None
+            elif self._opened_at is None:
+                self._failures += 1
+                if self._failures >= self.threshold:
+                    self._opened_at = time.monotonic()
+
+    def _owns_trial(self, permit: Permit) -> bool:
+        """Whether ``permit`` is for the trial in flight; the caller holds the lock."""
+        return permit.trial is not None and permit.trial == self._trial
+
+    def _remaining(self) -> float:
+        """Seconds left of the cooldown; the caller holds the lock and the breaker is open."""
+        assert self._opened_at is not None  # noqa: S101 -- the caller checked
+        return self._opened_at + self.cooldown.total_seconds() - time.monotonic()
+
+
+_breakers: dict[str, CircuitBreaker] = {}
+_breakers_lock = threading.Lock()
+
+
+def breaker_for(url: str) -> CircuitBreaker:
+    """Return this process's circuit breaker for the endpoint ``url``.
+
+    Args:
+        url (str): Token endpoint.
+
+    Returns:
+        CircuitBreaker: The same breaker for every call with the same URL.
+    """
+    with _breakers_lock:
+        if url not in _breakers:
+            _breakers[url] = CircuitBreaker()
+        return _breakers[url]
+
+
+def retry_after(headers: Mapping[str, str]) -> float | None:
+    """Read a ``Retry-After`` header, in seconds or as an HTTP date.
+
+    Args:
+        headers (Mapping[str, str]): Response headers.
+
+    Returns:
+        float | None: Seconds to wait, or None without a usable header.
+    """
+    value = headers.get("Retry-After") or headers.get("retry-after")
+    if not value:
+        return None
+    if value.isdigit():
+        return float(value)
+    try:
+        when = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    if when.tzinfo is None:  # "-0000": UTC, by RFC 5322
+        when = when.replace(tzinfo=timezone.utc)
+    return max(0.0, (when - datetime.now(tz=timezone.utc)).total_seconds())
@@ -0,0 +1,222 @@
+"""Refresh cached tokens ahead of their expiry, in the background.
+
+:func:`gppt.get_token` refreshes a token only once a caller finds it expired,
+so that caller waits on the round trip to pixiv. A :class:`RefreshScheduler`
+keeps every profile's next refresh in a heap ordered by due time and renews
+each token ``lead`` before it lapses, so callers keep finding a valid one::
+
+    with RefreshScheduler(["work", "home"]) as scheduler:
+        ...  # get_token("work") keeps hitting a valid cache
+
+Due times are pulled forward by a random share of ``jitter``, so tokens
+issued together are not all refreshed in the same instant, and at most
+``max_workers`` refreshes run at once. A failed refresh is retried after
+``retry``; the scheduler never opens a browser. ``gppt daemon`` runs one in
+the foreground.
+"""
+
+from __future__ import annotations
+
+import heapq
+import itertools
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from typing import TYPE_CHECKING, Final
+
+from gppt import api, config
+from gppt.api import DEFAULT_WORKERS, REFRESH_LEAD, RefreshResult
+from gppt.token import utc_now
+from gppt.transport import Transport
+
+if TYPE_CHECKING:
+    from collections.abc import Callable, Iterable
+    from datetime import datetime
+    from types import TracebackType
+
+    from gppt.cache import TokenCache
+
+DEFAULT_JITTER: Final = timedelta(seconds=30)
+DEFAULT_RETRY: Final = timedelta(minutes=1)
+
+
+class RefreshScheduler:
+    """Keep a set of profiles' cached tokens refreshed from a background thread."""
+
+    def __init__(  # noqa: PLR0913
+        self,
+        profiles: Iterable[str] | None = None,
+        *,
+        lead: timedelta = REFRESH_LEAD,
+        jitter: timedelta = DEFAULT_JITTER,
+        retry: timedelta = DEFAULT_RETRY,
+        max_workers: int = DEFAULT_WORKERS,
+        transport: Transport | None = None,
+        cache: TokenCache | None = None,
+        on_result: Callable[[RefreshResult], None] | None = None,
+    ) -> None:
+        """Prepare the scheduler. Nothing runs until :meth:`start`.
+
+        Args:
+            profiles (Iterable[str] | None): Profile names. None means every
+                profile with a cached token when the scheduler starts.
+            lead (timedelta): Refresh each token this long before it expires.
+            jitter (timedelta): Refresh up to this much earlier still, at
+                random, to spread out tokens that expire together.
+            retry (timedelta): Wait this long before retrying a failed refresh.
+            max_workers (int): Refreshes running at once.
+            transport (Transport | None): HTTP session to share between the
+                workers. None opens a pool sized for ``max_workers`` while
+                the scheduler runs.
+            cache (TokenCache | None): In-memory layer over the token caches,
+                updated as tokens are refreshed.
+            on_result (Callable[[RefreshResult], None] | None): Called from a
+                worker thread after every check of a profile.
+        """
+        self.lead = lead
+        self.jitter = jitter
+        self.retry = retry
+        self.max_workers = max_workers
+        self.cache = cache
+        self.on_result = on_result
+        self._transport = transport
+        self._owns_transport = transport is None
+        self._initial = None if profiles is None else list(profiles)
+
+        self._heap: list[tuple[float, int, str]] = []  # (monotonic due time, tiebreak, profile)
+        self._counter = itertools.count()
+        self._profiles: set[str] = set()
+        self._condition = threading.Condition()
+        self._stopped = threading.Event()
+        self._thread: threading.Thread | None = None
+        # Threads are only spawned as refreshes are submitted.
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="gppt-refresh")
+
+    def start(self) -> None:
+        """Check every profile now, then keep refreshing them in the background.
+
+        Raises:
+            RuntimeError: If the scheduler was already started.
+        """
+        if self._thread is not None:
+            msg = "the scheduler was already started"
+            raise RuntimeError(msg)
+        if self._transport is None:
+            self._transport = Transport(pool_size=self.max_workers)
+        for profile in config.cached_profiles() if self._initial is None else self._initial:
+            self.add(profile)
+        self._thread = threading.Thread(target=self._run, args=(self._transport,), name="gppt-scheduler", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        """Stop scheduling and wait for the refreshes in flight to finish."""
+        with self._condition:
+            self._stopped.set()
+            self._condition.notify_all()
+        if self._thread is not None and self._thread is not threading.current_thread():
+            self._thread.join()
+        self._executor.shutdown(wait=True, cancel_futures=True)
+        if self._owns_transport and self._transport is not None:
+            self._transport.close()
+            self._transport = None
+
+    def run(self) -> None:
+        """Start the scheduler and block until :meth:`stop` is called.
+
+        :meth:`stop` may come from another thread or from a signal handler.
+        """
+        self.start()
+        try:
+            self._stopped.wait()
+        finally:
+            self.stop()
+
+    def add(self, profile: str) -> None:
+        """Track another profile, checking it at once. A tracked profile is ignored.
+
+        Args:
+            profile (str): Profile name.
+        """
+        with self._condition:
+            if profile in self._profiles:
+                return
+            self._profiles.add(profile)
+            self._push(profile, 0.0)
+
+    def scheduled(self) -> list[tuple[str, datetime]]:
+        """Return when each waiting profile is next checked, soonest first.
+
+        Profiles being refreshed at the moment are left out.
+
+        Returns:
+            list[tuple[str, datetime]]: ``(profile, due time)`` pairs.
+        """
+        now, clock = utc_now(), time.monotonic()
+        with self._condition:
+            entries = sorted(self._heap)
+        return [(profile, now + timedelta(seconds=due - clock)) for due, _, profile in entries]
+
+    def __enter__(self) -> RefreshScheduler:  # noqa: PYI034 -- Self needs Python 3.11
+        """Start the scheduler.
+
+        Returns:
+            RefreshScheduler: This scheduler.
+        """
+        self.start()
+        return self
+
+    def __exit__(
+        self,
+        exc_type: type[BaseException] | None,
+        exc: BaseException | None,
+        traceback: TracebackType | None,
+    ) -> None:
+        """Stop the scheduler."""
+        self.stop()
+
+    def _run(self, transport: Transport) -> None:
+        """Hand every due profile to a worker, then sleep until the next one is due."""
+        with self._condition:
+            while not self._stopped.is_set():
+                clock = time.monotonic()
+                while self._heap and self._heap[0][0] <= clock:
+                    _, _, profile = heapq.heappop(self._heap)
+                    self._executor.submit(self._refresh, profile, transport)
+                timeout = self._heap[0][0] - clock if self._heap else None
+                self._condition.wait(timeout)
+
+    def _refresh(self, profile: str, transport: Transport) -> None:
+        try:
+            result = api.refresh_profile(
+                profile,
+                self.lead,
+                save=True,
+                transport=transport,
+                cache=self.cache,
+            )
+        except Exception as exc:  # noqa: BLE001 -- one broken profile must not stop the others
+            result = RefreshResult(profile, "failed", error=str(exc))
+
+        with self._condition:
+            self._push(profile, self._next_check(result))
+            self._condition.notify_all()
+        if self.on_result is not None:
+            self.on_result(result)
+
+    def _next_check(self, result: RefreshResult) -> float:
+        """Seconds until ``result``'s profile is due again."""
+        spread = random.uniform(0.0, self.jitter.total_seconds())  # noqa: S311 -- not for security
+        expires_at = None if result.token is None else result.token.expiry
+        if expires_at is not None:
+            delay = (expires_at - self.lead - utc_now()).total_seconds() - spread
+            if delay > 0:
+                return delay
+        # Failed, or issued with less than `lead` to live: try again later.
+        return self.retry.total_seconds() + spread
+
+    def _push(self, profile: str, delay: float) -> None:
+        """Schedule ``profile`` ``delay`` seconds from now; the caller holds the condition."""
+        heapq.heappush(self._heap, (time.monotonic() + delay, next(self._counter), profile))
+        self._condition.notify_all()
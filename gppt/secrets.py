@@ -1,18 +1,85 @@
-"""Resolve ``op://`` secret references via the 1Password CLI (``op read``).
+"""Resolve ``op://`` secret references via the 1Password CLI.
 
 Any profile field that starts with ``op://`` is treated as a 1Password secret
-reference and expanded at login time by shelling out to ``op read <ref>``.
-Plain values (and empty strings) are returned unchanged, so existing profiles
-keep working.
+reference and expanded at login time by shelling out to ``op``. Plain values
+(and empty strings) are returned unchanged, so existing profiles keep working.
+
+Every ``op`` run costs hundreds of milliseconds and may ask for a biometric
+unlock, so :func:`resolve_secrets` expands all of a login's references with
+one run -- ``op read`` for a single reference, ``op inject`` for several --
+and a :class:`SecretCache` lets a long-running process skip ``op`` entirely
+for references it resolved recently.
 """
 
 from __future__ import annotations
 
 import shutil
 import subprocess
+import threading
+import time
+import uuid
+from datetime import timedelta
+from typing import TYPE_CHECKING, Final
+
+if TYPE_CHECKING:
+    from collections.abc import Sequence
 
 OP_PREFIX = "op://"
 
+DEFAULT_SECRET_TTL: Final = timedelta(minutes=5)
+
+
+class SecretCache:
+    """Resolved 1Password references, kept in memory for ``ttl``.
+
+    The secrets then live in this process's memory as plain strings until
+    they expire or :meth:`clear` is called. Safe to share between threads.
+    """
+
+    def __init__(self, *, ttl: timedelta = DEFAULT_SECRET_TTL) -> None:
+        """Start empty.
+
+        Args:
+            ttl (timedelta): How long a resolved reference is reused.
+        """
+        self.ttl = ttl
+        self._entries: dict[str, tuple[str, float]] = {}  # reference -> (secret, monotonic expiry)
+        self._lock = threading.Lock()
+
+    def get(self, reference: str) -> str | None:
+        """Return the secret resolved for ``reference``, unless it has expired.
+
+        Args:
+            reference (str): ``op://`` reference.
+
+        Returns:
+            str | None: The secret, or None if it must be resolved again.
+        """
+        with self._lock:
+            entry = self._entries.get(reference)
+            if entry is None:
+                return None
+            secret, expires = entry
+            if time.monotonic() >= expires:
+                del self._entries[reference]
+                return None
+            return secret
+
+    def put(self, reference: str, secret: str) -> None:
+        """Remember the secret resolved for ``reference``.
+
+        Args:
+            reference (str): ``op://`` reference.
+            secret (str): Its resolved value.
+        """
+        with self._lock:
+            self._entries[reference] = (secret, time.monotonic() + self.ttl.total_seconds())
+
+    def clear(self) -> None:
+        """Forget every secret."""
+        with self._lock:
+            self._entries.clear()
+
 
 def is_op_reference(value: str) -> bool:
     """Whether ``value`` looks like a 1Password secret reference.
@@ -26,11 +93,13 @@ def is_op_reference(value: str) -> bool:
     return value.startswith(OP_PREFIX)
 
 
-def resolve_secret(value: str) -> str:
+def resolve_secret(value: str, *, cache: SecretCache | None = None) -> str:
     """Return ``value`` verbatim, or expand it via ``op read`` if it is an op:// ref.
 
     Args:
         value (str): Configured field value.
+        cache (SecretCache | None): Reuse a recent resolution of the
+            reference, and remember this one.
 
     Returns:
         str: The resolved secret, or the original value.
@@ -38,26 +107,82 @@ def resolve_secret(value: str) -> str:
     Raises:
         ValueError: If the ``op`` CLI is missing or the reference cannot be read.
     """
-    if not is_op_reference(value):
-        return value
+    return resolve_secrets([value], cache=cache)[0]
+
+
+def resolve_secrets(values: Sequence[str], *, cache: SecretCache | None = None) -> list[str]:
+    """Expand every op:// reference among ``values`` with at most one ``op`` run.
+
+    Args:
+        values (Sequence[str]): Configured field values.
+        cache (SecretCache | None): Reuse recent resolutions of the
+            references, and remember the new ones.
+
+    Returns:
+        list[str]: The values, in order, with each reference resolved.
+
+    Raises:
+        ValueError: If the ``op`` CLI is missing or a reference cannot be read.
+    """
+    resolved: dict[str, str] = {}
+    pending: list[str] = []
+    for value in values:
+        if not is_op_reference(value) or value in resolved or value in pending:
+            continue
+        cached = None if cache is None else cache.get(value)
+        if cached is None:
+            pending.append(value)
+        else:
+            resolved[value] = cached
+
+    if pending:
+        fresh = _op_read(pending[0]) if len(pending) == 1 else _op_inject(pending)
+        resolved.update(zip(pending, fresh, strict=True))
+        if cache is not None:
+            for reference in pending:
+                cache.put(reference, resolved[reference])
+
+    return [resolved.get(value, value) for value in values]
+
+
+def _op_read(reference: str) -> list[str]:
+    return [_run_op(["op", "read", reference], references=[reference])]
+
+
+def _op_inject(references: list[str]) -> list[str]:
+    """Resolve several references in one ``op inject`` run.
+
+    Each secret is framed by a random marker line, so a secret spanning
+    several lines still comes back whole.
+    """
+    marker = f"--gppt-{uuid.uuid4().hex}--"
+    template = "".join(f"{marker}\n{{{{ {reference} }}}}\n" for reference in references) + marker
+    parts = _run_op(["op", "inject"], references=references, stdin=template).split(marker)
+    if len(parts) != len(references) + 2 or parts[0] or parts[-1]:
+        msg = f"Unexpected output from `op inject` for {', '.join(references)}"
+        raise ValueError(msg)
+    return [part.strip() for part in parts[1:-1]]
+
 
+def _run_op(args: list[str], *, references: list[str], stdin: str | None = None) -> str:
     if shutil.which("op") is None:
         msg = (
-            f"'{value}' is a 1Password reference but the `op` CLI is not installed. "
+            f"'{references[0]}' is a 1Password reference but the `op` CLI is not installed. "
             "Install the 1Password CLI: https://developer.1password.com/docs/cli/"
         )
         raise ValueError(msg)
 
     try:
         result = subprocess.run(  # noqa: S603
-            ["op", "read", value],  # noqa: S607
+            args,
+            input=stdin,
             capture_output=True,
             text=True,
             check=True,
         )
     except subprocess.CalledProcessError as exc:
         detail = (exc.stderr or exc.stdout or "").strip()
-        msg = f"Failed to resolve 1Password reference '{value}': {detail}"
+        msg = f"Failed to resolve 1Password reference '{', '.join(references)}': {detail}"
         raise ValueError(msg) from exc
 
     return result.stdout.strip()
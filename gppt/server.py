@@ -0,0 +1,331 @@
+"""Hand out cached tokens to many local processes over HTTP.
+
+Every worker that calls :func:`gppt.get_token` reads, refreshes and saves the
+token cache itself. A :class:`TokenServer` owns the caches instead and
+answers ``GET /token/<profile>`` from a :class:`~gppt.cache.TokenCache`, so a
+worker gets a valid access token with one local request::
+
+    $ gppt serve
+    $ curl --unix-socket ~/.config/gppt/serve.sock http://gppt/token/work
+    {"access_token": "...", "expires_at": "...", "expires_in": 3281, ...}
+
+By default the server listens on ``<config dir>/serve.sock``, a Unix socket
+only its owner can open. Over TCP any local user can connect. There the
+server answers only requests whose ``Host`` is an IP address or
+``localhost``, so a web page that rebinds its own domain name to the
+loopback address cannot read the tokens through the browser.
+
+A :class:`~gppt.scheduler.RefreshScheduler` renews every profile served
+ahead of its expiry, so a request rarely waits on pixiv. A token found
+expired anyway is refreshed on the spot, single-flight as in
+:func:`gppt.get_token`. The server never opens a browser: a profile without a
+usable cached token answers 404 until ``gppt login`` is run for it, and one
+that cannot be refreshed while pixiv is unreachable answers 503, and any
+other failure answers 500.
+
+The refresh token never leaves the server. A worker holding it could refresh
+on its own and rotate the token out from under everyone else.
+"""
+
+from __future__ import annotations
+
+import ipaddress
+import json
+import re
+import socket
+import threading
+from functools import partial
+from http import HTTPStatus
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from socketserver import ThreadingMixIn, UnixStreamServer
+from typing import TYPE_CHECKING, Any, Final
+from urllib.parse import urlsplit
+
+from gppt import api, config
+from gppt.api import DEFAULT_WORKERS, REFRESH_LEAD
+from gppt.cache import TokenCache
+from gppt.scheduler import RefreshScheduler
+from gppt.token import TokenUnavailableError, utc_now
+from gppt.transport import Transport
+
+if TYPE_CHECKING:
+    from datetime import timedelta
+    from types import TracebackType
+
+    from gppt.token import Token
+
+DEFAULT_HOST: Final = "127.0.0.1"
+DEFAULT_PORT: Final = 8465
+
+# Profile names become file names; keep requests inside the config directory.
+_PROFILE_NAME: Final = re.compile(r"[A-Za-z0-9_][A-Za-z0-9._-]*")
+
+
+class TokenServer:
+    """A local HTTP server answering ``GET /token/<profile>`` from memory."""
+
+    def __init__(  # noqa: PLR0913
+        self,
+        address: tuple[str, int] | str | Path | None = None,
+        *,
+        refresh_ahead: bool = True,
+        lead: timedelta = REFRESH_LEAD,
+        max_workers: int = DEFAULT_WORKERS,
+        transport: Transport | None = None,
+        cache: TokenCache | None = None,
+    ) -> None:
+        """Bind the server. Nothing is answered until :meth:`start` or :meth:`run`.
+
+        Args:
+            address (tuple[str, int] | str | Path | None): ``(host, port)`` to
+                listen on over TCP, or the path of a Unix socket to create
+                (mode 0600). None means ``<config dir>/serve.sock`` where Unix
+                sockets exist, else ``127.0.0.1:8465``. Port 0 picks a free
+                port; see :attr:`address`.
+            refresh_ahead (bool): Renew every profile served ``lead`` before
+                its token expires, in the background.
+            lead (timedelta): How far ahead of expiry to renew.
+            max_workers (int): Background refreshes running at once.
+            transport (Transport | None): HTTP session for the refreshes. None
+                opens one for the lifetime of the server.
+            cache (TokenCache | None): Memory to answer from. None starts an
+                empty one.
+        """
+        self.cache = cache or TokenCache()
+        self._owns_transport = transport is None
+        self.transport = transport or Transport(pool_size=max_workers)
+        self.scheduler = (
+            RefreshScheduler([], lead=lead, max_workers=max_workers, transport=self.transport, cache=self.cache)
+            if refresh_ahead
+            else None
+        )
+        self._http = _bind(_default_address() if address is None else address, self)
+        self._thread: threading.Thread | None = None
+        self._stopped = threading.Event()
+
+    @property
+    def address(self) -> tuple[str, int] | str:
+        """Where the server listens: ``(host, port)``, or a Unix socket path."""
+        if isinstance(self._http, _UnixHTTPServer):
+            return self._http.path
+        host, port = self._http.server_address[:2]
+        return str(host), port
+
+    def start(self) -> None:
+        """Answer requests from a background thread.
+
+        Raises:
+            RuntimeError: If the server was already started.
+        """
+        if self._thread is not None:
+            msg = "the server was already started"
+            raise RuntimeError(msg)
+        if self.scheduler is not None:
+            self.scheduler.start()
+        self._thread = threading.Thread(target=self._serve, name="gppt-serve", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        """Stop answering, stop the background refreshes and close the socket."""
+        self._stopped.set()
+        if self._thread is None:
+            self._close()  # bound, never served
+            return
+        self._http.shutdown()
+        self._thread.join()
+
+    def run(self) -> None:
+        """Start the server and block until :meth:`stop` is called.
+
+        :meth:`stop` may come from another thread or from a signal handler.
+        """
+        self.start()
+        try:
+            self._stopped.wait()
+        finally:
+            self.stop()
+
+    def __enter__(self) -> TokenServer:  # noqa: PYI034 -- Self needs Python 3.11
+        """Start the server.
+
+        Returns:
+            TokenServer: This server.
+        """
+        self.start()
+        return self
+
+    def __exit__(
+        self,
+        exc_type: type[BaseException] | None,
+        exc: BaseException | None,
+        traceback: TracebackType | None,
+    ) -> None:
+        """Stop the server."""
+        self.stop()
+
+    def token(self, profile: str) -> Token | None:
+        """Return a valid token for ``profile``, refreshing it if it has expired.
+
+        Args:
+            profile (str): Profile name.
+
+        Returns:
+            Token | None: The token, or None if the profile has no usable
+                cached token.
+
+        Raises:
+            TokenUnavailableError: If the token needs refreshing and pixiv
+                cannot be reached, or is failing.
+        """
+        issued = api.cached_token(profile, transport=self.transport, cache=self.cache)
+        if issued is not None and self.scheduler is not None:
+            self.scheduler.add(profile)
+        return issued
+
+    def _serve(self) -> None:
+        try:
+            self._http.serve_forever(poll_interval=0.1)  # how soon stop() is noticed
+        finally:
+            self._close()
+
+    def _close(self) -> None:
+        if self.scheduler is not None:
+            self.scheduler.stop()
+        self._http.server_close()
+        if isinstance(self.address, str):
+            Path(self.address).unlink(missing_ok=True)
+        if self._owns_transport:
+            self.transport.close()
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # keep-alive, so a worker can reuse its connection
+    # Buffer each response and send it in one write. Headers and body written
+    # apart stall a kept-alive connection for ~40 ms on Nagle's algorithm.
+    wbufsize = -1
+
+    def __init__(self, *args: Any, owner: TokenServer, check_host: bool) -> None:  # noqa: ANN401
+        # Set before the parent's __init__, which handles the request at once.
+        self.owner = owner
+        self.check_host = check_host
+        super().__init__(*args)
+
+    def do_GET(self) -> None:
+        if self.check_host and not _local_host(self.headers.get("Host", "")):
+            self._reply(HTTPStatus.FORBIDDEN, {"error": "the Host header must be an IP address or localhost"})
+            return
+        prefix, _, profile = self.path.partition("?")[0].partition("/token/")
+        if prefix or not _PROFILE_NAME.fullmatch(profile):
+            self._reply(HTTPStatus.NOT_FOUND, {"error": "expected GET /token/<profile>"})
+            return
+
+        try:
+            issued = self.owner.token(profile)
+        except TokenUnavailableError as exc:
+            self._reply(HTTPStatus.SERVICE_UNAVAILABLE, {"error": str(exc)})
+            return
+        except Exception as exc:  # noqa: BLE001 -- answer the worker instead of dropping its connection
+            self._reply(HTTPStatus.INTERNAL_SERVER_ERROR, {"error": f"{type(exc).__name__}: {exc}"})
+            return
+        if issued is None:
+            error = f"no usable token for '{profile}'; run: gppt login -p {profile}"
+            self._reply(HTTPStatus.NOT_FOUND, {"error": error})
+            return
+        self._reply(HTTPStatus.OK, _public(issued))
+
+    def _reply(self, status: HTTPStatus, body: dict[str, Any]) -> None:
+        payload = json.dumps(body, ensure_ascii=False).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        self.send_header("Cache-Control", "no-store")
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def address_string(self) -> str:
+        # A Unix socket peer has no address to show.
+        return self.client_address[0] if isinstance(self.client_address, tuple) else "unix"
+
+    def log_message(self, format: str, *args: object) -> None:  # noqa: A002 -- the parent's signature
+        """Stay quiet: one line per token request would drown everything else."""
+
+
+class _HTTPServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address: tuple[str, int], owner: TokenServer) -> None:
+        super().__init__(address, partial(_Handler, owner=owner, check_host=True))
+
+
+class _UnixHTTPServer(ThreadingMixIn, UnixStreamServer):
+    daemon_threads = True
+
+    def __init__(self, path: str, owner: TokenServer) -> None:
+        # Only the owner can open the socket, and no browser can reach it.
+        self.path = path
+        super().__init__(path, partial(_Handler, owner=owner, check_host=False))
+
+    def server_bind(self) -> None:
+        # Only the owner of the token caches may read from the socket. Nothing
+        # can connect before server_activate() listens, so chmod after bind
+        # leaves no window -- unlike the umask, which is shared by every thread.
+        super().server_bind()
+        Path(self.path).chmod(0o600)
+
+
+def _default_address() -> tuple[str, int] | Path:
+    return config.socket_path() if hasattr(socket, "AF_UNIX") else (DEFAULT_HOST, DEFAULT_PORT)
+
+
+def _bind(address: tuple[str, int] | str | Path, owner: TokenServer) -> _HTTPServer | _UnixHTTPServer:
+    if isinstance(address, tuple):
+        return _HTTPServer(address, owner)
+    path = Path(address)
+    if path.is_socket():
+        # Left behind by a server that did not shut down; refuse to take over a live one.
+        with socket.socket(socket.AF_UNIX) as probe:
+            try:
+                probe.connect(str(path))
+            except OSError:
+                path.unlink()
+            else:
+                msg = f"a server is already listening on {path}"
+                raise OSError(msg)
+    elif path.exists():
+        msg = f"{path} exists and is not a socket"
+        raise FileExistsError(msg)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    return _UnixHTTPServer(str(path), owner)
+
+
+def _local_host(host: str) -> bool:
+    """Whether a ``Host`` header names this machine by IP address or as ``localhost``.
+
+    A DNS rebinding attack reaches the server under the attacker's own domain
+    name, so any other name is refused.
+    """
+    hostname = urlsplit(f"//{host}").hostname
+    if hostname is None:
+        return False
+    if hostname == "localhost":
+        return True
+    try:
+        ipaddress.ip_address(hostname)
+    except ValueError:
+        return False
+    return True
+
+
+def _public(issued: Token) -> dict[str, Any]:
+    """What a worker needs from a token, without the refresh token."""
+    expires_at = issued.expiry
+    remaining = 0 if expires_at is None else max(0, int((expires_at - utc_now()).total_seconds()))
+    return {
+        "access_token": issued.access_token,
+        "expires_at": issued.expires_at,
+        "expires_in": remaining,
+        "user_id": issued.user_id,
+        "user_name": issued.user_name,
+        "user_account": issued.user_account,
+    }
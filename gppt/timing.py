@@ -0,0 +1,134 @@
+"""Time the phases of a login.
+
+A :class:`Trace` collects named spans -- "launch", "page load", "form fill"
+and so on -- from every thread taking part in one login, each stamped with
+its start and end relative to the trace's creation. Phases that overlap show
+up as overlapping spans, and :attr:`Trace.elapsed_s` is the critical path::
+
+    trace = Trace()
+    gppt.login(username, password, trace=trace)
+    print(trace.report())
+
+``on_span`` streams the spans out as they finish instead -- to a log or a
+metrics client, say -- so logins can be profiled in production::
+
+    trace = Trace(on_span=lambda span: log.info("%s took %.3fs", span.name, span.duration_s))
+
+Passing no trace costs nothing: :func:`span` then hands back a shared no-op
+context manager.
+"""
+
+from __future__ import annotations
+
+import threading
+from contextlib import contextmanager, nullcontext
+from dataclasses import dataclass
+from time import perf_counter
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from collections.abc import Callable, Generator
+    from contextlib import AbstractContextManager
+
+_UNTRACED: AbstractContextManager[None] = nullcontext()
+
+
+@dataclass(frozen=True)
+class Span:
+    """One timed phase, in seconds since its trace began."""
+
+    name: str
+    start_s: float
+    end_s: float
+    thread: str
+
+    @property
+    def duration_s(self) -> float:
+        """How long the phase took.
+
+        Returns:
+            float: Seconds.
+        """
+        return self.end_s - self.start_s
+
+
+class Trace:
+    """Spans recorded during one login, from any number of threads."""
+
+    def __init__(self, *, on_span: Callable[[Span], None] | None = None) -> None:
+        """Start the clock.
+
+        Args:
+            on_span (Callable[[Span], None] | None): Called with every span as
+                it finishes, from the thread that recorded it.
+        """
+        self.on_span = on_span
+        self._origin = perf_counter()
+        self._spans: list[Span] = []
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def span(self, name: str) -> Generator[None]:
+        """Time the enclosed block as the phase ``name``, even if it raises.
+
+        Args:
+            name (str): Phase name.
+
+        Yields:
+            None: Nothing; the span is recorded on exit.
+        """
+        start = perf_counter() - self._origin
+        try:
+            yield
+        finally:
+            finished = Span(name, start, perf_counter() - self._origin, threading.current_thread().name)
+            with self._lock:
+                self._spans.append(finished)
+            if self.on_span is not None:
+                self.on_span(finished)
+
+    @property
+    def spans(self) -> list[Span]:
+        """The finished spans, by start time.
+
+        Returns:
+            list[Span]: A snapshot of the spans.
+        """
+        with self._lock:
+            return sorted(self._spans, key=lambda span: span.start_s)
+
+    @property
+    def elapsed_s(self) -> float:
+        """When the last span ended: the login's critical path.
+
+        Returns:
+            float: Seconds since the trace began, or 0.0 without spans.
+        """
+        with self._lock:
+            return max((span.end_s for span in self._spans), default=0.0)
+
+    def report(self) -> str:
+        """Format the spans as a timeline, one per line, then the total.
+
+        Returns:
+            str: The timeline.
+        """
+        lines = [
+            f"{span.start_s * 1000:8.0f} ms {span.duration_s * 1000:+8.0f} ms  {span.name} [{span.thread}]"
+            for span in self.spans
+        ]
+        lines.append(f"{self.elapsed_s * 1000:8.0f} ms  total")
+        return "\n".join(lines)
+
+
+def span(trace: Trace | None, name: str) -> AbstractContextManager[None]:
+    """Time a phase on ``trace``, or do nothing without one.
+
+    Args:
+        trace (Trace | None): Trace to record on.
+        name (str): Phase name.
+
+    Returns:
+        AbstractContextManager[None]: The span to enter.
+    """
+    return _UNTRACED if trace is None else trace.span(name)
@@ -3,29 +3,41 @@
 from __future__ import annotations
 
 import json
+import time
 from dataclasses import asdict, dataclass
 from datetime import datetime, timedelta, timezone
-from typing import TYPE_CHECKING, Any, Final, cast
+from functools import lru_cache
+from typing import TYPE_CHECKING, Any, Final, NoReturn, cast
 from urllib.request import getproxies
 
 import requests
+from urllib3.exceptions import NewConnectionError
 
 from gppt import config
-from gppt.consts import AUTH_TOKEN_URL, CALLBACK_URI, CLIENT_ID, CLIENT_SECRET, USER_AGENT
+from gppt.consts import CLIENT_ID, CLIENT_SECRET, USER_AGENT
+from gppt.deadline import DeadlineExceededError
+from gppt.endpoints import Endpoints
+from gppt.retry import DEFAULT_POLICY, RETRYABLE_STATUSES, Permit, RetryPolicy, breaker_for, retry_after
 
 if TYPE_CHECKING:
     from pathlib import Path
 
     from gppt.browser import Authorization
+    from gppt.deadline import Deadline
     from gppt.model_types import LoginInfo
+    from gppt.transport import Transport
 
-TIMEOUT: Final = 10.0
+# A connection pixiv does not accept within CONNECT_TIMEOUT will not be
+# accepted; an answer can take longer to come once the request is in.
+CONNECT_TIMEOUT: Final = 3.05  # just over a multiple of the 3 s TCP retransmission window
+READ_TIMEOUT: Final = 10.0
+TIMEOUT: Final = (CONNECT_TIMEOUT, READ_TIMEOUT)  # the pair under its old name, for existing callers
 
 # Treat a token that is about to lapse as already expired, so a cached one is
 # never handed out with only seconds of life left.
 EXPIRY_MARGIN: Final = timedelta(minutes=1)
 
-_HEADERS: Final[dict[str, str]] = {
+HEADERS: Final[dict[str, str]] = {
     "user-agent": USER_AGENT,
     "app-os-version": "14.6",
     "app-os": "ios",
@@ -36,6 +48,14 @@ class TokenError(RuntimeError):
     """Raised when the pixiv OAuth endpoint does not return a token."""
 
 
+class TokenUnavailableError(TokenError):
+    """Raised when the pixiv OAuth endpoint cannot be reached, or keeps failing.
+
+    Unlike a plain :class:`TokenError`, this says nothing about the refresh
+    token or the authorization code: the same request may succeed later.
+    """
+
+
 @dataclass
 class Token:
     """A pixiv OAuth token pair with its absolute expiry time."""
@@ -55,11 +75,29 @@ class Token:
         Returns:
             bool: True if the token should no longer be used.
         """
-        try:
-            expires_at = datetime.fromisoformat(self.expires_at)
-        except ValueError:
-            return True
-        return _now() + EXPIRY_MARGIN >= expires_at
+        return self.expires_within(EXPIRY_MARGIN)
+
+    def expires_within(self, margin: timedelta) -> bool:
+        """Whether the access token lapses within ``margin`` from now.
+
+        Args:
+            margin (timedelta): How far ahead to look.
+
+        Returns:
+            bool: True if the token will have lapsed by then, or its expiry
+                time is unreadable.
+        """
+        expires_at = self.expiry
+        return expires_at is None or utc_now() + margin >= expires_at
+
+    @property
+    def expiry(self) -> datetime | None:
+        """When the access token lapses, parsed from ``expires_at``.
+
+        Returns:
+            datetime | None: The expiry time, or None if it is unreadable.
+        """
+        return _parse_expiry(self.expires_at)
 
     @classmethod
     def from_response(cls, response: LoginInfo) -> Token:
@@ -85,57 +123,76 @@ class Token:
             access_token=body["access_token"],
             refresh_token=body.get("refresh_token", ""),
             expires_in=expires_in,
-            expires_at=(_now() + timedelta(seconds=expires_in)).isoformat(),
+            expires_at=(utc_now() + timedelta(seconds=expires_in)).isoformat(),
             user_id=str(user.get("id", "")),
             user_name=str(user.get("name", "")),
             user_account=str(user.get("account", "")),
         )
 
 
-def exchange(authorization: Authorization) -> Token:
+def exchange(
+    authorization: Authorization,
+    *,
+    transport: Transport | None = None,
+    endpoints: Endpoints | None = None,
+    retry: RetryPolicy | None = None,
+    deadline: Deadline | None = None,
+) -> Token:
     """Exchange an authorization code for a token pair.
 
     Args:
         authorization (Authorization): Code and PKCE verifier from the browser login.
+        transport (Transport | None): Pooled session to send the request over.
+            None makes a one-shot request.
+        endpoints (Endpoints | None): Where to send it. None means pixiv,
+            unless the environment says otherwise.
+        retry (RetryPolicy | None): How to retry a failed request. None
+            means the transport's policy, or the default one.
+        deadline (Deadline | None): Give up, retries and all, when it passes.
 
     Returns:
         Token: The issued token.
 
     Raises:
         TokenError: If pixiv rejects the exchange.
+        TokenUnavailableError: If pixiv cannot be reached, or is failing.
+        DeadlineExceededError: If ``deadline`` passes first.
     """
-    return Token.from_response(
-        _post(
-            {
-                "code": authorization.code,
-                "code_verifier": authorization.code_verifier,
-                "grant_type": "authorization_code",
-                "redirect_uri": CALLBACK_URI,
-            },
-        ),
-    )
-
-
-def refresh(refresh_token: str) -> Token:
+    endpoints = endpoints or Endpoints.from_env()
+    form = exchange_form(authorization, endpoints.callback_uri)
+    return Token.from_response(_post(form, transport, endpoints, retry, deadline))
+
+
+def refresh(
+    refresh_token: str,
+    *,
+    transport: Transport | None = None,
+    endpoints: Endpoints | None = None,
+    retry: RetryPolicy | None = None,
+    deadline: Deadline | None = None,
+) -> Token:
     """Obtain a fresh token pair from a refresh token.
 
     Args:
         refresh_token (str): Refresh token from a previous login.
+        transport (Transport | None): Pooled session to send the request over.
+            None makes a one-shot request.
+        endpoints (Endpoints | None): Where to send it. None means pixiv,
+            unless the environment says otherwise.
+        retry (RetryPolicy | None): How to retry a failed request. None
+            means the transport's policy, or the default one.
+        deadline (Deadline | None): Give up, retries and all, when it passes.
 
     Returns:
         Token: The issued token.
 
     Raises:
         TokenError: If pixiv rejects the refresh token.
+        TokenUnavailableError: If pixiv cannot be reached, or is failing.
+        DeadlineExceededError: If ``deadline`` passes first.
     """
-    return Token.from_response(
-        _post(
-            {
-                "grant_type": "refresh_token",
-                "refresh_token": refresh_token,
-            },
-        ),
-    )
+    form = refresh_form(refresh_token)
+    return Token.from_response(_post(form, transport, endpoints or Endpoints.from_env(), retry, deadline))
 
 
 def load(profile: str) -> Token | None:
@@ -162,41 +219,312 @@ def load(profile: str) -> Token | None:
         return None
 
 
-def save(profile: str, token: Token) -> Path:
+def save(profile: str, token: Token, *, fsync: bool = False) -> Path:
     """Write the profile's token cache.
 
+    The file is replaced atomically: a concurrent :func:`load` reads either
+    the previous token or this one, never a partial write.
+
     Args:
         profile (str): Profile name.
         token (Token): Token to store.
+        fsync (bool): Flush the cache to disk before returning.
 
     Returns:
         Path: Path the token was written to.
     """
-    config.CONFIG_DIR.mkdir(parents=True, exist_ok=True)
     path = config.token_path(profile)
-    with path.open("w", encoding="utf-8") as fp:
-        json.dump(asdict(token), fp, indent=2, ensure_ascii=False)
-        fp.write("\n")
     # Anyone holding these can act as the account -- keep them private.
-    path.chmod(0o600)
+    config.write_private_file(path, json.dumps(asdict(token), indent=2, ensure_ascii=False) + "\n", fsync=fsync)
     return path
 
 
-def _now() -> datetime:
+def utc_now() -> datetime:
+    """Return the current time in UTC, the clock every token expiry is compared with.
+
+    Returns:
+        datetime: Now, timezone-aware.
+    """
     return datetime.now(tz=timezone.utc)
 
 
-def _post(payload: dict[str, str]) -> LoginInfo:
-    response = requests.post(
-        AUTH_TOKEN_URL,
-        data={
-            "client_id": CLIENT_ID,
-            "client_secret": CLIENT_SECRET,
-            "include_policy": "true",
-            **payload,
+@lru_cache(maxsize=256)
+def _parse_expiry(expires_at: str) -> datetime | None:
+    """Parse an ``expires_at`` once, however often it is checked; None if unreadable."""
+    try:
+        return datetime.fromisoformat(expires_at)
+    except ValueError:
+        return None
+
+
+def exchange_form(authorization: Authorization, callback_uri: str) -> dict[str, str]:
+    """Build the ``/auth/token`` form that exchanges an authorization code.
+
+    Args:
+        authorization (Authorization): Code and PKCE verifier from the browser login.
+        callback_uri (str): The redirect the code was issued for.
+
+    Returns:
+        dict[str, str]: The form fields, client credentials included.
+    """
+    return _form(
+        {
+            "code": authorization.code,
+            "code_verifier": authorization.code_verifier,
+            "grant_type": "authorization_code",
+            "redirect_uri": callback_uri,
+        },
+    )
+
+
+def refresh_form(refresh_token: str) -> dict[str, str]:
+    """Build the ``/auth/token`` form that redeems a refresh token.
+
+    Args:
+        refresh_token (str): Refresh token from a previous login.
+
+    Returns:
+        dict[str, str]: The form fields, client credentials included.
+    """
+    return _form(
+        {
+            "grant_type": "refresh_token",
+            "refresh_token": refresh_token,
         },
-        headers=_HEADERS,
-        proxies=getproxies(),
-        timeout=TIMEOUT,
     )
-    return cast("LoginInfo", response.json())
+
+
+class TokenRequest:
+    """The tries of one ``/auth/token`` request, without the I/O.
+
+    Both :func:`refresh` here and :mod:`gppt.aio` send the request their own
+    way and leave every decision to this: whether the breaker lets a try
+    through, its timeouts, which answers and errors are worth another try,
+    how long to wait before it, and when to give up::
+
+        request = TokenRequest(url, policy, deadline)
+        while True:
+            timeouts = request.start()
+            try:
+                response = send(request.url, timeouts)
+            except ConnectionRefusedError as exc:
+                request.unreachable(exc)
+            except TimeoutError as exc:
+                request.lost(exc)  # raises: pixiv may have redeemed the grant
+            else:
+                if (body := request.answered(response)) is not None:
+                    return body
+            sleep(request.backoff())
+    """
+
+    def __init__(self, url: str, policy: RetryPolicy = DEFAULT_POLICY, deadline: Deadline | None = None) -> None:
+        """Prepare the first try.
+
+        Args:
+            url (str): Token endpoint.
+            policy (RetryPolicy): How often, and how patiently, to try.
+            deadline (Deadline | None): Give up, retries and all, when it passes.
+        """
+        self.url = url
+        self.policy = policy
+        self.deadline = deadline
+        self.breaker = breaker_for(url)
+        self.attempt = 0
+        self._permit = Permit()
+        self._failure = ""
+        self._retry_after: float | None = None
+
+    def start(self) -> tuple[float, float]:
+        """Begin the next try.
+
+        Returns:
+            tuple[float, float]: Its ``(connect, read)`` timeouts, in seconds.
+
+        Raises:
+            TokenUnavailableError: If the endpoint's circuit breaker is open.
+            DeadlineExceededError: If the deadline has passed.
+        """
+        timeouts = self._timeouts()
+        permit = self.breaker.allow()
+        if permit is None:
+            msg = (
+                f"{self.url} failed {self.breaker.threshold} times in a row; "
+                f"not sending more requests for {self.breaker.retry_in:.0f}s."
+            )
+            raise TokenUnavailableError(msg)
+        self._permit = permit
+        self.attempt += 1
+        self._retry_after = None
+        return timeouts
+
+    def answered(self, response: Any) -> LoginInfo | None:  # noqa: ANN401 -- a requests or an httpx response
+        """Report the endpoint's answer.
+
+        Args:
+            response (Any): The ``requests`` or ``httpx`` response.
+
+        Returns:
+            LoginInfo | None: The decoded body, or None if the answer is
+                worth another try (HTTP 429 or a 5xx).
+
+        Raises:
+            TokenError: If the body is not JSON.
+            DeadlineExceededError: If the answer came only after the deadline.
+        """
+        if response.status_code not in RETRYABLE_STATUSES:
+            self.breaker.record_success()
+            self._check_in_time(f"HTTP {response.status_code}")
+            return _decode(response)
+        self._failure = f"HTTP {response.status_code}"
+        self._retry_after = retry_after(response.headers)
+        self.breaker.record_failure(self._permit)
+        self._check_in_time(self._failure)
+        return None
+
+    def unreachable(self, exc: Exception) -> None:
+        """Report a request that never reached the endpoint, such as a refused connection: worth another try.
+
+        Args:
+            exc (Exception): What the HTTP client raised.
+
+        Raises:
+            DeadlineExceededError: If the deadline has passed meanwhile.
+        """
+        self._failure = f"{type(exc).__name__}: {exc}"
+        if self.deadline is not None and self.deadline.expired:
+            self.breaker.release(self._permit)  # our budget ran out, which says nothing about pixiv
+            raise _out_of_time(self.url, self._failure) from exc
+        self.breaker.record_failure(self._permit)
+
+    def lost(self, exc: Exception) -> NoReturn:
+        """Report a request that may have reached the endpoint, but got no answer, such as a read timeout.
+
+        Every grant can be redeemed once: an authorization code is single-use,
+        and pixiv may rotate a refresh token as it redeems it. Another try
+        could only come back as ``invalid_grant``, so there is none.
+
+        Args:
+            exc (Exception): What the HTTP client raised.
+
+        Raises:
+            DeadlineExceededError: If the deadline has passed meanwhile.
+            TokenUnavailableError: Otherwise.
+        """
+        self.unreachable(exc)  # counted like any other failure, unless the deadline ran out
+        msg = f"{self.url} did not answer ({self._failure}); not sent again, as pixiv may have redeemed it already."
+        raise TokenUnavailableError(msg) from exc
+
+    def broken(self) -> None:
+        """Report a request that failed in a way no retry fixes, before re-raising it."""
+        self.breaker.record_failure(self._permit)  # a trial request must report back either way
+
+    def interrupted(self) -> None:
+        """Report a request abandoned before any answer, such as by Ctrl-C, before re-raising.
+
+        It says nothing about the endpoint, so a trial request is given back
+        for the next caller instead of keeping the breaker open for good.
+        """
+        self.breaker.release(self._permit)
+
+    def _timeouts(self) -> tuple[float, float]:
+        """The try's ``(connect, read)`` timeouts: together, never more than what is left of the deadline."""
+        if self.deadline is None:
+            return CONNECT_TIMEOUT, READ_TIMEOUT
+        left = self.deadline.cap(self.deadline.remaining_s, "the token request")
+        connect = min(CONNECT_TIMEOUT, left / 2)  # a short budget is split, not all spent on connecting
+        return connect, min(READ_TIMEOUT, left - connect)
+
+    def _check_in_time(self, answer: str) -> None:
+        """Raise if the answer came too late.
+
+        ``requests`` restarts its read timeout with every chunk, so an answer
+        trickling in can take longer than the timeouts suggest.
+        """
+        if self.deadline is not None and self.deadline.expired:
+            raise _out_of_time(self.url, f"{answer}, too late")
+
+    def backoff(self) -> float:
+        """Return how long to wait before the next try, after a failed one.
+
+        Returns:
+            float: Seconds to sleep.
+
+        Raises:
+            TokenUnavailableError: If that was the last try.
+            DeadlineExceededError: If the wait would outlast the deadline.
+        """
+        if self.attempt >= self.policy.attempts:
+            tries = "1 try" if self.attempt == 1 else f"{self.attempt} tries"
+            msg = f"{self.url} failed after {tries} (last: {self._failure})."
+            raise TokenUnavailableError(msg)
+        pause = self.policy.delay(self.attempt, retry_after=self._retry_after)
+        if self.deadline is not None and pause >= self.deadline.remaining_s:
+            raise _out_of_time(self.url, self._failure)
+        return pause
+
+
+def _form(payload: dict[str, str]) -> dict[str, str]:
+    """Add the client credentials every ``/auth/token`` request carries."""
+    return {
+        "client_id": CLIENT_ID,
+        "client_secret": CLIENT_SECRET,
+        "include_policy": "true",
+        **payload,
+    }
+
+
+def _post(
+    form: dict[str, str],
+    transport: Transport | None,
+    endpoints: Endpoints,
+    retry: RetryPolicy | None = None,
+    deadline: Deadline | None = None,
+) -> LoginInfo:
+    """POST ``form`` to the token endpoint, retrying what may succeed on another try."""
+    request = TokenRequest(
+        endpoints.auth_token_url,
+        retry or (DEFAULT_POLICY if transport is None else transport.retry),
+        deadline,
+    )
+    send = requests.post if transport is None else transport.post
+    while True:
+        timeout = request.start()
+        try:
+            response = send(request.url, data=form, headers=HEADERS, proxies=getproxies(), timeout=timeout)
+        except (requests.ConnectionError, requests.Timeout) as exc:
+            if _never_sent(exc):
+                request.unreachable(exc)
+            else:
+                request.lost(exc)
+        except requests.RequestException:
+            request.broken()
+            raise
+        except BaseException:
+            request.interrupted()
+            raise
+        else:
+            if (body := request.answered(response)) is not None:
+                return body
+        time.sleep(request.backoff())
+
+
+def _never_sent(exc: requests.RequestException) -> bool:
+    """Whether ``exc`` stopped the request before any of it could reach the endpoint."""
+    if isinstance(exc, (requests.ConnectTimeout, requests.exceptions.ProxyError, requests.exceptions.SSLError)):
+        return True
+    # A refused connection or an unknown host: urllib3 gave up before sending.
+    reason = getattr(exc.args[0], "reason", None) if exc.args else None
+    return isinstance(reason, NewConnectionError)
+
+
+def _decode(response: Any) -> LoginInfo:  # noqa: ANN401 -- a requests or an httpx response
+    """The JSON body of an answer from the token endpoint."""
+    try:
+        return cast("LoginInfo", response.json())
+    except ValueError as exc:
+        msg = f"pixiv answered HTTP {response.status_code} without JSON: {response.text[:200]!r}"
+        raise TokenError(msg) from exc
+
+
+def _out_of_time(url: str, failure: str) -> DeadlineExceededError:
+    return DeadlineExceededError(f"Ran out of the deadline before {url} answered (last: {failure}).")
@@ -0,0 +1,101 @@
+"""HTTP transport for the pixiv OAuth endpoint.
+
+By default every request is one-shot: a fresh connection (and TLS handshake)
+per call, exactly as ``requests.post`` does it. A :class:`Transport` keeps a
+pooled ``requests.Session`` open instead, so a process refreshing many
+profiles pays for the handshake once per connection rather than per call::
+
+    with Transport(pool_size=8) as transport:
+        for refresh_token in refresh_tokens:
+            gppt.refresh(refresh_token, transport=transport)
+"""
+
+from __future__ import annotations
+
+from typing import TYPE_CHECKING, Any, Final
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from gppt.retry import DEFAULT_POLICY, RetryPolicy
+
+if TYPE_CHECKING:
+    from types import TracebackType
+
+DEFAULT_POOL_SIZE: Final = 10
+
+
+class Transport:
+    """A pooled, optionally keep-alive HTTP session shared between token requests.
+
+    A transport is safe to share between threads: ``requests`` hands each
+    concurrent request its own connection from the pool.
+    """
+
+    def __init__(
+        self,
+        *,
+        pool_size: int = DEFAULT_POOL_SIZE,
+        keep_alive: bool = True,
+        retry: RetryPolicy = DEFAULT_POLICY,
+    ) -> None:
+        """Open a session.
+
+        Args:
+            pool_size (int): Connections kept open per host. Size it to the
+                number of threads making requests at once.
+            keep_alive (bool): Reuse connections between requests. False asks
+                the server to close each one, which still shares the session's
+                configuration but not its sockets.
+            retry (RetryPolicy): How token requests sent over this transport
+                retry a failure. ``RetryPolicy(attempts=1)`` never retries.
+
+        Raises:
+            ValueError: If ``pool_size`` is not positive.
+        """
+        if pool_size < 1:
+            msg = f"pool_size must be at least 1, got {pool_size}."
+            raise ValueError(msg)
+
+        self.pool_size = pool_size
+        self.keep_alive = keep_alive
+        self.retry = retry
+        self._session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, pool_block=True)
+        self._session.mount("https://", adapter)
+        self._session.mount("http://", adapter)
+        if not keep_alive:
+            self._session.headers["Connection"] = "close"
+
+    def post(self, url: str, **kwargs: Any) -> requests.Response:  # noqa: ANN401
+        """Send a POST request over the pooled session.
+
+        Args:
+            url (str): Request URL.
+            **kwargs (Any): Passed through to ``requests.Session.post``.
+
+        Returns:
+            requests.Response: The response.
+        """
+        return self._session.post(url, **kwargs)
+
+    def close(self) -> None:
+        """Close every pooled connection."""
+        self._session.close()
+
+    def __enter__(self) -> Transport:  # noqa: PYI034 -- Self needs Python 3.11
+        """Return the transport itself, to be closed on exit.
+
+        Returns:
+            Transport: This transport.
+        """
+        return self
+
+    def __exit__(
+        self,
+        exc_type: type[BaseException] | None,
+        exc: BaseException | None,
+        traceback: TracebackType | None,
+    ) -> None:
+        """Close the transport."""
+        self.close()
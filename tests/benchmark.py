@@ -0,0 +1,188 @@
+"""Offline benchmarks for gppt's hot paths, against :mod:`tests.mock_pixiv`.
+
+Run from the repository root::
+
+    python -m tests.benchmark                  # everything
+    python -m tests.benchmark -n 500 --runs-browser 10
+    python -m tests.benchmark --skip-browser   # no Chromium needed
+
+Each benchmark prints its latency percentiles and its throughput, one
+operation after another on a single thread, so a regression shows up as a
+number rather than a feeling. Tokens are written to a temporary config
+directory; nothing reaches pixiv.
+"""
+
+from __future__ import annotations
+
+import argparse
+import http.client
+import statistics
+import sys
+import tempfile
+import time
+from contextlib import ExitStack
+from dataclasses import dataclass
+from pathlib import Path
+from typing import TYPE_CHECKING
+from unittest import mock
+
+import gppt
+from gppt import browser, config, token
+from gppt.cache import TokenCache
+from gppt.server import TokenServer
+from gppt.transport import Transport
+from tests.mock_pixiv import MockPixiv
+
+if TYPE_CHECKING:
+    from collections.abc import Callable, Iterator
+
+USERNAME = "bench"
+PASSWORD = "bench-password"
+
+
+@dataclass
+class Result:
+    """The timings of one benchmark."""
+
+    name: str
+    samples: list[float]  # seconds per operation
+    wall_s: float  # for all of them, overhead between operations included
+
+    def percentile(self, q: int) -> float:
+        """The ``q``-th percentile latency in seconds."""
+        if len(self.samples) == 1:
+            return self.samples[0]
+        return statistics.quantiles(self.samples, n=100, method="inclusive")[q - 1]
+
+    @property
+    def throughput(self) -> float:
+        """Operations per second."""
+        return len(self.samples) / self.wall_s if self.wall_s else float("inf")
+
+
+def measure(name: str, operation: Callable[[], object], *, runs: int, warmup: int = 1) -> Result:
+    """Run ``operation`` ``warmup`` times untimed, then ``runs`` times timed."""
+    for _ in range(warmup):
+        operation()
+    samples = []
+    started = time.perf_counter()
+    for _ in range(runs):
+        before = time.perf_counter()
+        operation()
+        samples.append(time.perf_counter() - before)
+    return Result(name, samples, time.perf_counter() - started)
+
+
+def report(results: list[Result]) -> str:
+    """Format ``results`` as a table, latencies in milliseconds."""
+    header = f"{'benchmark':<32} {'runs':>6} {'p50 ms':>9} {'p90 ms':>9} {'p99 ms':>9} {'max ms':>9} {'ops/s':>10}"
+    lines = [header, "-" * len(header)]
+    lines.extend(
+        f"{result.name:<32} {len(result.samples):>6} "
+        f"{result.percentile(50) * 1000:>9.3f} {result.percentile(90) * 1000:>9.3f} "
+        f"{result.percentile(99) * 1000:>9.3f} {max(result.samples) * 1000:>9.3f} "
+        f"{result.throughput:>10.1f}"
+        for result in results
+    )
+    return "\n".join(lines)
+
+
+def bench_refresh(*, runs: int) -> Iterator[Result]:
+    """``token.refresh`` over a fresh connection each time, then over a pooled one."""
+    yield measure("token.refresh (one-shot)", lambda: token.refresh("rt"), runs=runs)
+    with Transport() as transport:
+        yield measure("token.refresh (Transport)", lambda: token.refresh("rt", transport=transport), runs=runs)
+
+
+def bench_cache_file(*, runs: int) -> Iterator[Result]:
+    """Reading and writing a profile's token cache."""
+    issued = token.refresh("rt")
+    yield measure("token.save", lambda: token.save("bench", issued), runs=runs)
+    yield measure("token.load", lambda: token.load("bench"), runs=runs)
+
+
+def bench_get_token(*, runs: int) -> Iterator[Result]:
+    """``get_token`` finding a valid cached token, from the file and from memory."""
+    token.save("bench", token.refresh("rt"))
+    yield measure("get_token (cache hit)", lambda: gppt.get_token("bench"), runs=runs)
+    cache = TokenCache()
+    yield measure("get_token (TokenCache hit)", lambda: gppt.get_token("bench", cache=cache), runs=runs)
+
+
+def bench_server(*, runs: int) -> Iterator[Result]:
+    """``GET /token/<profile>`` from a :class:`~gppt.server.TokenServer`, on one kept-alive connection."""
+    token.save("bench", token.refresh("rt"))
+    with TokenServer(("127.0.0.1", 0), refresh_ahead=False) as server:
+        address = server.address
+        assert isinstance(address, tuple)
+        connection = http.client.HTTPConnection(*address, timeout=10)
+
+        def fetch() -> None:
+            connection.request("GET", "/token/bench")
+            connection.getresponse().read()
+
+        try:
+            yield measure("TokenServer GET /token", fetch, runs=runs)
+        finally:
+            connection.close()
+
+
+def bench_browser(*, runs: int) -> Iterator[Result]:
+    """A whole ``fetch_authorization``: launch, page load, form fill, redirect."""
+
+    def login() -> None:
+        browser.fetch_authorization(USERNAME, PASSWORD, headless=True, install_browser=False, typing="instant")
+
+    yield measure("fetch_authorization", login, runs=runs)
+
+
+def chromium_available() -> bool:
+    """Whether Playwright's Chromium is on disk, without installing it."""
+    from playwright.sync_api import sync_playwright  # noqa: PLC0415 -- only when a browser run is asked for
+
+    with sync_playwright() as playwright:
+        return Path(playwright.chromium.executable_path).exists()
+
+
+def run(*, runs: int, browser_runs: int, skip_browser: bool = False) -> list[Result]:
+    """Run every benchmark against a fresh mock pixiv and config directory."""
+    results: list[Result] = []
+    with ExitStack() as stack:
+        config_dir = stack.enter_context(tempfile.TemporaryDirectory(prefix="gppt-bench-"))
+        stack.enter_context(mock.patch.object(config, "CONFIG_DIR", Path(config_dir)))
+        pixiv = stack.enter_context(MockPixiv(username=USERNAME, password=PASSWORD))
+        stack.enter_context(pixiv.patch())
+
+        results.extend(bench_refresh(runs=runs))
+        results.extend(bench_cache_file(runs=runs))
+        results.extend(bench_get_token(runs=runs))
+        results.extend(bench_server(runs=runs))
+        if skip_browser:
+            return results
+        if chromium_available():
+            results.extend(bench_browser(runs=browser_runs))
+        else:
+            print("Skipping fetch_authorization: Chromium is not installed.", file=sys.stderr)  # noqa: T201
+    return results
+
+
+def main(argv: list[str] | None = None) -> int:
+    """Run the benchmarks and print the table."""
+    parser = argparse.ArgumentParser(prog="python -m tests.benchmark", description=__doc__.splitlines()[0])
+    parser.add_argument("-n", "--runs", type=int, default=200, help="Timed runs per benchmark (default: 200).")
+    parser.add_argument(
+        "--runs-browser",
+        type=int,
+        default=5,
+        help="Timed runs of the browser login (default: 5).",
+    )
+    parser.add_argument("--skip-browser", action="store_true", help="Leave out the browser login.")
+    args = parser.parse_args(argv)
+
+    results = run(runs=args.runs, browser_runs=args.runs_browser, skip_browser=args.skip_browser)
+    print(report(results))  # noqa: T201
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
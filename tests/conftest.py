@@ -0,0 +1,33 @@
+from __future__ import annotations
+
+from datetime import datetime, timedelta, timezone
+from typing import TYPE_CHECKING
+
+import pytest
+
+from gppt import config, token
+
+if TYPE_CHECKING:
+    from pathlib import Path
+
+
+def make_token(access_token: str = "at", *, seconds: float = 3600) -> token.Token:
+    """A token lapsing ``seconds`` from now, whose refresh token is ``rt-<access_token>``."""
+    return token.Token(
+        access_token=access_token,
+        refresh_token=f"rt-{access_token}",
+        expires_in=int(seconds),
+        expires_at=(datetime.now(tz=timezone.utc) + timedelta(seconds=seconds)).isoformat(),
+        user_name="Me",
+        user_account="me",
+    )
+
+
+@pytest.fixture
+def config_dir(monkeypatch: pytest.MonkeyPatch, tmp_path: Path) -> Path:
+    """An empty config directory, with no credentials in the environment."""
+    monkeypatch.setattr(config, "CONFIG_DIR", tmp_path)
+    monkeypatch.delenv(config.USERNAME_ENV, raising=False)
+    monkeypatch.delenv(config.PASSWORD_ENV, raising=False)
+    monkeypatch.delenv(config.TOTP_SECRET_ENV, raising=False)
+    return tmp_path
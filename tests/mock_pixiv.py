@@ -0,0 +1,266 @@
+"""A local stand-in for the parts of pixiv that gppt talks to.
+
+:class:`MockPixiv` serves, on one loopback port:
+
+* ``GET /web/v1/login`` -- a static login page with the username, password,
+  one-time-code and submit elements gppt's browser login looks for;
+* ``POST /login`` -- checks what that page submits, asks for a TOTP code when
+  the account has a secret, and answers with the redirect;
+* ``GET /post-redirect`` -- hands the authorization code to the
+  ``pixiv://`` deep link, as pixiv does;
+* ``POST /auth/token`` -- issues numbered tokens for an authorization code
+  (checking its PKCE verifier) or a refresh token. ``rt-revoked`` is refused,
+  and the statuses queued in :attr:`MockPixiv.failures` are served first.
+
+:attr:`MockPixiv.endpoints` points a call at it, and :meth:`MockPixiv.patch`
+the whole process, through the ``GPPT_*`` endpoint variables, so tests and
+benchmarks run offline::
+
+    with MockPixiv(username="me", password="pw") as pixiv:
+        gppt.login("me", "pw", endpoints=pixiv.endpoints)
+"""
+
+from __future__ import annotations
+
+import json
+import os
+import threading
+from base64 import urlsafe_b64encode
+from contextlib import contextmanager
+from functools import partial
+from hashlib import sha256
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import TYPE_CHECKING, Any, Final
+from unittest import mock
+from urllib.parse import parse_qs, urlencode, urlsplit
+
+import pyotp
+
+from gppt.endpoints import ENV, Endpoints
+
+if TYPE_CHECKING:
+    from collections.abc import Generator
+    from types import TracebackType
+
+REVOKED: Final = "rt-revoked"
+
+LOGIN_PAGE: Final = """<!doctype html>
+<html lang="en">
+<head><meta charset="utf-8"><title>pixiv login (mock)</title></head>
+<body>
+<form id="login">
+  <input type="text" name="username" autocomplete="username">
+  <input type="password" name="password" autocomplete="current-password">
+  <div id="otp"></div>
+  <p id="error"></p>
+  <button type="submit">Log In</button>
+</form>
+<script>
+const form = document.getElementById("login");
+const challenge = new URLSearchParams(location.search).get("code_challenge");
+form.addEventListener("submit", async (event) => {
+  event.preventDefault();
+  const fields = Object.fromEntries(new FormData(form));
+  const response = await fetch("/login", {
+    method: "POST",
+    headers: {"Content-Type": "application/json"},
+    body: JSON.stringify({...fields, code_challenge: challenge}),
+  });
+  const reply = await response.json();
+  if (reply.next === "otp") {
+    document.getElementById("otp").innerHTML = '<input type="text" name="otp" autocomplete="one-time-code">';
+  } else if (reply.next) {
+    location.href = reply.next;
+  } else {
+    document.getElementById("error").textContent = reply.error;
+  }
+});
+</script>
+</body>
+</html>
+"""
+
+REDIRECT_PAGE: Final = """<!doctype html>
+<html lang="en">
+<head><meta charset="utf-8"><title>Redirecting</title></head>
+<body><script>location.href = {deep_link};</script></body>
+</html>
+"""
+
+
+class MockPixiv(ThreadingHTTPServer):
+    """pixiv's login page and ``/auth/token`` on a loopback port."""
+
+    daemon_threads = True
+
+    def __init__(self, *, username: str = "", password: str = "", totp_secret: str = "") -> None:
+        super().__init__(("127.0.0.1", 0), partial(_Handler, pixiv=self))
+        self.username = username
+        self.password = password
+        self.totp_secret = totp_secret
+        self.refresh_tokens: list[str] = []  # every refresh token presented, in order
+        self.failures: list[int] = []  # statuses /auth/token answers with, one per request, before working
+        self.lock = threading.Lock()
+        self._challenges: dict[str, str] = {}  # authorization code -> PKCE challenge
+        self._issued = 0
+        self._thread: threading.Thread | None = None
+
+    @property
+    def url(self) -> str:
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+    @property
+    def auth_token_url(self) -> str:
+        return f"{self.url}/auth/token"
+
+    @property
+    def login_url(self) -> str:
+        return f"{self.url}/web/v1/login"
+
+    @property
+    def redirect_uri(self) -> str:
+        return f"{self.url}/post-redirect"
+
+    @property
+    def endpoints(self) -> Endpoints:
+        return Endpoints(
+            auth_token_url=self.auth_token_url,
+            login_url=self.login_url,
+            redirect_uri=self.redirect_uri,
+        )
+
+    def start(self) -> None:
+        self._thread = threading.Thread(target=self.serve_forever, args=(0.05,), name="mock-pixiv", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        if self._thread is not None:
+            self.shutdown()
+            self._thread.join()
+        self.server_close()
+
+    def __enter__(self) -> MockPixiv:  # noqa: PYI034 -- Self needs Python 3.11
+        self.start()
+        return self
+
+    def __exit__(
+        self,
+        exc_type: type[BaseException] | None,
+        exc_val: BaseException | None,
+        exc_tb: TracebackType | None,
+    ) -> None:
+        self.stop()
+
+    @contextmanager
+    def patch(self) -> Generator[None]:
+        """Send every token request and browser login of the process here instead of to pixiv."""
+        overrides = {
+            ENV[name]: getattr(self.endpoints, name) for name in ("auth_token_url", "login_url", "redirect_uri")
+        }
+        with mock.patch.dict(os.environ, overrides):
+            yield
+
+    def issue(self) -> dict[str, Any]:
+        """A new token response, numbered from 1."""
+        with self.lock:
+            self._issued += 1
+            issued = self._issued
+        return {
+            "access_token": f"at{issued}",
+            "refresh_token": f"rt{issued}",
+            "expires_in": 3600,
+            "user": {"id": "1", "name": "Mock", "account": "mock"},
+        }
+
+    def authorize(self, challenge: str) -> str:
+        """Remember ``challenge`` and return the authorization code bound to it."""
+        with self.lock:
+            code = f"code{len(self._challenges) + 1}"
+            self._challenges[code] = challenge
+        return code
+
+    def verify(self, code: str, verifier: str) -> bool:
+        """Whether ``verifier`` answers the challenge ``code`` was issued for. A code works once."""
+        with self.lock:
+            challenge = self._challenges.pop(code, None)
+        digest = urlsafe_b64encode(sha256(verifier.encode()).digest()).rstrip(b"=").decode()
+        return challenge is not None and digest == challenge
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    wbufsize = -1  # one write per response, as gppt.server does
+
+    def __init__(self, *args: Any, pixiv: MockPixiv) -> None:
+        self.pixiv = pixiv  # before the parent's __init__, which handles the request
+        super().__init__(*args)
+
+    def do_GET(self) -> None:
+        parts = urlsplit(self.path)
+        if parts.path == "/web/v1/login":
+            self._reply(200, LOGIN_PAGE, "text/html")
+        elif parts.path == "/post-redirect":
+            code = parse_qs(parts.query).get("code", [""])[0]
+            deep_link = f"pixiv://account/login?{urlencode({'code': code, 'via': 'login'})}"
+            self._reply(200, REDIRECT_PAGE.format(deep_link=json.dumps(deep_link)), "text/html")
+        else:
+            self._json(404, {"error": "not found"})
+
+    def do_POST(self) -> None:
+        body = self.rfile.read(int(self.headers.get("Content-Length", 0))).decode()
+        if self.path == "/login":
+            self._login(json.loads(body))
+        elif self.path == "/auth/token":
+            self._token({key: values[0] for key, values in parse_qs(body).items()})
+        else:
+            self._json(404, {"error": "not found"})
+
+    def _login(self, fields: dict[str, str]) -> None:
+        pixiv = self.pixiv
+        if (fields.get("username"), fields.get("password")) != (pixiv.username, pixiv.password):
+            self._json(401, {"error": "Wrong pixiv ID or password."})
+            return
+        if pixiv.totp_secret:
+            otp = fields.get("otp")
+            if otp is None:
+                self._json(200, {"next": "otp"})
+                return
+            if not pyotp.TOTP(pixiv.totp_secret).verify(otp, valid_window=1):
+                self._json(401, {"error": "Wrong verification code."})
+                return
+        code = pixiv.authorize(fields.get("code_challenge", ""))
+        self._json(200, {"next": f"{pixiv.redirect_uri}?{urlencode({'code': code})}"})
+
+    def _token(self, form: dict[str, str]) -> None:
+        pixiv = self.pixiv
+        with pixiv.lock:
+            if form.get("grant_type") == "refresh_token":
+                pixiv.refresh_tokens.append(form.get("refresh_token", ""))
+            failure = pixiv.failures.pop(0) if pixiv.failures else None
+        if failure is not None:
+            self._reply(failure, "<html>pixiv is down</html>", "text/html")
+            return
+        if form.get("grant_type") == "refresh_token":
+            refresh_token = form.get("refresh_token", "")
+            accepted = refresh_token != REVOKED
+        else:
+            accepted = pixiv.verify(form.get("code", ""), form.get("code_verifier", ""))
+        if accepted:
+            self._json(200, pixiv.issue())
+        else:
+            self._json(400, {"has_error": True, "errors": {"system": {"message": "Invalid grant"}}})
+
+    def _json(self, status: int, body: dict[str, Any]) -> None:
+        self._reply(status, json.dumps(body), "application/json")
+
+    def _reply(self, status: int, text: str, content_type: str) -> None:
+        payload = text.encode()
+        self.send_response(status)
+        self.send_header("Content-Type", f"{content_type}; charset=utf-8")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, format: str, *args: object) -> None:  # noqa: A002
+        pass
@@ -0,0 +1,215 @@
+from __future__ import annotations
+
+import asyncio
+from typing import TYPE_CHECKING, Any
+from urllib.parse import parse_qs
+
+import pytest
+
+httpx = pytest.importorskip("httpx")
+
+from gppt import aio, api, config, token  # noqa: E402
+from gppt.browser import Authorization  # noqa: E402
+from gppt.consts import CLIENT_ID  # noqa: E402
+from gppt.endpoints import Endpoints  # noqa: E402
+from gppt.lock import ProfileLock  # noqa: E402
+from tests.conftest import make_token  # noqa: E402
+
+if TYPE_CHECKING:
+    from pathlib import Path
+
+
+def _client(sent: list[dict[str, list[str]]], access_token: str = "at") -> Any:
+    def handler(request: Any) -> Any:
+        sent.append(parse_qs(request.content.decode()))
+        return httpx.Response(200, json={"access_token": access_token, "refresh_token": "rt2", "expires_in": 3600})
+
+    return httpx.AsyncClient(transport=httpx.MockTransport(handler))
+
+
+@pytest.fixture
+def no_browser(monkeypatch: pytest.MonkeyPatch) -> list[dict[str, Any]]:
+    calls: list[dict[str, Any]] = []
+
+    async def fake_fetch(
+        username: str, password: str, *, headless: bool, totp: Any = None, **options: Any
+    ) -> Authorization:
+        calls.append({"username": username, "password": password, "headless": headless, "totp": totp, **options})
+        return Authorization(code="the-code", code_verifier="the-verifier")
+
+    monkeypatch.setattr(aio, "fetch_authorization", fake_fetch)
+    monkeypatch.setattr(aio, "will_install", lambda **_: False)
+    return calls
+
+
+def test_refresh_posts_the_refresh_token() -> None:
+    sent: list[dict[str, list[str]]] = []
+
+    async def run() -> token.Token:
+        async with _client(sent, "at2") as client:
+            return await aio.refresh("rt", client=client)
+
+    issued = asyncio.run(run())
+
+    assert issued.access_token == "at2"
+    assert sent[0]["grant_type"] == ["refresh_token"]
+    assert sent[0]["refresh_token"] == ["rt"]
+    assert sent[0]["client_id"] == [CLIENT_ID]
+
+
+def test_many_refreshes_share_one_loop() -> None:
+    sent: list[dict[str, list[str]]] = []
+
+    async def run() -> list[token.Token]:
+        async with _client(sent) as client:
+            return await asyncio.gather(*(aio.refresh(f"rt{i}", client=client) for i in range(20)))
+
+    assert len(asyncio.run(run())) == 20
+    assert sorted(body["refresh_token"][0] for body in sent) == sorted(f"rt{i}" for i in range(20))
+
+
+def test_login_exchanges_the_captured_code(no_browser: list[dict[str, Any]]) -> None:
+    sent: list[dict[str, list[str]]] = []
+
+    async def run() -> token.Token:
+        async with _client(sent) as client:
+            return await aio.login("me", "pw", client=client)
+
+    assert asyncio.run(run()).access_token == "at"
+    assert no_browser[0]["headless"] is True
+    assert sent[0]["code"] == ["the-code"]
+    assert sent[0]["code_verifier"] == ["the-verifier"]
+
+
+def test_login_goes_to_the_given_endpoints(no_browser: list[dict[str, Any]]) -> None:
+    urls: list[str] = []
+    forms: list[dict[str, list[str]]] = []
+
+    def handler(request: Any) -> Any:
+        urls.append(str(request.url))
+        forms.append(parse_qs(request.content.decode()))
+        return httpx.Response(200, json={"access_token": "at", "expires_in": 3600})
+
+    endpoints = Endpoints(auth_token_url="http://egress/auth/token", callback_uri="http://egress/callback")
+
+    async def run() -> token.Token:
+        async with httpx.AsyncClient(transport=httpx.MockTransport(handler)) as client:
+            return await aio.login("me", "pw", client=client, endpoints=endpoints)
+
+    asyncio.run(run())
+
+    assert no_browser[0]["endpoints"] == endpoints
+    assert urls == ["http://egress/auth/token"]
+    assert forms[0]["redirect_uri"] == ["http://egress/callback"]
+
+
+def test_login_rejects_headless_without_credentials(no_browser: list[dict[str, Any]]) -> None:
+    with pytest.raises(ValueError, match="needs both a username and a password"):
+        asyncio.run(aio.login(headless=True))
+
+    assert no_browser == []
+
+
+def test_get_token_reuses_the_cache(
+    config_dir: Path,  # noqa: ARG001
+    no_browser: list[dict[str, Any]],
+) -> None:
+    token.save("work", make_token("cached"))
+
+    assert asyncio.run(aio.get_token("work")).access_token == "cached"
+    assert no_browser == []
+
+
+def test_get_token_refreshes_an_expired_cache(
+    config_dir: Path,  # noqa: ARG001
+    no_browser: list[dict[str, Any]],
+) -> None:
+    token.save("work", make_token("stale", seconds=-10))
+    sent: list[dict[str, list[str]]] = []
+
+    async def run() -> token.Token:
+        async with _client(sent, "refreshed") as client:
+            return await aio.get_token("work", client=client)
+
+    assert asyncio.run(run()).access_token == "refreshed"
+    assert no_browser == []
+    cached = token.load("work")
+    assert cached is not None
+    assert cached.access_token == "refreshed"
+
+
+def test_a_task_cancelled_while_waiting_for_the_lock_does_not_keep_it(
+    monkeypatch: pytest.MonkeyPatch,
+    config_dir: Path,  # noqa: ARG001
+) -> None:
+    monkeypatch.setattr(aio, "LOCK_POLL_S", 0.01)
+    holder = ProfileLock("work")
+    holder.acquire()
+
+    async def run() -> None:
+        waiter = asyncio.create_task(aio._acquire(ProfileLock("work")))  # noqa: SLF001
+        await asyncio.sleep(0.05)
+        waiter.cancel()
+        holder.release()
+        with pytest.raises(asyncio.CancelledError):
+            await waiter
+        await asyncio.sleep(0.05)  # the last attempt finishes in its thread
+
+    asyncio.run(run())
+
+    later = ProfileLock("work")
+    assert later.acquire(timeout=0) is True
+    later.release()
+
+
+def test_get_token_logs_in_when_nothing_is_cached(
+    config_dir: Path,  # noqa: ARG001
+    no_browser: list[dict[str, Any]],
+) -> None:
+    config.save("work", config.ProfileConfig(username="me", password="pw"))
+    sent: list[dict[str, list[str]]] = []
+
+    async def run() -> token.Token:
+        async with _client(sent) as client:
+            return await aio.get_token("work", client=client)
+
+    assert asyncio.run(run()).access_token == "at"
+    assert no_browser[0]["username"] == "me"
+    assert sent[0]["grant_type"] == ["authorization_code"]
+
+
+def test_get_token_types_at_the_profiles_cadence(
+    config_dir: Path,  # noqa: ARG001
+    no_browser: list[dict[str, Any]],
+) -> None:
+    config.save("work", config.ProfileConfig(username="me", password="pw", typing="instant"))
+
+    async def run() -> token.Token:
+        async with _client([]) as client:
+            return await aio.get_token("work", client=client)
+
+    asyncio.run(run())
+
+    assert no_browser[0]["typing"] == "instant"
+
+
+def test_login_resolves_op_references_while_the_browser_starts(
+    monkeypatch: pytest.MonkeyPatch,
+    no_browser: list[dict[str, Any]],
+) -> None:
+    monkeypatch.setattr(
+        api,
+        "resolve_secrets",
+        lambda values, **_: [f"resolved:{value}" if value else value for value in values],
+    )
+    resolved: list[Any] = []
+
+    async def run() -> None:
+        async with _client([]) as client:
+            await aio.login("op://v/i/user", "op://v/i/pass", client=client)
+        resolved.append(await no_browser[0]["credentials"])
+
+    asyncio.run(run())
+
+    assert (no_browser[0]["username"], no_browser[0]["headless"]) == ("", True)
+    assert (resolved[0].username, resolved[0].password) == ("resolved:op://v/i/user", "resolved:op://v/i/pass")
@@ -1,50 +1,38 @@
 from __future__ import annotations
 
-from datetime import datetime, timedelta, timezone
+import threading
+import time
+from concurrent.futures import Future
+from dataclasses import replace
+from datetime import timedelta
 from typing import TYPE_CHECKING, Any
 
 import pyotp
 import pytest
 
 import gppt
-from gppt import api, config, token
-from gppt.browser import Authorization, LoginError
+from gppt import api, browser, config, token
+from gppt.browser import Authorization, LoginError, TrafficStats
+from gppt.deadline import Deadline, DeadlineExceededError
+from gppt.pool import BrowserPool
+from gppt.timing import Trace
+from tests.conftest import make_token
 
 if TYPE_CHECKING:
     from pathlib import Path
 
 
-def _token(access_token: str = "at", *, seconds: int = 3600) -> token.Token:
-    return token.Token(
-        access_token=access_token,
-        refresh_token="rt",
-        expires_in=seconds,
-        expires_at=(datetime.now(tz=timezone.utc) + timedelta(seconds=seconds)).isoformat(),
-        user_name="Me",
-        user_account="me",
-    )
-
-
-@pytest.fixture
-def config_dir(monkeypatch: pytest.MonkeyPatch, tmp_path: Path) -> Path:
-    monkeypatch.setattr(config, "CONFIG_DIR", tmp_path)
-    monkeypatch.delenv(config.USERNAME_ENV, raising=False)
-    monkeypatch.delenv(config.PASSWORD_ENV, raising=False)
-    monkeypatch.delenv(config.TOTP_SECRET_ENV, raising=False)
-    return tmp_path
-
-
 @pytest.fixture
 def no_browser(monkeypatch: pytest.MonkeyPatch) -> list[dict[str, Any]]:
     calls: list[dict[str, Any]] = []
 
-    def fake_fetch(username: str, password: str, *, headless: bool, totp: Any = None) -> Authorization:
-        calls.append({"username": username, "password": password, "headless": headless, "totp": totp})
+    def fake_fetch(username: str, password: str, *, headless: bool, totp: Any = None, **options: Any) -> Authorization:
+        calls.append({"username": username, "password": password, "headless": headless, "totp": totp, **options})
         return Authorization(code="the-code", code_verifier="the-verifier")
 
     monkeypatch.setattr(api, "fetch_authorization", fake_fetch)
-    monkeypatch.setattr(api, "is_chromium_installed", lambda: True)
-    monkeypatch.setattr(token, "exchange", lambda _: _token())
+    monkeypatch.setattr(api, "will_install", lambda **_: False)
+    monkeypatch.setattr(token, "exchange", lambda *_, **__: make_token())
     return calls
 
 
@@ -54,9 +42,23 @@ def test_the_public_surface_is_importable() -> None:
     assert gppt.get_token is api.get_token
     assert gppt.Token is token.Token
     assert issubclass(gppt.TokenError, RuntimeError)
+    assert issubclass(gppt.TokenUnavailableError, gppt.TokenError)
     assert issubclass(gppt.LoginError, RuntimeError)
 
 
+@pytest.mark.parametrize(
+    ("cached", "step"),
+    [
+        (None, "login"),
+        (make_token(), "reuse"),
+        (make_token(seconds=-10), "refresh"),
+        (replace(make_token(seconds=-10), refresh_token=""), "login"),
+    ],
+)
+def test_cache_step_decides_what_to_do_with_a_cached_token(cached: token.Token | None, step: str) -> None:
+    assert api.cache_step(cached) == step
+
+
 def test_login_returns_a_token_without_touching_disk(
     config_dir: Path,
     no_browser: list[dict[str, Any]],
@@ -93,16 +95,29 @@ def test_login_resolves_op_references(
     monkeypatch: pytest.MonkeyPatch,
     no_browser: list[dict[str, Any]],
 ) -> None:
-    monkeypatch.setattr(api, "resolve_secret", lambda value: f"resolved:{value}" if value else value)
+    monkeypatch.setattr(
+        api,
+        "resolve_secrets",
+        lambda values, **_: [f"resolved:{value}" if value else value for value in values],
+    )
 
     gppt.login("op://v/i/user", "op://v/i/pass")
 
-    assert no_browser[0]["username"] == "resolved:op://v/i/user"
-    assert no_browser[0]["password"] == "resolved:op://v/i/pass"
+    # Resolved alongside the browser launch, and handed over as a future.
+    credentials = no_browser[0]["credentials"].result()
+    assert credentials.username == "resolved:op://v/i/user"
+    assert credentials.password == "resolved:op://v/i/pass"
+    assert no_browser[0]["headless"] is True
+
+
+def test_plain_credentials_are_passed_directly(no_browser: list[dict[str, Any]]) -> None:
+    gppt.login("me", "pw")
+
+    assert no_browser[0]["credentials"] is None
 
 
 def test_refresh_delegates_to_the_token_endpoint(monkeypatch: pytest.MonkeyPatch) -> None:
-    monkeypatch.setattr(token, "refresh", lambda rt: _token(f"refreshed:{rt}"))
+    monkeypatch.setattr(token, "refresh", lambda rt, **_: make_token(f"refreshed:{rt}"))
 
     assert gppt.refresh("rt").access_token == "refreshed:rt"
 
@@ -120,11 +135,28 @@ def test_get_token_logs_in_and_caches(
     assert token.load("work") == issued
 
 
+def test_get_token_hands_one_deadline_to_every_phase(
+    monkeypatch: pytest.MonkeyPatch,
+    config_dir: Path,  # noqa: ARG001
+    no_browser: list[dict[str, Any]],
+) -> None:
+    config.save("work", config.ProfileConfig(username="me", password="pw"))
+    exchanged: list[Any] = []
+    monkeypatch.setattr(token, "exchange", lambda *_, deadline, **__: exchanged.append(deadline) or make_token())
+
+    gppt.get_token("work", deadline=timedelta(seconds=30))
+
+    deadline = no_browser[0]["deadline"]
+    assert isinstance(deadline, Deadline)
+    assert deadline.budget == timedelta(seconds=30)
+    assert exchanged == [deadline]
+
+
 def test_get_token_reuses_the_cache(
     config_dir: Path,  # noqa: ARG001
     no_browser: list[dict[str, Any]],
 ) -> None:
-    token.save("work", _token("cached"))
+    token.save("work", make_token("cached"))
 
     assert gppt.get_token("work").access_token == "cached"
     assert no_browser == []
@@ -234,3 +266,450 @@ def test_get_token_falls_back_to_the_totp_prompt(
     gppt.get_token("work", totp_prompt=lambda: "654321")
 
     assert no_browser[0]["totp"].code() == "654321"
+
+
+def test_refresh_many_only_refreshes_what_is_about_to_expire(
+    monkeypatch: pytest.MonkeyPatch,
+    config_dir: Path,  # noqa: ARG001
+    no_browser: list[dict[str, Any]],
+) -> None:
+    token.save("fresh", make_token("fresh"))
+    token.save("soon", make_token("soon", seconds=120))
+    token.save("stale", make_token("stale", seconds=-10))
+    refreshed: list[str] = []
+
+    def fake_refresh(refresh_token: str, **_: Any) -> token.Token:
+        refreshed.append(refresh_token)
+        return make_token("new")
+
+    monkeypatch.setattr(token, "refresh", fake_refresh)
+
+    results = api.refresh_many()
+
+    assert [(result.profile, result.status) for result in results] == [
+        ("fresh", "valid"),
+        ("soon", "refreshed"),
+        ("stale", "refreshed"),
+    ]
+    assert len(refreshed) == 2
+    assert token.load("stale") == results[2].token
+    assert no_browser == []
+
+
+def test_refresh_many_reports_failures_without_a_browser(
+    monkeypatch: pytest.MonkeyPatch,
+    config_dir: Path,  # noqa: ARG001
+    no_browser: list[dict[str, Any]],
+) -> None:
+    token.save("bad", make_token("bad", seconds=-10))
+
+    def fail(*_: Any, **__: Any) -> token.Token:
+        msg = "invalid_grant"
+        raise token.TokenError(msg)
+
+    monkeypatch.setattr(token, "refresh", fail)
+
+    bad, missing = api.refresh_many(["bad", "missing"])
+
+    assert bad.status == "failed"
+    assert "invalid_grant" in bad.error
+    assert missing.status == "failed"
+    assert missing.error == "no cached token"
+    assert no_browser == []
+
+
+def test_refresh_many_shares_one_transport(
+    monkeypatch: pytest.MonkeyPatch,
+    config_dir: Path,  # noqa: ARG001
+) -> None:
+    for index in range(20):
+        token.save(f"p{index}", make_token(seconds=-10))
+    transports: set[int] = set()
+
+    def fake_refresh(_: str, *, transport: Any = None, **__: Any) -> token.Token:
+        transports.add(id(transport))
+        return make_token("new")
+
+    monkeypatch.setattr(token, "refresh", fake_refresh)
+
+    results = api.refresh_many(max_workers=4)
+
+    assert {result.status for result in results} == {"refreshed"}
+    assert len(transports) == 1
+    assert id(None) not in transports
+
+
+def test_refresh_profile_refreshes_one_due_profile(
+    monkeypatch: pytest.MonkeyPatch,
+    config_dir: Path,  # noqa: ARG001
+) -> None:
+    token.save("work", make_token("soon", seconds=120))
+    monkeypatch.setattr(token, "refresh", lambda *_, **__: make_token("new"))
+
+    result = api.refresh_profile("work", timedelta(minutes=1))
+    assert result.status == "valid"
+
+    result = api.refresh_profile("work")
+    assert result.status == "refreshed"
+    assert token.load("work") == result.token
+
+
+def test_get_token_can_skip_the_browser_installer(
+    monkeypatch: pytest.MonkeyPatch,
+    config_dir: Path,  # noqa: ARG001
+    no_browser: list[dict[str, Any]],
+) -> None:
+    monkeypatch.setattr(api, "will_install", browser.will_install)
+    messages: list[str] = []
+
+    gppt.get_token("work", install_browser=False, notify=messages.append)
+
+    assert no_browser[0]["install_browser"] is False
+    assert not any("download" in message for message in messages)
+
+
+def test_no_first_run_message_when_the_installer_is_disabled_by_the_environment(
+    monkeypatch: pytest.MonkeyPatch,
+    config_dir: Path,  # noqa: ARG001
+    no_browser: list[dict[str, Any]],  # noqa: ARG001
+) -> None:
+    monkeypatch.setattr(api, "will_install", browser.will_install)
+    monkeypatch.setenv(browser.SKIP_INSTALL_ENV, "1")
+    messages: list[str] = []
+
+    gppt.get_token("work", notify=messages.append)
+
+    assert not any("download" in message for message in messages)
+
+
+def test_login_hands_the_pool_to_the_browser(no_browser: list[dict[str, Any]]) -> None:
+    warm = gppt.BrowserPool()
+
+    gppt.login("me", "pw", pool=warm)
+
+    assert no_browser[0]["pool"] is warm
+
+
+def test_get_token_reports_the_traffic_of_a_filtered_login(
+    monkeypatch: pytest.MonkeyPatch,
+    config_dir: Path,  # noqa: ARG001
+    no_browser: list[dict[str, Any]],
+) -> None:
+    def fake_fetch(*_: Any, **options: Any) -> Authorization:
+        no_browser.append(options)
+        traffic = TrafficStats(requests=40, blocked_by_type={"font": 5, "image": 20}, bytes_received=123456)
+        return Authorization("the-code", "the-verifier", traffic)
+
+    monkeypatch.setattr(api, "fetch_authorization", fake_fetch)
+    messages: list[str] = []
+
+    gppt.get_token("work", block_resources=True, notify=messages.append)
+
+    assert no_browser[0]["block_resources"] is True
+    assert "Blocked 25 of 40 requests (20 image, 5 font); 123,456 bytes still came through." in messages
+
+
+def test_login_types_like_a_human_by_default(no_browser: list[dict[str, Any]]) -> None:
+    gppt.login("me", "pw")
+
+    assert no_browser[0]["typing"] == "human"
+
+
+def test_login_rejects_an_unknown_typing_mode(no_browser: list[dict[str, Any]]) -> None:
+    unknown: Any = "slow"
+
+    with pytest.raises(ValueError, match="typing must be one of"):
+        gppt.login("me", "pw", typing=unknown)
+
+    assert no_browser == []
+
+
+def test_get_token_uses_the_profiles_typing_mode(
+    config_dir: Path,  # noqa: ARG001
+    no_browser: list[dict[str, Any]],
+) -> None:
+    config.save("work", config.ProfileConfig(username="me", password="pw", typing="instant"))
+
+    gppt.get_token("work")
+    gppt.get_token("work", force=True, typing="fast")
+
+    assert [call["typing"] for call in no_browser] == ["instant", "fast"]
+
+
+def test_get_token_reports_the_form_entry_time(
+    monkeypatch: pytest.MonkeyPatch,
+    config_dir: Path,  # noqa: ARG001
+    no_browser: list[dict[str, Any]],  # noqa: ARG001
+) -> None:
+    config.save("work", config.ProfileConfig(username="me", password="pw", typing="fast"))
+    monkeypatch.setattr(api, "fetch_authorization", lambda *_, **__: Authorization("c", "v", form_entry_s=1.234))
+    messages: list[str] = []
+
+    gppt.get_token("work", notify=messages.append)
+
+    assert "Filled in the login form in 1.2s (fast typing)." in messages
+
+
+def test_get_token_forgets_the_browser_session_by_default(
+    config_dir: Path,  # noqa: ARG001
+    no_browser: list[dict[str, Any]],
+) -> None:
+    gppt.get_token("work")
+
+    assert no_browser[0]["storage_state"] is None
+
+
+def test_get_token_keeps_the_session_next_to_the_token(
+    config_dir: Path,
+    no_browser: list[dict[str, Any]],
+) -> None:
+    config.save("work", config.ProfileConfig(username="me", password="pw", keep_session=True))
+
+    gppt.get_token("work")
+    gppt.get_token("work", force=True, keep_session=False)
+
+    assert no_browser[0]["storage_state"] == config_dir / "work.state.json"
+    assert no_browser[1]["storage_state"] is None
+
+
+def test_get_token_reports_a_reused_session(
+    monkeypatch: pytest.MonkeyPatch,
+    config_dir: Path,  # noqa: ARG001
+    no_browser: list[dict[str, Any]],  # noqa: ARG001
+) -> None:
+    monkeypatch.setattr(api, "fetch_authorization", lambda *_, **__: Authorization("c", "v", session_reused=True))
+    messages: list[str] = []
+
+    gppt.get_token("work", keep_session=True, notify=messages.append)
+
+    assert "Signed in with the saved browser session." in messages
+
+
+def test_a_pipelined_login_resolves_the_credentials_while_the_browser_starts(
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    def slow_resolve(values: list[str], **_: Any) -> list[str]:
+        time.sleep(0.1)  # an `op` run
+        return [value.removeprefix("op://") for value in values]
+
+    def fake_fetch(_: str, __: str, *, credentials: Any, trace: Any, **options: Any) -> Authorization:
+        with trace.span("launch"):
+            time.sleep(0.1)
+        resolved = credentials.result()
+        assert (resolved.username, resolved.password) == ("me", "pw")
+        assert options["pipelined"] is True
+        return Authorization(code="the-code", code_verifier="the-verifier")
+
+    monkeypatch.setattr(api, "resolve_secrets", slow_resolve)
+    monkeypatch.setattr(api, "fetch_authorization", fake_fetch)
+    monkeypatch.setattr(token, "exchange", lambda *_, **__: make_token())
+    trace = Trace()
+
+    gppt.login("op://me", "op://pw", pipelined=True, trace=trace)
+
+    spans = {span.name: span for span in trace.spans}
+    assert spans["launch"].thread != spans["secrets"].thread
+    assert spans["secrets"].start_s < spans["launch"].end_s  # they overlapped
+    assert trace.elapsed_s < spans["launch"].duration_s + spans["secrets"].duration_s
+    assert "token exchange" in spans
+
+
+def test_a_pipelined_login_stops_at_a_bad_totp_secret(monkeypatch: pytest.MonkeyPatch) -> None:
+    browser_saw: list[BaseException] = []
+    done = threading.Event()
+
+    def fake_fetch(_: str, __: str, *, credentials: Any, **___: Any) -> Authorization:
+        try:
+            credentials.result()
+        except ValueError as exc:
+            browser_saw.append(exc)
+            raise
+        finally:
+            done.set()
+        return Authorization(code="the-code", code_verifier="the-verifier")
+
+    monkeypatch.setattr(api, "fetch_authorization", fake_fetch)
+
+    with pytest.raises(ValueError, match="not valid base32"):
+        gppt.login("me", "pw", "not base32!", pipelined=True)
+
+    assert done.wait(timeout=5)
+    assert len(browser_saw) == 1
+
+
+def test_a_pipelined_login_waits_for_the_browser_within_the_deadline(monkeypatch: pytest.MonkeyPatch) -> None:
+    release = threading.Event()
+
+    def stuck_fetch(*_: Any, **__: Any) -> Authorization:
+        release.wait(timeout=5)  # a browser that ignores its own deadline
+        return Authorization(code="the-code", code_verifier="the-verifier")
+
+    monkeypatch.setattr(api, "fetch_authorization", stuck_fetch)
+
+    try:
+        with pytest.raises(DeadlineExceededError, match="the browser login"):
+            gppt.login("me", "pw", pipelined=True, deadline=timedelta(seconds=0.2))
+    finally:
+        release.set()
+
+
+def test_a_pool_keeps_the_browser_on_the_calling_thread(monkeypatch: pytest.MonkeyPatch) -> None:
+    threads: list[str] = []
+
+    def fake_fetch(*_: Any, **__: Any) -> Authorization:
+        threads.append(threading.current_thread().name)
+        return Authorization(code="the-code", code_verifier="the-verifier")
+
+    monkeypatch.setattr(api, "fetch_authorization", fake_fetch)
+    monkeypatch.setattr(token, "exchange", lambda *_, **__: make_token())
+    pool = BrowserPool()
+
+    gppt.login("me", "pw", pool=pool, pipelined=True)
+
+    assert threads == [threading.current_thread().name]
+
+
+def test_get_token_times_the_cache_read_and_the_refresh(
+    monkeypatch: pytest.MonkeyPatch,
+    config_dir: Path,  # noqa: ARG001
+    no_browser: list[dict[str, Any]],
+) -> None:
+    token.save("work", make_token("stale", seconds=-10))
+    monkeypatch.setattr(token, "refresh", lambda *_, **__: make_token("refreshed"))
+    trace = Trace()
+
+    gppt.get_token("work", trace=trace)
+
+    assert no_browser == []
+    assert [span.name for span in trace.spans] == ["cache read", "refresh"]
+
+
+def _revalidated(profile: str) -> token.Token | None:
+    return api._revalidating[profile].result(timeout=5)  # noqa: SLF001
+
+
+def test_stale_while_revalidate_returns_the_cached_token_at_once(
+    monkeypatch: pytest.MonkeyPatch,
+    config_dir: Path,  # noqa: ARG001
+    no_browser: list[dict[str, Any]],
+) -> None:
+    token.save("work", make_token("stale", seconds=30))  # within EXPIRY_MARGIN, not yet expired
+    answer = threading.Event()
+
+    def slow_refresh(*_: Any, **__: Any) -> token.Token:
+        assert answer.wait(timeout=5)
+        return make_token("refreshed")
+
+    monkeypatch.setattr(token, "refresh", slow_refresh)
+
+    assert gppt.get_token("work", stale_while_revalidate=True).access_token == "stale"
+    answer.set()
+
+    assert _revalidated("work") == token.load("work")
+    saved = token.load("work")
+    assert saved is not None
+    assert saved.access_token == "refreshed"
+    assert no_browser == []
+
+
+def test_stale_while_revalidate_refreshes_once(
+    monkeypatch: pytest.MonkeyPatch,
+    config_dir: Path,  # noqa: ARG001
+) -> None:
+    token.save("work", make_token("stale", seconds=30))
+    answer = threading.Event()
+    refreshed: list[str] = []
+
+    def slow_refresh(refresh_token: str, **_: Any) -> token.Token:
+        refreshed.append(refresh_token)
+        assert answer.wait(timeout=5)
+        return make_token("refreshed")
+
+    monkeypatch.setattr(token, "refresh", slow_refresh)
+
+    for _ in range(5):
+        assert gppt.get_token("work", stale_while_revalidate=True).access_token == "stale"
+    answer.set()
+    _revalidated("work")
+
+    assert refreshed == ["rt-stale"]
+
+
+def test_stale_while_revalidate_keeps_the_token_when_the_refresh_fails(
+    monkeypatch: pytest.MonkeyPatch,
+    config_dir: Path,  # noqa: ARG001
+) -> None:
+    token.save("work", make_token("stale", seconds=30))
+    messages: list[str] = []
+
+    def rejected(*_: Any, **__: Any) -> token.Token:
+        msg = "Invalid grant"
+        raise token.TokenError(msg)
+
+    monkeypatch.setattr(token, "refresh", rejected)
+
+    gppt.get_token("work", stale_while_revalidate=True, notify=messages.append)
+
+    with pytest.raises(token.TokenError, match="Invalid grant"):
+        _revalidated("work")
+    saved = token.load("work")
+    assert saved is not None
+    assert saved.access_token == "stale"
+    assert not any("Background" in message for message in messages)  # never from the background thread
+
+    gppt.get_token("work", stale_while_revalidate=True, notify=messages.append)
+
+    assert "Background refresh failed (Invalid grant)." in messages
+
+
+def test_exit_waits_for_a_background_refresh_to_save(
+    monkeypatch: pytest.MonkeyPatch,
+    config_dir: Path,  # noqa: ARG001
+) -> None:
+    token.save("work", make_token("stale", seconds=30))
+
+    def slow_refresh(*_: Any, **__: Any) -> token.Token:
+        time.sleep(0.1)
+        return make_token("refreshed")
+
+    monkeypatch.setattr(token, "refresh", slow_refresh)
+    gppt.get_token("work", stale_while_revalidate=True)
+
+    api._finish_revalidating()  # noqa: SLF001 -- what atexit runs
+
+    saved = token.load("work")
+    assert saved is not None
+    assert saved.access_token == "refreshed"
+
+
+def test_exit_does_not_wait_for_ever(monkeypatch: pytest.MonkeyPatch) -> None:
+    stuck: Future[token.Token | None] = Future()
+    monkeypatch.setattr(api, "_revalidating", {"work": stuck})
+    monkeypatch.setattr(api, "REVALIDATE_EXIT_WAIT_S", 0.05)
+
+    api._finish_revalidating()  # noqa: SLF001
+
+    assert not stuck.done()
+
+
+def test_stale_while_revalidate_refreshes_an_expired_token_in_the_foreground(
+    monkeypatch: pytest.MonkeyPatch,
+    config_dir: Path,  # noqa: ARG001
+) -> None:
+    token.save("work", make_token("expired", seconds=-10))
+    monkeypatch.setattr(token, "refresh", lambda *_, **__: make_token("refreshed"))
+
+    assert gppt.get_token("work", stale_while_revalidate=True).access_token == "refreshed"
+
+
+def test_stale_while_revalidate_needs_somewhere_to_save(
+    monkeypatch: pytest.MonkeyPatch,
+    config_dir: Path,  # noqa: ARG001
+) -> None:
+    token.save("work", make_token("stale", seconds=30))
+    monkeypatch.setattr(token, "refresh", lambda *_, **__: make_token("refreshed"))
+
+    assert gppt.get_token("work", save=False, stale_while_revalidate=True).access_token == "refreshed"
+    saved = token.load("work")
+    assert saved is not None
+    assert saved.access_token == "stale"
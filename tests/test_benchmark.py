@@ -0,0 +1,61 @@
+from __future__ import annotations
+
+from typing import TYPE_CHECKING
+
+import pytest
+
+from gppt import browser, config, token
+from gppt.browser import Authorization
+from tests import benchmark
+from tests.mock_pixiv import MockPixiv
+
+if TYPE_CHECKING:
+    from collections.abc import Iterator
+    from pathlib import Path
+
+
+@pytest.fixture
+def pixiv(monkeypatch: pytest.MonkeyPatch, tmp_path: Path) -> Iterator[MockPixiv]:
+    monkeypatch.setattr(config, "CONFIG_DIR", tmp_path)
+    with MockPixiv(username="me", password="pw") as running, running.patch():
+        yield running
+
+
+def test_every_benchmark_reports_a_row(capsys: pytest.CaptureFixture[str]) -> None:
+    assert benchmark.main(["-n", "3", "--skip-browser"]) == 0
+
+    out = capsys.readouterr().out
+    for name in ("token.refresh", "token.save", "token.load", "get_token (cache hit)", "TokenServer"):
+        assert name in out
+
+
+def test_percentiles_and_throughput() -> None:
+    result = benchmark.Result("op", [0.001 * n for n in range(1, 101)], wall_s=2.0)
+
+    assert result.percentile(50) == pytest.approx(0.0505)
+    assert result.percentile(99) == pytest.approx(0.09901)
+    assert result.throughput == 50.0
+
+
+def test_the_mock_refuses_a_revoked_refresh_token(pixiv: MockPixiv) -> None:
+    with pytest.raises(token.TokenError, match="Invalid grant"):
+        token.refresh("rt-revoked")
+
+    assert pixiv.refresh_tokens == ["rt-revoked"]
+
+
+def test_the_mock_checks_the_pkce_verifier(pixiv: MockPixiv) -> None:
+    code = pixiv.authorize("the-challenge")
+
+    with pytest.raises(token.TokenError):
+        token.exchange(Authorization(code=code, code_verifier="not-the-verifier"))
+
+
+def test_a_browser_login_against_the_mock_page(pixiv: MockPixiv) -> None:  # noqa: ARG001
+    # Asked here rather than in a skipif: that would start a Playwright
+    # driver while collecting, even for runs that deselect this test.
+    if not benchmark.chromium_available():
+        pytest.skip("Chromium is not installed")
+    authorization = browser.fetch_authorization("me", "pw", headless=True, install_browser=False, typing="instant")
+
+    assert token.exchange(authorization).access_token == "at1"
@@ -1,62 +1,139 @@
 from __future__ import annotations
 
+import json
+import stat
+import time
 from base64 import urlsafe_b64encode
+from concurrent.futures import Future
+from contextlib import contextmanager
+from datetime import timedelta
 from hashlib import sha256
-from typing import Any
+from types import SimpleNamespace
+from typing import TYPE_CHECKING, Any
 
+import install_playwright
 import pyotp
 import pytest
+from playwright.sync_api import TimeoutError as PlaywrightTimeoutError
 
-from gppt import browser
+from gppt import browser, config
 from gppt.browser import LoginError, TotpProvider
+from gppt.consts import LOGIN_URL, REDIRECT_URI
+from gppt.deadline import Deadline, DeadlineExceededError
+from gppt.endpoints import Endpoints
+from gppt.timing import Trace
+
+if TYPE_CHECKING:
+    from collections.abc import Generator
+    from pathlib import Path
 
 SECRET = "JBSWY3DPEHPK3PXP"
+# Stands in for Playwright's BrowserType: the installer reads its name, and
+# the install check where its executable would be.
+CHROMIUM: Any = SimpleNamespace(name="chromium", executable_path="/nonexistent/chrome")
 
 
 class FakeLocator:
     """Just enough Locator for _handle_totp / _slow_type / _submit."""
 
-    def __init__(self, page: FakePage, visible_after: int | None = None) -> None:
+    def __init__(self, page: FakePage) -> None:
         self.page = page
-        self._visible_after = visible_after
-        self._checks = 0
         self.typed: list[str] = []
         self.pressed: list[str] = []
 
-    @property
-    def first(self) -> FakeLocator:
-        return self
-
-    def is_visible(self) -> bool:
-        self._checks += 1
-        return self._visible_after is not None and self._checks > self._visible_after
-
     def type(self, text: str) -> None:
         self.typed.append(text)
 
+    def fill(self, text: str) -> None:
+        self.typed.append(text)
+
     def press(self, key: str) -> None:
         self.pressed.append(key)
 
 
 class FakePage:
-    def __init__(self, url: str = "https://accounts.pixiv.net/login", *, totp_after: int | None = None) -> None:
+    def __init__(
+        self,
+        url: str = "https://accounts.pixiv.net/login",
+        *,
+        totp: bool = False,
+        form: bool = False,
+        requests: list[str] | None = None,
+    ) -> None:
         self.url = url
         self.locators: dict[str, FakeLocator] = {}
         self.waits = 0
-        self._totp_after = totp_after
+        self.function_waits = 0
+        self.redirect_waits = 0
+        self.timeouts: list[float] = []
+        self.default_timeouts: list[float] = []
+        self._fields = {browser.TOTP_SELECTOR} if totp else set()
+        if form:
+            self._fields.add(browser.USERNAME_SELECTOR)
+        self._requests = requests or []
 
     def locator(self, selector: str) -> FakeLocator:
         if selector not in self.locators:
-            after = self._totp_after if selector == browser.TOTP_SELECTOR else None
-            self.locators[selector] = FakeLocator(self, visible_after=after)
+            self.locators[selector] = FakeLocator(self)
         return self.locators[selector]
 
+    def wait_for_function(self, expression: str, *, arg: list[str], timeout: float) -> Any:
+        assert expression == browser.FIELD_OR_REDIRECT_JS
+        selector, redirect = arg
+        self.function_waits += 1
+        self.timeouts.append(timeout)
+        if self.url.startswith(redirect):
+            return SimpleNamespace(json_value=lambda: "redirect")
+        if selector in self._fields:
+            return SimpleNamespace(json_value=lambda: "field")
+        msg = f"Timeout {timeout}ms exceeded."
+        raise PlaywrightTimeoutError(msg)
+
     def wait_for_timeout(self, _: float) -> None:
         self.waits += 1
 
+    def set_default_timeout(self, timeout: float) -> None:
+        self.default_timeouts.append(timeout)
+
+    def wait_for_event(self, event: str, *, predicate: Any, timeout: float) -> Any:
+        assert event == "request"
+        self.timeouts.append(timeout)
+        for url in self._requests:
+            request = SimpleNamespace(url=url)
+            if predicate(request):
+                return request
+        msg = f"Timeout {timeout}ms exceeded while waiting for event {event!r}"
+        raise PlaywrightTimeoutError(msg)
+
+    def wait_for_url(self, url: Any, **_: Any) -> None:
+        self.redirect_waits += 1
+        if not url.match(self.url):
+            msg = "Timeout exceeded while waiting for the URL"
+            raise PlaywrightTimeoutError(msg)
+
+
+@pytest.fixture
+def installs(monkeypatch: pytest.MonkeyPatch, tmp_path: Path) -> list[list[Any]]:
+    """Record installer runs instead of downloading Chromium."""
+    calls: list[list[Any]] = []
+
+    def fake_install(browser_types: list[Any], **_: Any) -> bool:
+        calls.append([browser_type.name for browser_type in browser_types])
+        return True
+
+    monkeypatch.setattr(config, "CONFIG_DIR", tmp_path)
+    monkeypatch.setattr(browser, "_playwright_has_chromium", lambda: False)
+    monkeypatch.delenv(browser.SKIP_INSTALL_ENV, raising=False)
+    monkeypatch.setattr(install_playwright, "install", fake_install)
+    return calls
+
 
 def _handle_totp(page: Any, totp: Any = None, captured: dict[str, str] | None = None) -> None:
-    browser._handle_totp(page, totp, {} if captured is None else captured)  # noqa: SLF001
+    browser._handle_totp(page, totp, {} if captured is None else captured, "instant")  # noqa: SLF001
+
+
+def _wait_for_form(page: Any, captured: dict[str, str]) -> bool:
+    return browser._wait_for_form(page, captured)  # noqa: SLF001
 
 
 def test_oauth_pkce_challenge_is_the_s256_of_the_verifier() -> None:
@@ -147,14 +224,15 @@ def test_handle_totp_returns_when_the_code_was_already_captured() -> None:
 
     _handle_totp(page, None, {"code": "already-there"})
 
-    assert page.waits == 0
+    assert page.function_waits == 0
 
 
 def test_handle_totp_returns_once_the_login_redirects() -> None:
-    page = FakePage(url=browser.REDIRECT_URI + "?foo=1")
+    page = FakePage(url=REDIRECT_URI + "?foo=1")
 
     _handle_totp(page)
 
+    assert page.function_waits == 1
     assert page.waits == 0
 
 
@@ -163,13 +241,13 @@ def test_handle_totp_gives_up_quietly_when_no_challenge_appears() -> None:
 
     _handle_totp(page)
 
-    # Polled for the whole window, then left the redirect wait to report failures.
-    assert page.waits == browser.TOTP_TIMEOUT_MS // browser.POLL_INTERVAL_MS
+    # One wait for the whole window, then the callback wait reports failures.
+    assert page.function_waits == 1
     assert page.locator(browser.TOTP_SELECTOR).typed == []
 
 
 def test_handle_totp_types_the_code_and_submits() -> None:
-    page = FakePage(totp_after=3)
+    page = FakePage(totp=True)
 
     _handle_totp(page, TotpProvider(SECRET))
 
@@ -179,7 +257,7 @@ def test_handle_totp_types_the_code_and_submits() -> None:
 
 
 def test_handle_totp_uses_the_prompt_when_there_is_no_secret() -> None:
-    page = FakePage(totp_after=0)
+    page = FakePage(totp=True)
 
     _handle_totp(page, TotpProvider(prompt=lambda: "654321"))
 
@@ -187,7 +265,502 @@ def test_handle_totp_uses_the_prompt_when_there_is_no_secret() -> None:
 
 
 def test_handle_totp_without_a_provider_explains_itself() -> None:
-    page = FakePage(totp_after=0)
+    page = FakePage(totp=True)
 
     with pytest.raises(LoginError, match="none is available"):
         _handle_totp(page, None)
+
+
+def test_the_form_and_the_2fa_code_are_timed_apart() -> None:
+    page: Any = FakePage(totp=True)
+    trace = Trace()
+
+    browser._enter_credentials(  # noqa: SLF001
+        page,
+        "me",
+        "pw",
+        totp=TotpProvider(SECRET),
+        captured={},
+        typing="instant",
+        trace=trace,
+    )
+
+    assert [span.name for span in trace.spans] == ["form fill", "2FA"]
+
+
+def test_the_callback_request_ends_the_wait_at_once() -> None:
+    page: Any = FakePage(
+        requests=["https://accounts.pixiv.net/post-redirect", "pixiv://account/login?code=abc&via=login"]
+    )
+    captured: dict[str, str] = {}
+
+    browser._wait_for_callback(page, captured, browser.REDIRECT_TIMEOUT_MS)  # noqa: SLF001
+
+    assert captured == {"code": "abc"}
+    assert page.redirect_waits == 0
+    assert page.waits == 0
+
+
+def test_an_already_captured_code_needs_no_wait() -> None:
+    page: Any = FakePage()
+
+    browser._wait_for_callback(page, {"code": "abc"}, browser.REDIRECT_TIMEOUT_MS)  # noqa: SLF001
+
+    assert page.redirect_waits == 0
+
+
+def test_a_missed_callback_falls_back_to_the_redirect_wait() -> None:
+    page: Any = FakePage(url=REDIRECT_URI + "?code=abc")
+
+    browser._wait_for_callback(page, {}, browser.REDIRECT_TIMEOUT_MS)  # noqa: SLF001
+
+    assert page.redirect_waits == 1
+    assert page.waits == 1  # the settle delay
+
+
+def test_the_redirect_page_shares_the_wait_with_the_callback() -> None:
+    page: Any = FakePage(requests=[REDIRECT_URI])
+
+    with pytest.raises(LoginError, match="Failed to login"):
+        browser._wait_for_callback(page, {}, browser.REDIRECT_TIMEOUT_MS)  # noqa: SLF001
+
+    redirect_wait, callback_wait = page.timeouts
+    assert redirect_wait == browser.REDIRECT_TIMEOUT_MS
+    assert callback_wait <= browser.REDIRECT_TIMEOUT_MS  # what is left of the same budget, not a fresh one
+    assert page.redirect_waits == 0
+
+
+def test_no_callback_and_no_redirect_is_a_failed_login() -> None:
+    page: Any = FakePage()
+
+    with pytest.raises(LoginError, match="Failed to login"):
+        browser._wait_for_callback(page, {}, browser.REDIRECT_TIMEOUT_MS)  # noqa: SLF001
+
+
+def test_login_state_captures_the_code_from_the_callback() -> None:
+    state = browser.LoginState(Endpoints())
+    state.on_request("https://accounts.pixiv.net/post-redirect")
+    state.on_request("pixiv://account/login?code=abc&via=login")
+
+    authorization = state.authorization()
+
+    assert authorization.code == "abc"
+    assert authorization.code_verifier == state.code_verifier
+    assert authorization.traffic.requests == 2
+    assert state.login_url.startswith(f"{LOGIN_URL}?")
+
+
+def test_login_state_without_a_code_is_a_failed_login() -> None:
+    with pytest.raises(LoginError, match=browser.NO_CODE_MSG):
+        browser.LoginState(Endpoints()).authorization()
+
+
+@pytest.mark.parametrize("mode", ["instant", "fast", "human"])
+def test_typing_modes_are_accepted(mode: str) -> None:
+    assert browser.typing_mode(mode) == mode
+
+
+def test_an_unknown_typing_mode_is_rejected() -> None:
+    with pytest.raises(ValueError, match="typing must be one of instant, fast, human"):
+        browser.typing_mode("slow")
+
+
+def test_instant_typing_fills_the_field_at_once() -> None:
+    page = FakePage()
+    field: Any = page.locator(browser.USERNAME_SELECTOR)
+
+    browser._type(field, "me@example.com", "instant")  # noqa: SLF001
+
+    assert field.typed == ["me@example.com"]
+    assert page.waits == 0
+
+
+@pytest.mark.parametrize("mode", ["fast", "human"])
+def test_keyed_typing_pauses_after_every_key(mode: browser.TypingMode) -> None:
+    page = FakePage()
+    field: Any = page.locator(browser.USERNAME_SELECTOR)
+
+    browser._type(field, "me", mode)  # noqa: SLF001
+
+    assert field.typed == ["m", "e"]
+    assert page.waits == 2
+
+
+def test_typing_recaps_the_page_timeout_for_each_field() -> None:
+    page = FakePage()
+    field: Any = page.locator(browser.USERNAME_SELECTOR)
+    deadline = Deadline(timedelta(seconds=2))
+
+    browser._type(field, "me", "instant", deadline=deadline)  # noqa: SLF001
+    browser._type(field, "pw", "instant", deadline=deadline)  # noqa: SLF001
+
+    assert len(page.default_timeouts) == 2
+    assert all(0 < timeout <= 2000 for timeout in page.default_timeouts)
+
+
+def test_keyed_typing_stops_at_the_deadline() -> None:
+    page: Any = FakePage()
+    field: Any = page.locator(browser.USERNAME_SELECTOR)
+    deadline = Deadline(timedelta(seconds=0.05))
+    page.wait_for_timeout = lambda _: time.sleep(0.1)  # the pause after the first key outlasts the budget
+
+    with pytest.raises(DeadlineExceededError, match="typing into the login form"):
+        browser._type(field, "me", "human", deadline=deadline)  # noqa: SLF001
+
+    assert field.typed == ["m"]
+
+
+def test_wait_for_form_sees_the_form() -> None:
+    assert _wait_for_form(FakePage(form=True), {}) is True
+
+
+def test_wait_for_form_notices_a_saved_session_skipping_it() -> None:
+    page = FakePage(url=REDIRECT_URI, form=True)
+
+    assert _wait_for_form(page, {}) is False
+
+
+def test_wait_for_form_accepts_a_code_captured_instead() -> None:
+    assert _wait_for_form(FakePage(), {"code": "abc"}) is False
+
+
+def test_wait_for_form_fails_when_nothing_happens() -> None:
+    with pytest.raises(LoginError, match="Login form did not appear"):
+        _wait_for_form(FakePage(), {})
+
+
+def test_a_saved_session_is_restored_only_once_it_exists(monkeypatch: pytest.MonkeyPatch, tmp_path: Path) -> None:
+    monkeypatch.setattr(browser, "PROXIES", {})
+    state = tmp_path / "work.state.json"
+
+    assert browser.context_options(state) == {}
+
+    state.write_text("{}", encoding="utf-8")
+
+    assert browser.context_options(state) == {"storage_state": state}
+
+
+def test_the_saved_session_is_private(tmp_path: Path) -> None:
+    state = tmp_path / "nested" / "work.state.json"
+
+    browser.write_storage_state(state, {"cookies": [], "origins": []})
+
+    assert json.loads(state.read_text(encoding="utf-8")) == {"cookies": [], "origins": []}
+    assert stat.S_IMODE(state.stat().st_mode) == 0o600
+
+
+def test_chromium_is_not_known_to_be_installed_before_the_first_run(installs: list[list[Any]]) -> None:
+    assert browser.is_chromium_installed() is False
+    assert installs == []
+
+
+def test_the_installer_runs_once_per_playwright_version(installs: list[list[Any]]) -> None:
+    browser.ensure_chromium(CHROMIUM, install_browser=True)
+    browser.ensure_chromium(CHROMIUM, install_browser=True)
+
+    assert installs == [["chromium"]]
+    assert browser.is_chromium_installed() is True
+
+
+def test_a_new_playwright_version_installs_again(
+    monkeypatch: pytest.MonkeyPatch,
+    installs: list[list[Any]],
+) -> None:
+    browser.ensure_chromium(CHROMIUM, install_browser=True)
+    monkeypatch.setattr(browser.importlib.metadata, "version", lambda _: "999.0.0")
+
+    assert browser.is_chromium_installed() is False
+    browser.ensure_chromium(CHROMIUM, install_browser=True)
+
+    assert len(installs) == 2
+
+
+def test_a_browser_playwright_already_has_is_not_installed_again(
+    monkeypatch: pytest.MonkeyPatch,
+    tmp_path: Path,
+    installs: list[list[Any]],
+) -> None:
+    executable = tmp_path / "chrome"
+    executable.touch()
+    provisioned: Any = SimpleNamespace(name="chromium", executable_path=str(executable))
+    monkeypatch.setattr(browser, "_playwright_has_chromium", lambda: True)
+
+    assert browser.is_chromium_installed() is True
+    browser.ensure_chromium(provisioned, install_browser=True)
+
+    assert installs == []
+    assert browser.will_install(install_browser=True) is False  # stamped, so no driver is asked next time
+
+
+def test_the_installer_can_be_skipped(
+    monkeypatch: pytest.MonkeyPatch,
+    installs: list[list[Any]],
+) -> None:
+    browser.ensure_chromium(CHROMIUM, install_browser=False)
+    monkeypatch.setenv(browser.SKIP_INSTALL_ENV, "1")
+    browser.ensure_chromium(CHROMIUM, install_browser=True)
+
+    assert installs == []
+
+
+def test_a_failed_install_is_retried_next_time(
+    monkeypatch: pytest.MonkeyPatch,
+    installs: list[list[Any]],  # noqa: ARG001
+) -> None:
+    monkeypatch.setattr(install_playwright, "install", lambda *_, **__: False)
+
+    browser.ensure_chromium(CHROMIUM, install_browser=True)
+
+    assert browser.is_chromium_installed() is False
+
+
+def test_a_stale_install_stamp_is_dropped_and_installed_again(installs: list[list[Any]]) -> None:
+    browser.ensure_chromium(CHROMIUM, install_browser=True)
+    missing = Exception("BrowserType.launch: Executable doesn't exist at /root/.cache/ms-playwright/chrome")
+
+    assert browser.reinstall_needed(missing, install_browser=True) is True
+    assert browser.is_chromium_installed() is False
+    browser.ensure_chromium(CHROMIUM, install_browser=True)
+
+    assert len(installs) == 2
+
+
+def test_a_missing_browser_is_installed_again_only_once(installs: list[list[Any]]) -> None:  # noqa: ARG001
+    missing = Exception("Executable doesn't exist")
+
+    # No stamp: the installer already ran for this launch, or never will.
+    assert browser.reinstall_needed(missing, install_browser=True) is False
+
+
+def test_other_launch_failures_keep_the_stamp(installs: list[list[Any]]) -> None:  # noqa: ARG001
+    browser.ensure_chromium(CHROMIUM, install_browser=True)
+
+    assert browser.reinstall_needed(Exception("Target closed"), install_browser=True) is False
+    assert browser.is_chromium_installed() is True
+
+
+def test_a_stale_stamp_is_not_reinstalled_when_installing_is_disabled(
+    monkeypatch: pytest.MonkeyPatch,
+    installs: list[list[Any]],  # noqa: ARG001
+) -> None:
+    browser.ensure_chromium(CHROMIUM, install_browser=True)
+    monkeypatch.setenv(browser.SKIP_INSTALL_ENV, "1")
+
+    assert browser.reinstall_needed(Exception("Executable doesn't exist"), install_browser=True) is False
+    assert browser.will_install(install_browser=True) is False
+
+
+def test_launch_chromium_reinstalls_once_after_a_stale_stamp(installs: list[list[Any]]) -> None:
+    from playwright.sync_api import Error  # noqa: PLC0415
+
+    browser.ensure_chromium(CHROMIUM, install_browser=True)
+    launches: list[dict[str, Any]] = []
+
+    def launch(**options: Any) -> str:
+        launches.append(options)
+        if len(launches) == 1:
+            msg = "Executable doesn't exist at /gone/chrome"
+            raise Error(msg)
+        return "browser"
+
+    chromium: Any = SimpleNamespace(name="chromium", executable_path="/gone/chrome", launch=launch)
+
+    assert browser.launch_chromium(chromium, headless=True, install_browser=True) == "browser"
+    assert len(launches) == 2
+    assert len(installs) == 2
+
+
+@pytest.mark.parametrize("resource_type", ["image", "media", "font", "stylesheet"])
+def test_heavy_resources_are_blocked(resource_type: str) -> None:
+    assert browser._should_block("https://s.pximg.net/a.bin", resource_type) is True  # noqa: SLF001
+
+
+@pytest.mark.parametrize(
+    "url",
+    [
+        "https://www.google-analytics.com/g/collect?v=2",
+        "https://www.googletagmanager.com/gtag/js?id=G-1",
+        "https://securepubads.g.doubleclick.net/tag/js/gpt.js",
+    ],
+)
+def test_analytics_are_blocked(url: str) -> None:
+    assert browser._should_block(url, "script") is True  # noqa: SLF001
+
+
+@pytest.mark.parametrize(
+    ("url", "resource_type"),
+    [
+        ("https://accounts.pixiv.net/login", "document"),
+        ("https://accounts.pixiv.net/ajax/login", "fetch"),
+        ("https://www.google.com/recaptcha/enterprise.js", "script"),
+        ("pixiv://account/login?code=abc", "document"),
+        ("pixiv://account/login?code=abc", "image"),
+    ],
+)
+def test_the_login_itself_goes_through(url: str, resource_type: str) -> None:
+    assert browser._should_block(url, resource_type) is False  # noqa: SLF001
+
+
+def test_blocked_requests_are_counted_by_resource_type() -> None:
+    state = browser.LoginState(Endpoints())
+
+    assert state.blocks("https://s.pximg.net/a.png", "image") is True
+    assert state.blocks("https://s.pximg.net/b.png", "image") is True
+    assert state.blocks("https://www.google-analytics.com/analytics.js", "script") is True
+    assert state.blocks("https://accounts.pixiv.net/login", "document") is False
+
+    assert state.traffic.blocked_by_type == {"image": 2, "script": 1}
+    assert state.traffic.blocked == 3
+
+
+def test_the_traffic_summary_reports_no_breakdown_without_blocking() -> None:
+    assert browser.TrafficStats(requests=3).summary() == "Blocked 0 of 3 requests; 0 bytes still came through."
+
+
+def test_a_missing_or_malformed_content_length_counts_as_zero() -> None:
+    assert browser._content_length({"content-length": "1234"}) == 1234  # noqa: SLF001
+    assert browser._content_length({}) == 0  # noqa: SLF001
+    assert browser._content_length({"content-length": "lots"}) == 0  # noqa: SLF001
+
+
+class PendingCredentials:
+    """A future whose result() records when the login first needed it."""
+
+    def __init__(self, events: list[str], credentials: browser.Credentials) -> None:
+        self.events = events
+        self.credentials = credentials
+
+    def result(self) -> browser.Credentials:
+        self.events.append("credentials")
+        return self.credentials
+
+
+@pytest.fixture
+def login_steps(monkeypatch: pytest.MonkeyPatch) -> tuple[list[str], dict[str, Any]]:
+    """Run fetch_authorization's steps as recorders, with no browser behind them."""
+    events: list[str] = []
+    typed: dict[str, Any] = {}
+    page = SimpleNamespace(
+        on=lambda *_: None,
+        goto=lambda *_, **__: events.append("goto"),
+        set_default_timeout=lambda _: events.append("bounded"),
+    )
+
+    @contextmanager
+    def fake_context(**_: Any) -> Generator[Any]:
+        events.append("launch")
+        yield SimpleNamespace(new_page=lambda: page)
+
+    def fake_enter(_: Any, username: str, password: str, *, totp: Any, **__: Any) -> float:
+        typed.update(username=username, password=password, totp=totp)
+        return 0.0
+
+    def fake_callback(_: Any, captured: dict[str, str], __: float, **___: Any) -> None:
+        captured["code"] = "the-code"
+
+    monkeypatch.setattr(browser, "_browser_context", fake_context)
+    monkeypatch.setattr(browser, "_enter_credentials", fake_enter)
+    monkeypatch.setattr(browser, "_wait_for_callback", fake_callback)
+    return events, typed
+
+
+def test_pending_credentials_are_awaited_once_the_form_is_up(
+    monkeypatch: pytest.MonkeyPatch,
+    login_steps: tuple[list[str], dict[str, Any]],
+) -> None:
+    events, typed = login_steps
+    monkeypatch.setattr(browser, "_wait_for_form", lambda *_, **__: events.append("form") or True)
+    totp = TotpProvider(SECRET)
+    pending: Any = PendingCredentials(events, browser.Credentials("me", "pw", totp))
+
+    browser.fetch_authorization("", "", headless=True, credentials=pending)
+
+    assert events == ["launch", "goto", "form", "credentials"]
+    assert typed == {"username": "me", "password": "pw", "totp": totp}
+
+
+def test_a_reused_session_never_waits_for_the_credentials(
+    monkeypatch: pytest.MonkeyPatch,
+    login_steps: tuple[list[str], dict[str, Any]],
+) -> None:
+    events, typed = login_steps
+    monkeypatch.setattr(browser, "_wait_for_form", lambda *_, **__: False)
+    pending: Any = PendingCredentials(events, browser.Credentials("me", "pw"))
+
+    authorization = browser.fetch_authorization("", "", headless=True, credentials=pending)
+
+    assert authorization.session_reused is True
+    assert "credentials" not in events
+    assert typed == {}
+
+
+def test_every_wait_is_capped_by_the_deadline() -> None:
+    page: Any = FakePage(form=True)
+    deadline = Deadline(timedelta(seconds=2))
+
+    browser._wait_for_form(page, {}, deadline=deadline)  # noqa: SLF001
+    browser._handle_totp(page, None, {}, "instant", deadline=deadline)  # noqa: SLF001
+    with pytest.raises(LoginError):
+        browser._wait_for_callback(page, {}, browser.REDIRECT_TIMEOUT_MS, deadline=deadline)  # noqa: SLF001
+
+    assert len(page.timeouts) == 3
+    assert all(0 < timeout <= 2000 for timeout in page.timeouts)
+
+
+def test_without_a_deadline_every_wait_keeps_its_own_timeout() -> None:
+    page: Any = FakePage(form=True)
+
+    browser._wait_for_form(page, {})  # noqa: SLF001
+
+    assert page.timeouts == [browser.FORM_TIMEOUT_MS]
+
+
+def test_a_login_failing_past_the_deadline_reports_the_deadline(
+    monkeypatch: pytest.MonkeyPatch,
+    login_steps: tuple[list[str], dict[str, Any]],
+) -> None:
+    events, _ = login_steps
+
+    def slow_form(*_: Any, **__: Any) -> bool:
+        time.sleep(0.1)
+        msg = "Login form did not appear."
+        raise LoginError(msg)
+
+    monkeypatch.setattr(browser, "_wait_for_form", slow_form)
+
+    with pytest.raises(DeadlineExceededError, match="during the browser login") as raised:
+        browser.fetch_authorization("me", "pw", headless=True, deadline=Deadline(timedelta(seconds=0.05)))
+
+    assert isinstance(raised.value.__cause__, LoginError)
+    assert events == ["launch", "bounded", "goto"]
+
+
+def test_a_login_failing_within_the_deadline_is_a_login_error(
+    monkeypatch: pytest.MonkeyPatch,
+    login_steps: tuple[list[str], dict[str, Any]],  # noqa: ARG001
+) -> None:
+    def no_form(*_: Any, **__: Any) -> bool:
+        msg = "Login form did not appear."
+        raise LoginError(msg)
+
+    monkeypatch.setattr(browser, "_wait_for_form", no_form)
+
+    with pytest.raises(LoginError):
+        browser.fetch_authorization("me", "pw", headless=True, deadline=Deadline(timedelta(minutes=1)))
+
+
+def test_credentials_are_awaited_within_the_deadline(
+    monkeypatch: pytest.MonkeyPatch,
+    login_steps: tuple[list[str], dict[str, Any]],  # noqa: ARG001
+) -> None:
+    monkeypatch.setattr(browser, "_wait_for_form", lambda *_, **__: True)
+    never: Future[browser.Credentials] = Future()
+
+    with pytest.raises(DeadlineExceededError):
+        browser.fetch_authorization(
+            "",
+            "",
+            headless=True,
+            credentials=never,
+            deadline=Deadline(timedelta(seconds=0.05)),
+        )
@@ -0,0 +1,127 @@
+from __future__ import annotations
+
+from typing import TYPE_CHECKING
+
+import pytest
+
+import gppt
+from gppt import token
+from gppt.cache import TokenCache
+from tests.conftest import make_token
+
+if TYPE_CHECKING:
+    from pathlib import Path
+
+
+@pytest.fixture
+def reads(monkeypatch: pytest.MonkeyPatch) -> list[str]:
+    """Count the reads that reach the token file."""
+    calls: list[str] = []
+    real_load = token.load
+
+    def counting_load(profile: str) -> token.Token | None:
+        calls.append(profile)
+        return real_load(profile)
+
+    monkeypatch.setattr(token, "load", counting_load)
+    return calls
+
+
+def test_a_valid_token_is_read_once(config_dir: Path, reads: list[str]) -> None:  # noqa: ARG001
+    token.save("work", make_token("cached"))
+    cache = TokenCache()
+
+    first = cache.load("work")
+    second = cache.load("work")
+
+    assert first is second
+    assert reads == ["work"]
+    assert len(cache) == 1
+
+
+def test_a_save_elsewhere_is_picked_up(config_dir: Path, reads: list[str]) -> None:  # noqa: ARG001
+    token.save("work", make_token("old"))
+    cache = TokenCache()
+    cache.load("work")
+
+    token.save("work", make_token("new"))  # another process, say
+
+    loaded = cache.load("work")
+    assert loaded is not None
+    assert loaded.access_token == "new"
+    assert len(reads) == 2
+
+
+def test_a_save_through_the_cache_needs_no_read(config_dir: Path, reads: list[str]) -> None:  # noqa: ARG001
+    cache = TokenCache()
+    issued = make_token("new")
+
+    cache.save("work", issued)
+
+    assert cache.load("work") is issued
+    assert reads == []
+
+
+def test_a_token_near_expiry_is_not_served_from_memory(config_dir: Path, reads: list[str]) -> None:  # noqa: ARG001
+    token.save("work", make_token("soon", seconds=30))  # inside EXPIRY_MARGIN
+    cache = TokenCache()
+
+    cache.load("work")
+    cache.load("work")
+
+    assert len(reads) == 2
+
+
+def test_a_deleted_cache_is_forgotten(config_dir: Path) -> None:
+    cache = TokenCache()
+    cache.save("work", make_token())
+
+    (config_dir / "work.token.json").unlink()
+
+    assert cache.load("work") is None
+    assert len(cache) == 0
+
+
+def test_get_token_serves_a_valid_token_from_memory(
+    monkeypatch: pytest.MonkeyPatch,
+    config_dir: Path,  # noqa: ARG001
+    reads: list[str],
+) -> None:
+    token.save("work", make_token("cached"))
+    monkeypatch.setattr(token, "save", lambda *_, **__: pytest.fail("a valid token was written back"))
+    cache = TokenCache()
+
+    for _ in range(5):
+        assert gppt.get_token("work", cache=cache).access_token == "cached"
+
+    assert reads == ["work"]
+
+
+def test_get_token_remembers_a_refreshed_token(
+    monkeypatch: pytest.MonkeyPatch,
+    config_dir: Path,  # noqa: ARG001
+    reads: list[str],
+) -> None:
+    token.save("work", make_token("stale", seconds=-10))
+    monkeypatch.setattr(token, "refresh", lambda *_, **__: make_token("refreshed"))
+    cache = TokenCache()
+
+    gppt.get_token("work", cache=cache)
+    reads.clear()
+
+    assert gppt.get_token("work", cache=cache).access_token == "refreshed"
+    assert reads == []
+
+
+def test_clear_forgets_everything(config_dir: Path, reads: list[str]) -> None:  # noqa: ARG001
+    cache = TokenCache()
+    cache.save("work", make_token())
+
+    cache.clear()
+    cache.load("work")
+
+    assert reads == ["work"]
+
+
+def test_the_cache_is_exported() -> None:
+    assert gppt.TokenCache is TokenCache
@@ -1,50 +1,36 @@
 from __future__ import annotations
 
+import http.client
 import json
-from datetime import datetime, timedelta, timezone
+import os
+import signal
+import threading
+import time
 from typing import TYPE_CHECKING, Any
 
 import pytest
 
 from gppt import api, cli, config, token, __version__
 from gppt.browser import Authorization, LoginError
+from gppt.server import TokenServer
+from tests.conftest import make_token
 
 if TYPE_CHECKING:
     from pathlib import Path
 
 
-def _token(access_token: str = "at", *, seconds: int = 3600) -> token.Token:
-    return token.Token(
-        access_token=access_token,
-        refresh_token="rt",
-        expires_in=seconds,
-        expires_at=(datetime.now(tz=timezone.utc) + timedelta(seconds=seconds)).isoformat(),
-        user_name="Me",
-        user_account="me",
-    )
-
-
-@pytest.fixture
-def config_dir(monkeypatch: pytest.MonkeyPatch, tmp_path: Path) -> Path:
-    monkeypatch.setattr(config, "CONFIG_DIR", tmp_path)
-    monkeypatch.delenv(config.USERNAME_ENV, raising=False)
-    monkeypatch.delenv(config.PASSWORD_ENV, raising=False)
-    monkeypatch.delenv(config.TOTP_SECRET_ENV, raising=False)
-    return tmp_path
-
-
 @pytest.fixture
 def no_browser(monkeypatch: pytest.MonkeyPatch) -> list[dict[str, Any]]:
     """Replace the browser login with a recorder, so no Chromium is launched."""
     calls: list[dict[str, Any]] = []
 
-    def fake_fetch(username: str, password: str, *, headless: bool, totp: Any = None) -> Authorization:
-        calls.append({"username": username, "password": password, "headless": headless, "totp": totp})
+    def fake_fetch(username: str, password: str, *, headless: bool, totp: Any = None, **options: Any) -> Authorization:
+        calls.append({"username": username, "password": password, "headless": headless, "totp": totp, **options})
         return Authorization(code="the-code", code_verifier="the-verifier")
 
     monkeypatch.setattr(api, "fetch_authorization", fake_fetch)
-    monkeypatch.setattr(api, "is_chromium_installed", lambda: True)
-    monkeypatch.setattr(token, "exchange", lambda _: _token())
+    monkeypatch.setattr(api, "will_install", lambda **_: False)
+    monkeypatch.setattr(token, "exchange", lambda *_, **__: make_token())
     return calls
 
 
@@ -98,7 +84,7 @@ def test_login_reuses_a_valid_cached_token(
     no_browser: list[dict[str, Any]],
     capsys: pytest.CaptureFixture[str],
 ) -> None:
-    token.save("work", _token("cached"))
+    token.save("work", make_token("cached"))
 
     assert cli.main(["login", "-p", "work"]) == 0
 
@@ -110,21 +96,53 @@ def test_force_bypasses_the_cache(
     config_dir: Path,  # noqa: ARG001
     no_browser: list[dict[str, Any]],
 ) -> None:
-    token.save("work", _token("cached"))
+    token.save("work", make_token("cached"))
 
     assert cli.main(["login", "-p", "work", "--force"]) == 0
 
     assert len(no_browser) == 1
 
 
+def test_timings_are_printed_after_the_login(
+    config_dir: Path,  # noqa: ARG001
+    no_browser: list[dict[str, Any]],  # noqa: ARG001
+    capsys: pytest.CaptureFixture[str],
+) -> None:
+    config.save("work", config.ProfileConfig(username="me", password="pw"))
+
+    assert cli.main(["login", "-p", "work", "--timings"]) == 0
+
+    err = capsys.readouterr().err
+    assert "Timings:" in err
+    assert "cache read" in err
+    assert "token exchange" in err
+
+
+def test_timings_are_printed_after_a_failed_login(
+    monkeypatch: pytest.MonkeyPatch,
+    config_dir: Path,  # noqa: ARG001
+    capsys: pytest.CaptureFixture[str],
+) -> None:
+    def fail(*_: Any, **__: Any) -> Authorization:
+        msg = "Login form did not appear."
+        raise LoginError(msg)
+
+    monkeypatch.setattr(api, "fetch_authorization", fail)
+    monkeypatch.setattr(api, "will_install", lambda **_: False)
+
+    assert cli.main(["login", "--timings"]) == 1
+
+    assert "Timings:" in capsys.readouterr().err
+
+
 def test_an_expired_token_is_refreshed(
     monkeypatch: pytest.MonkeyPatch,
     config_dir: Path,  # noqa: ARG001
     no_browser: list[dict[str, Any]],
     capsys: pytest.CaptureFixture[str],
 ) -> None:
-    token.save("work", _token("stale", seconds=-10))
-    monkeypatch.setattr(token, "refresh", lambda _: _token("refreshed"))
+    token.save("work", make_token("stale", seconds=-10))
+    monkeypatch.setattr(token, "refresh", lambda *_, **__: make_token("refreshed"))
 
     assert cli.main(["login", "-p", "work"]) == 0
 
@@ -137,9 +155,9 @@ def test_a_failed_refresh_falls_back_to_the_browser(
     config_dir: Path,  # noqa: ARG001
     no_browser: list[dict[str, Any]],
 ) -> None:
-    token.save("work", _token("stale", seconds=-10))
+    token.save("work", make_token("stale", seconds=-10))
 
-    def fail(_: str) -> token.Token:
+    def fail(*_: Any, **__: Any) -> token.Token:
         msg = "invalid_grant"
         raise token.TokenError(msg)
 
@@ -159,7 +177,7 @@ def test_json_output(
 
     printed = json.loads(capsys.readouterr().out)
     assert printed["access_token"] == "at"
-    assert printed["refresh_token"] == "rt"
+    assert printed["refresh_token"] == "rt-at"
     assert printed["expires_in"] == 3600
 
 
@@ -228,3 +246,171 @@ def test_no_subcommand_is_an_error() -> None:
         cli.main([])
 
     assert exc.value.code == 2
+
+
+def test_refresh_all_prints_a_summary(
+    monkeypatch: pytest.MonkeyPatch,
+    config_dir: Path,  # noqa: ARG001
+    no_browser: list[dict[str, Any]],
+    capsys: pytest.CaptureFixture[str],
+) -> None:
+    token.save("fresh", make_token("fresh"))
+    token.save("stale", make_token("stale", seconds=-10))
+    monkeypatch.setattr(token, "refresh", lambda *_, **__: make_token("refreshed"))
+
+    assert cli.main(["refresh-all", "--workers", "2"]) == 0
+
+    out = capsys.readouterr().out
+    assert "fresh  valid" in out
+    assert "stale  refreshed" in out
+    assert no_browser == []
+
+
+def test_refresh_all_exits_nonzero_on_a_failure(
+    monkeypatch: pytest.MonkeyPatch,
+    config_dir: Path,  # noqa: ARG001
+    capsys: pytest.CaptureFixture[str],
+) -> None:
+    token.save("stale", make_token("stale", seconds=-10))
+
+    def fail(*_: Any, **__: Any) -> token.Token:
+        msg = "invalid_grant"
+        raise token.TokenError(msg)
+
+    monkeypatch.setattr(token, "refresh", fail)
+
+    assert cli.main(["refresh-all", "stale"]) == 1
+    assert "invalid_grant" in capsys.readouterr().out
+
+
+def test_refresh_all_without_cached_tokens(
+    config_dir: Path,  # noqa: ARG001
+    capsys: pytest.CaptureFixture[str],
+) -> None:
+    assert cli.main(["refresh-all"]) == 0
+    assert "No cached tokens" in capsys.readouterr().err
+
+
+def test_block_resources_is_passed_to_the_browser(
+    config_dir: Path,  # noqa: ARG001
+    no_browser: list[dict[str, Any]],
+) -> None:
+    config.save("work", config.ProfileConfig(username="me", password="pw"))
+
+    assert cli.main(["login", "-p", "work", "--block-resources"]) == 0
+
+    assert no_browser[0]["block_resources"] is True
+
+
+def test_typing_mode_is_passed_to_the_browser(
+    config_dir: Path,  # noqa: ARG001
+    no_browser: list[dict[str, Any]],
+) -> None:
+    config.save("work", config.ProfileConfig(username="me", password="pw"))
+
+    assert cli.main(["login", "-p", "work", "--typing", "instant"]) == 0
+
+    assert no_browser[0]["typing"] == "instant"
+
+
+def test_configure_keeps_settings_it_does_not_ask_about(
+    monkeypatch: pytest.MonkeyPatch,
+    config_dir: Path,  # noqa: ARG001
+) -> None:
+    config.save("work", config.ProfileConfig(username="old", typing="fast"))
+    monkeypatch.setattr("builtins.input", lambda _: "new")
+    monkeypatch.setattr(cli.getpass, "getpass", lambda _: "")
+
+    assert cli.main(["configure", "-p", "work"]) == 0
+
+    assert config.load("work") == config.ProfileConfig(username="new", typing="fast")
+
+
+def test_keep_session_is_passed_to_the_browser(
+    config_dir: Path,
+    no_browser: list[dict[str, Any]],
+) -> None:
+    assert cli.main(["login", "--keep-session"]) == 0
+
+    assert no_browser[0]["storage_state"] == config_dir / f"{config.DEFAULT_PROFILE}.state.json"
+
+
+def test_daemon_refreshes_until_terminated(
+    monkeypatch: pytest.MonkeyPatch,
+    config_dir: Path,  # noqa: ARG001
+    capsys: pytest.CaptureFixture[str],
+) -> None:
+    token.save("stale", make_token("stale", seconds=-10))
+    token.save("fresh", make_token("fresh"))
+
+    def refresh_then_terminate(*_: Any, **__: Any) -> token.Token:
+        # SIGTERM is handled on the main thread, which is blocked in the daemon.
+        threading.Timer(0.05, os.kill, (os.getpid(), signal.SIGTERM)).start()
+        return make_token("refreshed")
+
+    monkeypatch.setattr(token, "refresh", refresh_then_terminate)
+
+    assert cli.main(["daemon", "--jitter", "0"]) == 0
+
+    out = capsys.readouterr().out
+    assert "stale  refreshed" in out
+    assert not any(line.startswith("fresh") for line in out.splitlines())  # still valid: not reported
+    assert signal.getsignal(signal.SIGTERM) is signal.SIG_DFL
+
+
+def test_daemon_without_cached_tokens(
+    config_dir: Path,  # noqa: ARG001
+    capsys: pytest.CaptureFixture[str],
+) -> None:
+    assert cli.main(["daemon"]) == 0
+    assert "No cached tokens" in capsys.readouterr().err
+
+
+def test_serve_answers_until_terminated(
+    monkeypatch: pytest.MonkeyPatch,
+    config_dir: Path,  # noqa: ARG001
+    capsys: pytest.CaptureFixture[str],
+) -> None:
+    token.save("work", make_token("cached"))
+    answers: list[int] = []
+    real_run = TokenServer.run
+
+    def run_and_query(server: TokenServer) -> None:
+        def query() -> None:
+            time.sleep(0.05)
+            address = server.address
+            assert isinstance(address, tuple)
+            connection = http.client.HTTPConnection(*address, timeout=5)
+            connection.request("GET", "/token/work")
+            answers.append(connection.getresponse().status)
+            connection.close()
+            os.kill(os.getpid(), signal.SIGTERM)
+
+        threading.Thread(target=query).start()
+        real_run(server)
+
+    monkeypatch.setattr(TokenServer, "run", run_and_query)
+
+    assert cli.main(["serve", "--port", "0"]) == 0
+
+    assert answers == [200]
+    assert "Serving tokens on http://127.0.0.1:" in capsys.readouterr().err
+
+
+def test_serve_listens_on_a_private_socket_by_default(
+    monkeypatch: pytest.MonkeyPatch,
+    config_dir: Path,
+    capsys: pytest.CaptureFixture[str],
+) -> None:
+    addresses: list[Any] = []
+
+    def record(server: TokenServer) -> None:
+        addresses.append(server.address)
+        server.stop()
+
+    monkeypatch.setattr(TokenServer, "run", record)
+
+    assert cli.main(["serve"]) == 0
+
+    assert addresses == [str(config_dir / "serve.sock")]
+    assert f"Serving tokens on {config_dir / 'serve.sock'}" in capsys.readouterr().err
@@ -2,7 +2,7 @@ from __future__ import annotations
 
 import json
 import stat
-from typing import TYPE_CHECKING
+from typing import TYPE_CHECKING, Any
 
 import pytest
 
@@ -32,6 +32,9 @@ def test_save_then_load_roundtrip(monkeypatch: pytest.MonkeyPatch, tmp_path: Pat
         "username": "me@example.com",
         "password": "hunter2",
         "totp_secret": "JBSWY3DPEHPK3PXP",
+        "typing": "human",
+        "keep_session": False,
+        "endpoints": {},
     }
     assert config.load("work") == saved
 
@@ -44,6 +47,21 @@ def test_save_makes_the_file_private(monkeypatch: pytest.MonkeyPatch, tmp_path:
     assert stat.S_IMODE(path.stat().st_mode) == 0o600
 
 
+def test_a_failed_write_keeps_the_old_file(monkeypatch: pytest.MonkeyPatch, tmp_path: Path) -> None:
+    path = tmp_path / "work.json"
+    config.write_private_file(path, "old")
+
+    def fail(*_: Any) -> None:
+        raise OSError
+
+    monkeypatch.setattr(config.Path, "replace", fail)
+    with pytest.raises(OSError):  # noqa: PT011
+        config.write_private_file(path, "new")
+
+    assert path.read_text(encoding="utf-8") == "old"
+    assert [entry.name for entry in tmp_path.iterdir()] == ["work.json"]
+
+
 def test_load_missing_profile_raises(monkeypatch: pytest.MonkeyPatch, tmp_path: Path) -> None:
     _use_tmp_config_dir(monkeypatch, tmp_path)
 
@@ -81,3 +99,18 @@ def test_token_path_sits_beside_the_profile(monkeypatch: pytest.MonkeyPatch, tmp
     _use_tmp_config_dir(monkeypatch, tmp_path)
 
     assert config.token_path("work") == tmp_path / "work.token.json"
+
+
+def test_cached_profiles_lists_every_token_cache(monkeypatch: pytest.MonkeyPatch, tmp_path: Path) -> None:
+    _use_tmp_config_dir(monkeypatch, tmp_path)
+    for name in ("work.token.json", "home.token.json", "work.json"):
+        (tmp_path / name).write_text("{}", encoding="utf-8")
+
+    assert config.cached_profiles() == ["home", "work"]
+
+
+def test_state_path_sits_next_to_the_token(monkeypatch: pytest.MonkeyPatch, tmp_path: Path) -> None:
+    _use_tmp_config_dir(monkeypatch, tmp_path)
+
+    assert config.state_path("work") == tmp_path / "work.state.json"
+    assert config.state_path("work").parent == config.token_path("work").parent
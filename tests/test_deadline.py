@@ -0,0 +1,157 @@
+from __future__ import annotations
+
+import time
+from datetime import timedelta
+from typing import TYPE_CHECKING, Any
+
+import pytest
+import requests
+
+import gppt
+from gppt import retry, token
+from gppt.deadline import Deadline, DeadlineExceededError, cap, cap_ms, wait_s
+
+if TYPE_CHECKING:
+    from gppt.retry import CircuitBreaker
+
+
+@pytest.fixture(autouse=True)
+def breakers(monkeypatch: pytest.MonkeyPatch) -> dict[str, CircuitBreaker]:
+    fresh: dict[str, CircuitBreaker] = {}
+    monkeypatch.setattr(retry, "_breakers", fresh)
+    return fresh
+
+
+class _Response:
+    def __init__(self, status_code: int = 200, headers: dict[str, str] | None = None) -> None:
+        self.status_code = status_code
+        self.headers = headers or {}
+
+    def json(self) -> dict[str, Any]:
+        return {"access_token": "at", "expires_in": 3600}
+
+
+@pytest.fixture
+def sent(monkeypatch: pytest.MonkeyPatch) -> list[Any]:
+    """Answer every token request at once, recording its timeout."""
+    timeouts: list[Any] = []
+
+    def fake_post(*_: Any, timeout: Any, **__: Any) -> _Response:
+        timeouts.append(timeout)
+        return _Response()
+
+    monkeypatch.setattr(token.requests, "post", fake_post)
+    return timeouts
+
+
+def test_a_deadline_counts_down() -> None:
+    deadline = Deadline(timedelta(seconds=10))
+
+    assert 9 < deadline.remaining_s <= 10
+    assert not deadline.expired
+
+
+def test_a_spent_deadline_refuses_the_next_phase() -> None:
+    deadline = Deadline(timedelta(0))
+
+    assert deadline.expired
+    with pytest.raises(DeadlineExceededError, match="deadline before the refresh"):
+        deadline.check("the refresh")
+
+
+def test_a_deadline_is_a_timeout() -> None:
+    assert issubclass(DeadlineExceededError, TimeoutError)
+    assert gppt.DeadlineExceededError is DeadlineExceededError
+
+
+def test_cap_shortens_only_what_outlasts_the_deadline() -> None:
+    deadline = Deadline(timedelta(seconds=2))
+
+    assert cap(deadline, 1.0, "x") == 1.0
+    assert 1.9 < cap(deadline, 10.0, "x") <= 2
+    assert cap(None, 10.0, "x") == 10.0
+
+
+def test_cap_ms_never_asks_playwright_for_no_timeout() -> None:
+    deadline = Deadline(timedelta(seconds=2))
+
+    assert 1_900 < cap_ms(deadline, 5_000, "x") <= 2_000
+    assert cap_ms(deadline, 0, "x") == 1  # 0 would wait for ever
+    assert cap_ms(None, 5_000, "x") == 5_000
+
+
+def test_wait_s_is_unbounded_without_a_deadline() -> None:
+    assert wait_s(None, "x") is None
+    assert 0 < (wait_s(Deadline(timedelta(seconds=1)), "x") or 0) <= 1
+
+
+def test_connect_and_read_have_their_own_timeouts(sent: list[Any]) -> None:
+    token.refresh("rt")
+
+    assert sent == [(token.CONNECT_TIMEOUT, token.READ_TIMEOUT)]
+    assert token.CONNECT_TIMEOUT < token.READ_TIMEOUT
+
+
+def test_a_request_waits_no_longer_than_the_deadline(sent: list[Any]) -> None:
+    gppt.refresh("rt", deadline=timedelta(seconds=5))
+
+    connect, read = sent[0]
+    assert connect <= token.CONNECT_TIMEOUT
+    assert 4.9 < connect + read <= 5  # one budget for the whole try
+
+
+def test_a_short_deadline_is_split_between_connect_and_read(sent: list[Any]) -> None:
+    gppt.refresh("rt", deadline=timedelta(seconds=2))
+
+    connect, read = sent[0]
+    assert 0 < connect == read <= 1
+
+
+def test_an_answer_that_comes_too_late_is_past_the_deadline(monkeypatch: pytest.MonkeyPatch) -> None:
+    def trickle(*_: Any, **__: Any) -> _Response:
+        time.sleep(0.1)  # a body dripping in, each chunk within the read timeout
+        return _Response()
+
+    monkeypatch.setattr(token.requests, "post", trickle)
+
+    with pytest.raises(DeadlineExceededError, match="HTTP 200, too late"):
+        gppt.refresh("rt", deadline=timedelta(seconds=0.05))
+
+
+def test_a_spent_deadline_sends_nothing(sent: list[Any]) -> None:
+    with pytest.raises(DeadlineExceededError, match="before the token request"):
+        token.refresh("rt", deadline=Deadline(timedelta(0)))
+
+    assert sent == []
+
+
+def test_no_retry_is_started_that_the_deadline_cannot_wait_for(monkeypatch: pytest.MonkeyPatch) -> None:
+    requested: list[str] = []
+
+    def busy(*_: Any, **__: Any) -> _Response:
+        requested.append("post")
+        return _Response(503, {"Retry-After": "5"})
+
+    monkeypatch.setattr(token.requests, "post", busy)
+    monkeypatch.setattr(token.time, "sleep", lambda _: pytest.fail("slept past the deadline"))
+
+    with pytest.raises(DeadlineExceededError, match=r"last: HTTP 503"):
+        gppt.refresh("rt", deadline=timedelta(seconds=1))
+
+    assert requested == ["post"]
+
+
+def test_running_out_of_time_is_not_held_against_pixiv(
+    monkeypatch: pytest.MonkeyPatch,
+    breakers: dict[str, CircuitBreaker],
+) -> None:
+    def slow(*_: Any, timeout: tuple[float, float], **__: Any) -> _Response:
+        time.sleep(sum(timeout))
+        raise requests.ReadTimeout
+
+    monkeypatch.setattr(token.requests, "post", slow)
+
+    with pytest.raises(DeadlineExceededError, match="ReadTimeout"):
+        gppt.refresh("rt", deadline=timedelta(seconds=0.05))
+
+    assert [breaker._failures for breaker in breakers.values()] == [0]  # noqa: SLF001
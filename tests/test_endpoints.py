@@ -0,0 +1,125 @@
+from __future__ import annotations
+
+from typing import TYPE_CHECKING, Any
+
+import pytest
+
+import gppt
+from gppt import api, config, consts, token
+from gppt.browser import Authorization
+from gppt.endpoints import ENV, PIXIV, Endpoints
+from tests.conftest import make_token
+from tests.mock_pixiv import MockPixiv
+
+if TYPE_CHECKING:
+    from collections.abc import Iterator
+    from pathlib import Path
+
+
+@pytest.fixture(autouse=True)
+def clean_env(monkeypatch: pytest.MonkeyPatch) -> None:
+    for variable in ENV.values():
+        monkeypatch.delenv(variable, raising=False)
+
+
+@pytest.fixture
+def pixiv() -> Iterator[MockPixiv]:
+    with MockPixiv() as running:
+        yield running
+
+
+def test_the_defaults_are_pixivs() -> None:
+    assert Endpoints.from_env() == PIXIV
+    assert PIXIV.auth_token_url == consts.AUTH_TOKEN_URL
+    assert PIXIV.login_url == consts.LOGIN_URL
+    assert PIXIV.redirect_uri == consts.REDIRECT_URI
+    assert PIXIV.callback_uri == consts.CALLBACK_URI
+
+
+def test_the_environment_overrides_the_configured_endpoints(monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.setenv("GPPT_AUTH_TOKEN_URL", "http://env/auth/token")
+
+    endpoints = Endpoints.from_env({"auth_token_url": "http://profile/auth/token", "login_url": "http://profile/login"})
+
+    assert endpoints.auth_token_url == "http://env/auth/token"
+    assert endpoints.login_url == "http://profile/login"
+    assert endpoints.redirect_uri == consts.REDIRECT_URI
+
+
+def test_an_unknown_endpoint_is_refused() -> None:
+    with pytest.raises(ValueError, match="auth_url"):
+        Endpoints.from_env({"auth_url": "http://typo"})
+
+
+def test_refresh_goes_where_it_is_told(pixiv: MockPixiv) -> None:
+    issued = gppt.refresh("rt-mine", endpoints=pixiv.endpoints)
+
+    assert issued.access_token == "at1"
+    assert pixiv.refresh_tokens == ["rt-mine"]
+
+
+def test_refresh_follows_the_environment(monkeypatch: pytest.MonkeyPatch, pixiv: MockPixiv) -> None:
+    monkeypatch.setenv("GPPT_AUTH_TOKEN_URL", pixiv.auth_token_url)
+
+    gppt.refresh("rt-mine")
+
+    assert pixiv.refresh_tokens == ["rt-mine"]
+
+
+def test_exchange_sends_the_configured_callback(monkeypatch: pytest.MonkeyPatch) -> None:
+    sent: dict[str, Any] = {}
+
+    def fake_post(url: str, **kwargs: Any) -> Any:
+        sent.update(url=url, form=kwargs["data"])
+        body = {"access_token": "at", "expires_in": 3600}
+        return type("Response", (), {"status_code": 200, "json": lambda _: body})()
+
+    monkeypatch.setattr(token.requests, "post", fake_post)
+    endpoints = Endpoints(auth_token_url="http://egress/auth/token", callback_uri="http://egress/callback")
+
+    token.exchange(Authorization(code="c", code_verifier="v"), endpoints=endpoints)
+
+    assert sent["url"] == "http://egress/auth/token"
+    assert sent["form"]["redirect_uri"] == "http://egress/callback"
+
+
+def test_get_token_refreshes_through_the_profiles_endpoint(config_dir: Path, pixiv: MockPixiv) -> None:  # noqa: ARG001
+    config.save("work", config.ProfileConfig(endpoints={"auth_token_url": pixiv.auth_token_url}))
+    token.save("work", make_token("stale", seconds=-10))
+
+    assert gppt.get_token("work").access_token == "at1"
+    assert pixiv.refresh_tokens == ["rt-stale"]
+
+
+def test_refresh_many_uses_each_profiles_endpoint(config_dir: Path, pixiv: MockPixiv) -> None:  # noqa: ARG001
+    config.save("work", config.ProfileConfig(endpoints={"auth_token_url": pixiv.auth_token_url}))
+    token.save("work", make_token("stale", seconds=-10))
+
+    (result,) = api.refresh_many(["work"])
+
+    assert result.status == "refreshed"
+    assert pixiv.refresh_tokens == ["rt-stale"]
+
+
+def test_a_browser_login_is_sent_to_the_given_endpoints(monkeypatch: pytest.MonkeyPatch) -> None:
+    calls: list[Any] = []
+
+    def fake_fetch(*_: Any, endpoints: Endpoints, **__: Any) -> Authorization:
+        calls.append(endpoints)
+        return Authorization(code="the-code", code_verifier="the-verifier")
+
+    def fake_exchange(_: Authorization, *, endpoints: Endpoints, **__: Any) -> token.Token:
+        calls.append(endpoints)
+        return make_token()
+
+    monkeypatch.setattr(api, "fetch_authorization", fake_fetch)
+    monkeypatch.setattr(token, "exchange", fake_exchange)
+    endpoints = Endpoints(login_url="http://mock/login")
+
+    gppt.login("me", "pw", endpoints=endpoints)
+
+    assert calls == [endpoints, endpoints]
+
+
+def test_the_endpoints_are_exported() -> None:
+    assert gppt.Endpoints is Endpoints
@@ -1,7 +1,67 @@
 from __future__ import annotations
 
+import subprocess
+import sys
+
+import pytest
+
 from gppt import __version__
 
+# Budget for `import gppt`, in microseconds of cumulative import time. The
+# browser stack alone (Playwright, its installer and pyotp) used to take
+# roughly as long again; it must only load once a browser login starts, and
+# the rest of the public API once one of its names is first used.
+IMPORT_BUDGET_US = 100_000
+
+HEAVY_MODULES = ("playwright", "install_playwright", "pyotp", "greenlet", "requests")
+
+
+def _import_gppt(*flags: str, code: str = "import gppt") -> subprocess.CompletedProcess[str]:
+    return subprocess.run(  # noqa: S603
+        [sys.executable, *flags, "-c", code],
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+
+
+def _cumulative_us(importtime: str, module: str) -> int:
+    for line in importtime.splitlines():
+        # Each line reads: self time, cumulative time, module name -- split on "|".
+        _, cumulative, name = line.rsplit("|", 2)
+        if name.strip() == module:
+            return int(cumulative)
+    msg = f"{module} not found in -X importtime output"
+    raise AssertionError(msg)
+
 
 def test_check_version() -> None:
     assert __version__ is not None
+
+
+def test_import_does_not_load_the_browser_stack() -> None:
+    loaded = _import_gppt(
+        code=f"import sys, gppt; print(sorted({{m.split('.')[0] for m in sys.modules}} & {set(HEAVY_MODULES)!r}))",
+    )
+
+    assert loaded.stdout.strip() == "[]"
+
+
+def test_public_names_load_on_first_use() -> None:
+    loaded = _import_gppt(code="import sys, gppt; gppt.Token; print('gppt.token' in sys.modules)")
+
+    assert loaded.stdout.strip() == "True"
+
+
+def test_an_unknown_name_is_an_attribute_error() -> None:
+    import gppt  # noqa: PLC0415 -- the lazy names are what is under test
+
+    with pytest.raises(AttributeError, match="no attribute 'Nope'"):
+        gppt.Nope  # noqa: B018
+
+
+def test_import_stays_within_its_budget() -> None:
+    # Best of three, so one slow run on a busy machine does not fail the suite.
+    best = min(_cumulative_us(_import_gppt("-X", "importtime").stderr, "gppt") for _ in range(3))
+
+    assert best < IMPORT_BUDGET_US, f"`import gppt` took {best / 1000:.0f} ms (budget {IMPORT_BUDGET_US / 1000:.0f} ms)"
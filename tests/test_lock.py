@@ -0,0 +1,176 @@
+from __future__ import annotations
+
+import subprocess
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from typing import TYPE_CHECKING, Any
+
+import pytest
+
+from gppt import api, lock, token
+from tests.conftest import make_token
+
+if TYPE_CHECKING:
+    from pathlib import Path
+
+fcntl = pytest.importorskip("fcntl")
+
+HOLD_LOCK = """
+import sys
+from pathlib import Path
+
+from gppt import config, lock
+
+config.CONFIG_DIR = Path(sys.argv[1])
+with lock.ProfileLock("work"):
+    print("locked", flush=True)
+    sys.stdin.read()
+"""
+
+
+@pytest.fixture
+def slow_refresh(monkeypatch: pytest.MonkeyPatch) -> list[str]:
+    """Replace the refresh with a slow one that records the refresh tokens it was given."""
+    calls: list[str] = []
+
+    def fake_refresh(refresh_token: str, **_: Any) -> token.Token:
+        calls.append(refresh_token)
+        time.sleep(0.05)  # long enough for every other caller to pile up on the lock
+        return make_token(f"new{len(calls)}")
+
+    monkeypatch.setattr(token, "refresh", fake_refresh)
+    return calls
+
+
+def test_concurrent_get_token_refreshes_once(
+    config_dir: Path,  # noqa: ARG001
+    slow_refresh: list[str],
+) -> None:
+    token.save("work", make_token("stale", seconds=-10))
+
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        issued = list(executor.map(lambda _: api.get_token("work"), range(8)))
+
+    assert slow_refresh == ["rt-stale"]
+    assert {item.access_token for item in issued} == {"new1"}
+    assert token.load("work") == issued[0]
+
+
+def test_a_waiter_refreshes_with_the_newest_refresh_token(
+    config_dir: Path,  # noqa: ARG001
+    slow_refresh: list[str],
+) -> None:
+    token.save("work", make_token("stale", seconds=-10))
+
+    with lock.ProfileLock("work"):
+        waiter = ThreadPoolExecutor(max_workers=1)
+        pending = waiter.submit(api.get_token, "work")
+        time.sleep(0.05)
+        # The holder rotated the refresh token, but what it left is already stale.
+        token.save("work", make_token("rotated", seconds=-10))
+
+    pending.result()
+    waiter.shutdown()
+
+    assert slow_refresh == ["rt-rotated"]
+
+
+def test_refresh_many_does_not_refresh_a_profile_twice(
+    config_dir: Path,  # noqa: ARG001
+    slow_refresh: list[str],
+) -> None:
+    token.save("work", make_token("stale", seconds=-10))
+
+    results = api.refresh_many(["work"] * 4, max_workers=4)
+
+    assert len(slow_refresh) == 1
+    assert sorted(result.status for result in results) == ["refreshed", "valid", "valid", "valid"]
+
+
+def test_the_lock_is_released_on_error(config_dir: Path) -> None:  # noqa: ARG001
+    with pytest.raises(RuntimeError), lock.ProfileLock("work"):
+        raise RuntimeError
+
+    acquired = threading.Event()
+
+    def take() -> None:
+        with lock.ProfileLock("work"):
+            acquired.set()
+
+    worker = threading.Thread(target=take)
+    worker.start()
+    worker.join(timeout=5)
+
+    assert acquired.is_set()
+
+
+def test_the_lock_file_is_private(config_dir: Path) -> None:
+    with lock.ProfileLock("work"):
+        pass
+
+    assert (config_dir / "work.token.lock").stat().st_mode & 0o077 == 0
+
+
+def test_another_process_is_locked_out(config_dir: Path) -> None:
+    with subprocess.Popen(  # noqa: S603
+        [sys.executable, "-c", HOLD_LOCK, str(config_dir)],
+        stdin=subprocess.PIPE,
+        stdout=subprocess.PIPE,
+        text=True,
+    ) as holder:
+        assert holder.stdout is not None
+        assert holder.stdin is not None
+        assert holder.stdout.readline().strip() == "locked"
+
+        with (config_dir / "work.token.lock").open("rb") as fp:
+            with pytest.raises(BlockingIOError):
+                fcntl.flock(fp, fcntl.LOCK_EX | fcntl.LOCK_NB)
+
+            holder.stdin.close()
+            holder.wait(timeout=10)
+            fcntl.flock(fp, fcntl.LOCK_EX | fcntl.LOCK_NB)
+
+
+def test_a_bounded_acquire_gives_up_on_a_held_thread_lock(config_dir: Path) -> None:  # noqa: ARG001
+    results: list[bool] = []
+
+    with lock.ProfileLock("work"):
+        worker = threading.Thread(target=lambda: results.append(lock.ProfileLock("work").acquire(timeout=0.05)))
+        worker.start()
+        worker.join(timeout=5)
+
+    assert results == [False]
+
+
+def test_a_bounded_acquire_gives_up_on_another_process(config_dir: Path) -> None:
+    with subprocess.Popen(  # noqa: S603
+        [sys.executable, "-c", HOLD_LOCK, str(config_dir)],
+        stdin=subprocess.PIPE,
+        stdout=subprocess.PIPE,
+        text=True,
+    ) as holder:
+        assert holder.stdout is not None
+        assert holder.stdin is not None
+        assert holder.stdout.readline().strip() == "locked"
+
+        waiting = lock.ProfileLock("work")
+        assert waiting.acquire(timeout=0.05) is False
+
+        holder.stdin.close()
+        holder.wait(timeout=10)
+        assert waiting.acquire(timeout=5) is True
+        waiting.release()
+
+
+def test_get_token_waits_for_the_lock_only_until_its_deadline(config_dir: Path) -> None:  # noqa: ARG001
+    token.save("work", make_token("stale", seconds=-10))
+    held = lock.ProfileLock("work")
+    held.acquire()
+    try:
+        with pytest.raises(TimeoutError, match="another caller to refresh 'work'"):
+            api.get_token("work", deadline=timedelta(seconds=0.05))
+    finally:
+        held.release()
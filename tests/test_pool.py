@@ -0,0 +1,200 @@
+from __future__ import annotations
+
+import threading
+from datetime import timedelta
+from typing import Any
+
+import playwright.sync_api
+import pytest
+
+from gppt import browser, pool
+from gppt.deadline import Deadline, DeadlineExceededError
+from gppt.pool import BrowserPool
+
+
+class FakeContext:
+    def __init__(self) -> None:
+        self.closed = False
+
+    def close(self) -> None:
+        self.closed = True
+
+
+class FakeBrowser:
+    def __init__(self, headless: bool) -> None:  # noqa: FBT001
+        self.headless = headless
+        self.contexts: list[FakeContext] = []
+        self.closed = False
+        self.connected = True
+
+    def is_connected(self) -> bool:
+        return self.connected
+
+    def new_context(self, **_: Any) -> FakeContext:
+        context = FakeContext()
+        self.contexts.append(context)
+        return context
+
+    def close(self) -> None:
+        self.closed = True
+
+
+class FakePlaywright:
+    def __init__(self) -> None:
+        self.chromium = self
+        self.launched: list[FakeBrowser] = []
+        self.timeouts: list[float] = []
+        self.stopped = False
+
+    def launch(self, *, headless: bool, timeout: float, **_: Any) -> FakeBrowser:
+        self.timeouts.append(timeout)
+        launched = FakeBrowser(headless)
+        self.launched.append(launched)
+        return launched
+
+    def start(self) -> FakePlaywright:
+        return self
+
+    def stop(self) -> None:
+        self.stopped = True
+
+
+@pytest.fixture
+def driver(monkeypatch: pytest.MonkeyPatch) -> FakePlaywright:
+    fake = FakePlaywright()
+    monkeypatch.setattr(playwright.sync_api, "sync_playwright", lambda: fake)
+    monkeypatch.setattr(pool, "ensure_chromium", lambda *_, **__: None)
+    monkeypatch.setattr(browser, "PROXIES", {})
+    return fake
+
+
+@pytest.fixture
+def clock(monkeypatch: pytest.MonkeyPatch) -> list[float]:
+    """A settable stand-in for time.monotonic(): clock[0] is now."""
+    now = [1000.0]
+    monkeypatch.setattr(pool, "monotonic", lambda: now[0])
+    return now
+
+
+def test_nothing_starts_until_the_first_login(driver: FakePlaywright) -> None:
+    BrowserPool()
+
+    assert driver.launched == []
+
+
+def test_logins_share_one_browser_but_not_a_context(driver: FakePlaywright) -> None:
+    with BrowserPool() as warm:
+        with warm.context() as first:
+            pass
+        with warm.context() as second:
+            pass
+
+        assert len(driver.launched) == 1
+        assert isinstance(first, FakeContext)
+        assert isinstance(second, FakeContext)
+        assert first is not second
+        assert first.closed
+        assert second.closed
+
+    assert driver.launched[0].closed
+    assert driver.stopped
+
+
+def test_concurrent_contexts_share_the_browser(driver: FakePlaywright) -> None:
+    with BrowserPool() as warm, warm.context(), warm.context():
+        assert warm.running
+
+    assert len(driver.launched) == 1
+    assert len(driver.launched[0].contexts) == 2
+
+
+def test_idle_browsers_are_recycled_after_the_ttl(driver: FakePlaywright, clock: list[float]) -> None:
+    with BrowserPool(ttl=60) as warm:
+        with warm.context():
+            pass
+        clock[0] += 30
+        with warm.context():
+            pass
+        assert len(driver.launched) == 1
+
+        clock[0] += 61
+        assert warm.prune() is True
+        assert not warm.running
+        assert driver.launched[0].closed
+        with warm.context():
+            pass
+
+    assert len(driver.launched) == 2
+
+
+def test_a_browser_that_went_away_is_relaunched(driver: FakePlaywright) -> None:
+    with BrowserPool() as warm:
+        with warm.context():
+            pass
+        driver.launched[0].connected = False  # crashed, or closed behind the pool's back
+
+        with warm.context():
+            pass
+
+    assert len(driver.launched) == 2
+    assert len(driver.launched[1].contexts) == 1
+
+
+def test_a_browser_that_went_away_is_dropped_even_in_use(driver: FakePlaywright) -> None:
+    with BrowserPool() as warm, warm.context():
+        driver.launched[0].connected = False
+
+        assert warm.prune() is True
+        assert not warm.running
+
+
+def test_a_launch_is_bounded_by_the_deadline(driver: FakePlaywright) -> None:
+    with BrowserPool() as warm, warm.context(deadline=Deadline(timedelta(seconds=2))):
+        pass
+
+    assert 0 < driver.timeouts[0] <= 2000
+
+
+def test_a_spent_deadline_starts_no_browser(driver: FakePlaywright) -> None:
+    with BrowserPool() as warm, pytest.raises(DeadlineExceededError), warm.context(deadline=Deadline(timedelta(0))):
+        pass
+
+    assert driver.launched == []
+
+
+def test_the_pool_is_bound_to_its_thread(driver: FakePlaywright) -> None:  # noqa: ARG001
+    warm = BrowserPool()
+    with warm.context():
+        pass
+    errors: list[BaseException] = []
+
+    def borrow() -> None:
+        try:
+            with warm.context():
+                pass
+        except RuntimeError as exc:
+            errors.append(exc)
+
+    thread = threading.Thread(target=borrow)
+    thread.start()
+    thread.join()
+    warm.close()
+
+    assert "thread that started it" in str(errors[0])
+
+
+def test_a_negative_ttl_is_rejected() -> None:
+    with pytest.raises(ValueError, match="ttl must not be negative"):
+        BrowserPool(ttl=-1.0)
+
+
+def test_fetch_authorization_borrows_from_a_matching_pool(driver: FakePlaywright) -> None:
+    with (
+        BrowserPool(headless=True) as warm,
+        browser._browser_context(  # noqa: SLF001
+            headless=True,
+            install_browser=True,
+            pool=warm,
+        ) as context,
+    ):
+        assert context is driver.launched[0].contexts[0]
@@ -0,0 +1,421 @@
+from __future__ import annotations
+
+import asyncio
+import json
+from datetime import datetime, timedelta, timezone
+from email.utils import format_datetime
+from typing import TYPE_CHECKING, Any
+
+import pytest
+
+from gppt import api, config, retry, token
+from gppt.browser import Authorization
+from gppt.endpoints import Endpoints
+from gppt.retry import CircuitBreaker, RetryPolicy
+from gppt.transport import Transport
+from tests.mock_pixiv import MockPixiv
+
+if TYPE_CHECKING:
+    from collections.abc import Iterator
+    from pathlib import Path
+
+NO_WAIT = RetryPolicy(base=0, cap=0)
+
+
+@pytest.fixture(autouse=True)
+def breakers(monkeypatch: pytest.MonkeyPatch) -> dict[str, CircuitBreaker]:
+    fresh: dict[str, CircuitBreaker] = {}
+    monkeypatch.setattr(retry, "_breakers", fresh)
+    return fresh
+
+
+@pytest.fixture
+def pixiv() -> Iterator[MockPixiv]:
+    with MockPixiv() as running:
+        yield running
+
+
+def test_a_policy_needs_an_attempt() -> None:
+    with pytest.raises(ValueError, match="attempts must be at least 1"):
+        RetryPolicy(attempts=0)
+
+
+def test_a_policy_rejects_negative_delays() -> None:
+    with pytest.raises(ValueError, match="must not be negative"):
+        RetryPolicy(base=-1)
+
+
+def test_backoff_doubles_up_to_the_cap() -> None:
+    policy = RetryPolicy(base=1, cap=3)
+
+    for _ in range(100):
+        assert 0 <= policy.delay(1) <= 1
+        assert 0 <= policy.delay(2) <= 2
+        assert 0 <= policy.delay(5) <= 3
+
+
+def test_backoff_is_jittered() -> None:
+    policy = RetryPolicy(base=1, cap=8)
+
+    assert len({policy.delay(3) for _ in range(20)}) > 1
+
+
+def test_retry_after_is_honoured_up_to_the_cap() -> None:
+    policy = RetryPolicy(cap=5)
+
+    assert policy.delay(1, retry_after=2) == 2
+    assert policy.delay(1, retry_after=60) == 5
+
+
+@pytest.mark.parametrize(
+    ("headers", "expected"),
+    [({}, None), ({"Retry-After": "7"}, 7.0), ({"retry-after": "0"}, 0.0), ({"Retry-After": "soon"}, None)],
+)
+def test_retry_after_reads_seconds(headers: dict[str, str], expected: float | None) -> None:
+    assert retry.retry_after(headers) == expected
+
+
+def test_retry_after_reads_an_http_date() -> None:
+    when = datetime.now(tz=timezone.utc) + timedelta(seconds=30)
+
+    seconds = retry.retry_after({"Retry-After": format_datetime(when, usegmt=True)})
+
+    assert seconds is not None
+    assert 28 <= seconds <= 30
+
+
+def test_a_breaker_opens_after_the_threshold() -> None:
+    breaker = CircuitBreaker(threshold=3, cooldown=timedelta(minutes=1))
+
+    for _ in range(2):
+        breaker.record_failure()
+    assert breaker.allow()
+    breaker.record_failure()
+
+    assert breaker.is_open
+    assert not breaker.allow()
+    assert 55 < breaker.retry_in <= 60
+
+
+def test_a_success_resets_the_count() -> None:
+    breaker = CircuitBreaker(threshold=2)
+
+    breaker.record_failure()
+    breaker.record_success()
+    breaker.record_failure()
+
+    assert breaker.allow()
+
+
+def test_after_the_cooldown_one_trial_goes_through() -> None:
+    breaker = CircuitBreaker(threshold=1, cooldown=timedelta(0))
+    breaker.record_failure()
+
+    assert breaker.allow()
+    assert not breaker.allow()  # the trial is still out
+    breaker.record_success()
+
+    assert not breaker.is_open
+    assert breaker.allow()
+    assert breaker.allow()
+
+
+def test_a_failed_trial_opens_the_breaker_again() -> None:
+    breaker = CircuitBreaker(threshold=5, cooldown=timedelta(0))
+    for _ in range(5):
+        breaker.record_failure()
+    trial = breaker.allow()
+
+    breaker.record_failure(trial)
+
+    assert breaker.allow()  # the next trial, after another (zero) cooldown
+    assert not breaker.allow()
+
+
+def test_only_the_trial_can_give_it_back() -> None:
+    breaker = CircuitBreaker(threshold=1, cooldown=timedelta(0))
+    early = breaker.allow()  # sent while the breaker was still closed
+    assert early is not None
+    breaker.record_failure()
+    assert breaker.allow()  # the trial
+
+    breaker.release(early)
+    breaker.record_failure(early)
+
+    assert not breaker.allow()  # still just the one trial in flight
+
+
+def test_a_late_failure_does_not_restart_the_cooldown(monkeypatch: pytest.MonkeyPatch) -> None:
+    now = [1000.0]
+    monkeypatch.setattr(retry.time, "monotonic", lambda: now[0])
+    breaker = CircuitBreaker(threshold=1, cooldown=timedelta(minutes=1))
+    early = breaker.allow()
+    breaker.record_failure()
+    now[0] += 30
+
+    breaker.record_failure(early)
+
+    assert breaker.retry_in == 30
+
+
+def test_a_breaker_needs_a_threshold() -> None:
+    with pytest.raises(ValueError, match="threshold must be at least 1"):
+        CircuitBreaker(threshold=0)
+
+
+def test_every_url_has_one_breaker() -> None:
+    assert retry.breaker_for("https://a/") is retry.breaker_for("https://a/")
+    assert retry.breaker_for("https://a/") is not retry.breaker_for("https://b/")
+
+
+def test_a_5xx_is_retried(pixiv: MockPixiv) -> None:
+    pixiv.failures = [503, 502]
+
+    issued = token.refresh("rt", endpoints=pixiv.endpoints, retry=NO_WAIT)
+
+    assert issued.access_token == "at1"
+    assert pixiv.refresh_tokens == ["rt"] * 3
+    assert not retry.breaker_for(pixiv.auth_token_url).is_open
+
+
+def test_a_transport_carries_its_policy(pixiv: MockPixiv) -> None:
+    pixiv.failures = [500]
+
+    with (
+        Transport(retry=RetryPolicy(attempts=1)) as transport,
+        pytest.raises(token.TokenUnavailableError, match=r"after 1 try \(last: HTTP 500\)"),
+    ):
+        token.refresh("rt", transport=transport, endpoints=pixiv.endpoints)
+
+    assert pixiv.refresh_tokens == ["rt"]
+
+
+def test_giving_up_raises_token_unavailable(pixiv: MockPixiv) -> None:
+    pixiv.failures = [503] * 3
+
+    with pytest.raises(token.TokenUnavailableError, match=r"after 3 tries \(last: HTTP 503\)"):
+        token.refresh("rt", endpoints=pixiv.endpoints, retry=NO_WAIT)
+
+    assert pixiv.refresh_tokens == ["rt"] * 3
+
+
+def test_a_rejected_refresh_is_not_retried(pixiv: MockPixiv) -> None:
+    with pytest.raises(token.TokenError, match="Invalid grant") as raised:
+        token.refresh("rt-revoked", endpoints=pixiv.endpoints, retry=NO_WAIT)
+
+    assert not isinstance(raised.value, token.TokenUnavailableError)
+    assert pixiv.refresh_tokens == ["rt-revoked"]
+
+
+def test_an_unreachable_endpoint_is_retried() -> None:
+    with MockPixiv() as stopped:
+        url = stopped.auth_token_url
+    endpoints = Endpoints(auth_token_url=url)
+
+    with pytest.raises(token.TokenUnavailableError, match="ConnectionError"):
+        token.refresh("rt", endpoints=endpoints, retry=NO_WAIT)
+
+    assert retry.breaker_for(url)._failures == 3  # noqa: SLF001
+
+
+def test_a_code_exchange_that_timed_out_after_sending_is_not_sent_again(monkeypatch: pytest.MonkeyPatch) -> None:
+    sent: list[dict[str, str]] = []
+
+    def read_timeout(*_: Any, data: dict[str, str], **__: Any) -> Any:
+        sent.append(data)
+        raise token.requests.ReadTimeout
+
+    monkeypatch.setattr(token.requests, "post", read_timeout)
+    authorization = Authorization(code="single-use", code_verifier="the-verifier")
+
+    with pytest.raises(token.TokenUnavailableError, match="not sent again"):
+        token.exchange(authorization, endpoints=Endpoints(auth_token_url="https://slow.test/auth/token"), retry=NO_WAIT)
+
+    assert [form["code"] for form in sent] == ["single-use"]
+
+
+def test_a_connect_timeout_is_retried(monkeypatch: pytest.MonkeyPatch) -> None:
+    sent: list[Any] = []
+
+    def connect_timeout(*args: Any, **__: Any) -> Any:
+        sent.append(args)
+        raise token.requests.ConnectTimeout
+
+    monkeypatch.setattr(token.requests, "post", connect_timeout)
+    authorization = Authorization(code="single-use", code_verifier="the-verifier")
+
+    with pytest.raises(token.TokenUnavailableError, match="after 3 tries"):
+        token.exchange(authorization, endpoints=Endpoints(auth_token_url="https://down.test/auth/token"), retry=NO_WAIT)
+
+    assert len(sent) == 3
+
+
+def test_aio_does_not_resend_a_request_that_got_no_answer() -> None:
+    httpx = pytest.importorskip("httpx")
+    from gppt import aio  # noqa: PLC0415 -- needs httpx
+
+    sent: list[Any] = []
+
+    def read_timeout(request: Any) -> Any:
+        sent.append(request)
+        msg = "timed out"
+        raise httpx.ReadTimeout(msg, request=request)
+
+    async def refresh() -> token.Token:
+        async with httpx.AsyncClient(transport=httpx.MockTransport(read_timeout)) as client:
+            endpoints = Endpoints(auth_token_url="https://slow.test/auth/token")
+            return await aio.refresh("rt", client=client, endpoints=endpoints, retry=NO_WAIT)
+
+    with pytest.raises(token.TokenUnavailableError, match="not sent again"):
+        asyncio.run(refresh())
+
+    assert len(sent) == 1
+
+
+def test_a_body_that_is_not_json_is_a_token_error(monkeypatch: pytest.MonkeyPatch) -> None:
+    class _NotJson:
+        status_code = 200
+        headers: dict[str, str] = {}  # noqa: RUF012
+        text = "<html>maintenance</html>"
+
+        def json(self) -> Any:
+            return json.loads(self.text)
+
+    monkeypatch.setattr(token.requests, "post", lambda *_, **__: _NotJson())
+
+    with pytest.raises(token.TokenError, match="HTTP 200 without JSON"):
+        token.refresh("rt", retry=NO_WAIT)
+
+
+def test_the_server_sets_the_wait(monkeypatch: pytest.MonkeyPatch) -> None:
+    answers = iter([(429, {"Retry-After": "4"}), (200, {})])
+    waits: list[float] = []
+
+    class _Response:
+        def __init__(self) -> None:
+            self.status_code, self.headers = next(answers)
+
+        def json(self) -> dict[str, Any]:
+            return {"access_token": "at", "expires_in": 3600}
+
+    monkeypatch.setattr(token.requests, "post", lambda *_, **__: _Response())
+    monkeypatch.setattr(token.time, "sleep", waits.append)
+
+    token.refresh("rt")
+
+    assert waits == [4.0]
+
+
+def test_a_token_request_gives_up_after_its_attempts() -> None:
+    class _Response:
+        status_code = 503
+        headers: dict[str, str] = {}  # noqa: RUF012
+        text = "busy"
+
+    request = token.TokenRequest("https://oauth.example/token", RetryPolicy(attempts=2, base=0, cap=0))
+
+    for _ in range(2):
+        request.start()
+        assert request.answered(_Response()) is None
+    with pytest.raises(token.TokenUnavailableError, match="failed after 2 tries"):
+        request.backoff()
+
+
+def test_an_open_breaker_fails_without_a_request(pixiv: MockPixiv) -> None:
+    pixiv.failures = [503] * retry.DEFAULT_THRESHOLD
+
+    with pytest.raises(token.TokenUnavailableError):
+        token.refresh("rt", endpoints=pixiv.endpoints, retry=RetryPolicy(attempts=retry.DEFAULT_THRESHOLD, cap=0))
+    with pytest.raises(token.TokenUnavailableError, match="not sending more requests"):
+        token.refresh("rt", endpoints=pixiv.endpoints)
+
+    assert len(pixiv.refresh_tokens) == retry.DEFAULT_THRESHOLD
+
+
+def test_get_token_does_not_fall_back_to_a_browser_while_pixiv_is_down(
+    monkeypatch: pytest.MonkeyPatch,
+    tmp_path: Path,
+    pixiv: MockPixiv,
+) -> None:
+    monkeypatch.setattr(config, "CONFIG_DIR", tmp_path)
+    monkeypatch.setattr(api, "_browser_login", lambda *_, **__: pytest.fail("a browser was opened"))
+    stale = token.Token(
+        access_token="stale",
+        refresh_token="rt",
+        expires_in=3600,
+        expires_at=(datetime.now(tz=timezone.utc) - timedelta(seconds=1)).isoformat(),
+    )
+    token.save("work", stale)
+    pixiv.failures = [503] * 3
+
+    with Transport(retry=NO_WAIT) as transport, pytest.raises(token.TokenUnavailableError):
+        api.get_token("work", transport=transport, endpoints=pixiv.endpoints)
+
+    assert token.load("work") == stale
+
+
+def test_an_interrupted_trial_gives_the_breaker_back(
+    monkeypatch: pytest.MonkeyPatch,
+    breakers: dict[str, CircuitBreaker],
+) -> None:
+    url = "https://interrupted.test/auth/token"
+    breaker = breakers[url] = CircuitBreaker(threshold=1, cooldown=timedelta(0))
+    breaker.record_failure()
+
+    def interrupt(*_: Any, **__: Any) -> Any:
+        raise KeyboardInterrupt
+
+    monkeypatch.setattr(token.requests, "post", interrupt)
+
+    with pytest.raises(KeyboardInterrupt):
+        token.refresh("rt", endpoints=Endpoints(auth_token_url=url))
+
+    assert breaker.allow()  # the next caller gets the trial
+
+
+def test_a_cancelled_aio_trial_gives_the_breaker_back(breakers: dict[str, CircuitBreaker]) -> None:
+    httpx = pytest.importorskip("httpx")
+    from gppt import aio  # noqa: PLC0415 -- needs httpx
+
+    url = "https://cancelled.test/auth/token"
+    breaker = breakers[url] = CircuitBreaker(threshold=1, cooldown=timedelta(0))
+    breaker.record_failure()
+
+    async def hang(_: Any) -> Any:
+        await asyncio.Event().wait()
+
+    async def refresh() -> token.Token:
+        async with httpx.AsyncClient(transport=httpx.MockTransport(hang)) as client:
+            return await asyncio.wait_for(
+                aio.refresh("rt", client=client, endpoints=Endpoints(auth_token_url=url)), 0.05
+            )
+
+    with pytest.raises(asyncio.TimeoutError):
+        asyncio.run(refresh())
+
+    assert breaker.allow()
+
+
+def test_aio_retries_with_the_same_breakers() -> None:
+    httpx = pytest.importorskip("httpx")
+    from gppt import aio  # noqa: PLC0415 -- needs httpx
+
+    statuses = iter([503, 200, 503])
+
+    def handler(_: Any) -> Any:
+        status = next(statuses)
+        return httpx.Response(status, json={"access_token": "at", "expires_in": 3600} if status == 200 else {})
+
+    endpoints = Endpoints(auth_token_url="https://retry.test/auth/token")
+    breaker = retry.breaker_for(endpoints.auth_token_url)
+
+    async def refresh() -> token.Token:
+        async with httpx.AsyncClient(transport=httpx.MockTransport(handler)) as client:
+            return await aio.refresh("rt", client=client, endpoints=endpoints, retry=NO_WAIT)
+
+    assert asyncio.run(refresh()).access_token == "at"
+    for _ in range(retry.DEFAULT_THRESHOLD):
+        breaker.record_failure()
+    with pytest.raises(token.TokenUnavailableError, match="not sending more requests"):
+        asyncio.run(refresh())
+    assert next(statuses) == 503  # never requested
@@ -0,0 +1,180 @@
+from __future__ import annotations
+
+import threading
+import time
+from datetime import datetime, timedelta
+from typing import TYPE_CHECKING, Any
+
+import pytest
+
+import gppt
+from gppt import token
+from gppt.scheduler import RefreshScheduler
+from tests.conftest import make_token
+
+if TYPE_CHECKING:
+    from pathlib import Path
+
+    from gppt.api import RefreshResult
+
+LEAD = timedelta(minutes=5)
+
+
+class Recorder:
+    """Collect scheduler results and let a test wait for them."""
+
+    def __init__(self) -> None:
+        self.results: list[RefreshResult] = []
+        self._condition = threading.Condition()
+
+    def __call__(self, result: RefreshResult) -> None:
+        with self._condition:
+            self.results.append(result)
+            self._condition.notify_all()
+
+    def wait_for(self, count: int) -> list[RefreshResult]:
+        with self._condition:
+            assert self._condition.wait_for(lambda: len(self.results) >= count, timeout=5)
+            return list(self.results)
+
+
+def test_a_token_inside_the_lead_is_refreshed_at_once(
+    monkeypatch: pytest.MonkeyPatch,
+    config_dir: Path,  # noqa: ARG001
+) -> None:
+    token.save("work", make_token("old", seconds=60))
+    monkeypatch.setattr(token, "refresh", lambda *_, **__: make_token("new"))
+    recorder = Recorder()
+
+    with RefreshScheduler(["work"], lead=LEAD, on_result=recorder):
+        [result] = recorder.wait_for(1)
+
+    assert result.status == "refreshed"
+    loaded = token.load("work")
+    assert loaded is not None
+    assert loaded.access_token == "new"
+
+
+def test_a_valid_token_is_scheduled_before_it_expires(
+    monkeypatch: pytest.MonkeyPatch,
+    config_dir: Path,  # noqa: ARG001
+) -> None:
+    cached = make_token("fresh", seconds=3600)
+    token.save("work", cached)
+    monkeypatch.setattr(token, "refresh", lambda *_, **__: pytest.fail("refreshed too early"))
+    recorder = Recorder()
+    jitter = timedelta(seconds=30)
+
+    with RefreshScheduler(["work"], lead=LEAD, jitter=jitter, on_result=recorder) as scheduler:
+        recorder.wait_for(1)
+        time.sleep(0.05)  # let the worker put the profile back on the heap
+        [(profile, due)] = scheduler.scheduled()
+
+    expires_at = datetime.fromisoformat(cached.expires_at)
+    assert profile == "work"
+    assert expires_at - LEAD - jitter - timedelta(seconds=1) <= due <= expires_at - LEAD + timedelta(seconds=1)
+
+
+def test_concurrency_is_bounded(
+    monkeypatch: pytest.MonkeyPatch,
+    config_dir: Path,  # noqa: ARG001
+) -> None:
+    profiles = [f"p{index}" for index in range(6)]
+    for profile in profiles:
+        token.save(profile, make_token(profile, seconds=-10))
+
+    running = 0
+    peak = 0
+    counter = threading.Lock()
+
+    def slow_refresh(*_: Any, **__: Any) -> token.Token:
+        nonlocal running, peak
+        with counter:
+            running += 1
+            peak = max(peak, running)
+        time.sleep(0.05)
+        with counter:
+            running -= 1
+        return make_token("new")
+
+    monkeypatch.setattr(token, "refresh", slow_refresh)
+    recorder = Recorder()
+
+    with RefreshScheduler(profiles, lead=LEAD, max_workers=2, on_result=recorder):
+        results = recorder.wait_for(len(profiles))
+
+    assert {result.status for result in results} == {"refreshed"}
+    assert peak == 2
+
+
+def test_a_failed_refresh_is_retried(
+    monkeypatch: pytest.MonkeyPatch,
+    config_dir: Path,  # noqa: ARG001
+) -> None:
+    token.save("work", make_token("old", seconds=-10))
+    attempts: list[str] = []
+
+    def flaky_refresh(refresh_token: str, **_: Any) -> token.Token:
+        attempts.append(refresh_token)
+        if len(attempts) == 1:
+            msg = "server_error"
+            raise token.TokenError(msg)
+        return make_token("new")
+
+    monkeypatch.setattr(token, "refresh", flaky_refresh)
+    recorder = Recorder()
+
+    with RefreshScheduler(
+        ["work"],
+        lead=LEAD,
+        jitter=timedelta(0),
+        retry=timedelta(milliseconds=50),
+        on_result=recorder,
+    ):
+        results = recorder.wait_for(2)
+
+    assert [result.status for result in results[:2]] == ["failed", "refreshed"]
+    assert "server_error" in results[0].error
+    assert attempts == ["rt-old", "rt-old"]
+
+
+def test_without_profiles_every_cached_profile_is_tracked(config_dir: Path) -> None:  # noqa: ARG001
+    token.save("a", make_token("a"))
+    token.save("b", make_token("b"))
+    recorder = Recorder()
+
+    with RefreshScheduler(lead=LEAD, on_result=recorder):
+        results = recorder.wait_for(2)
+
+    assert sorted(result.profile for result in results) == ["a", "b"]
+
+
+def test_a_profile_is_tracked_once(config_dir: Path) -> None:  # noqa: ARG001
+    token.save("work", make_token())
+    scheduler = RefreshScheduler(["work", "work"])
+
+    scheduler.add("work")
+
+    assert [profile for profile, _ in scheduler.scheduled()] == ["work"]
+
+
+def test_stop_ends_run(config_dir: Path) -> None:  # noqa: ARG001
+    token.save("work", make_token())
+    scheduler = RefreshScheduler(["work"])
+    runner = threading.Thread(target=scheduler.run)
+    runner.start()
+
+    time.sleep(0.05)
+    scheduler.stop()
+    runner.join(timeout=5)
+
+    assert not runner.is_alive()
+
+
+def test_a_scheduler_starts_once(config_dir: Path) -> None:  # noqa: ARG001
+    with RefreshScheduler([]) as scheduler, pytest.raises(RuntimeError):
+        scheduler.start()
+
+
+def test_the_scheduler_is_exported() -> None:
+    assert gppt.RefreshScheduler is RefreshScheduler
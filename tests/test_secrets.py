@@ -1,14 +1,17 @@
 from __future__ import annotations
 
 import subprocess
+from datetime import timedelta
 from typing import TYPE_CHECKING, Any
 
 import pytest
 
-from gppt import secrets
+from gppt import api, config, secrets, token
+from gppt.browser import Authorization
 
 if TYPE_CHECKING:
     from collections.abc import Sequence
+    from pathlib import Path
 
 
 def test_plain_values_pass_through() -> None:
@@ -47,3 +50,120 @@ def test_op_failure_is_reported(monkeypatch: pytest.MonkeyPatch) -> None:
 
     with pytest.raises(ValueError, match="not signed in"):
         secrets.resolve_secret("op://vault/item/password")
+
+
+class FakeOp:
+    """Stand in for the `op` CLI, answering `op read` and `op inject` from a vault dict."""
+
+    def __init__(self, vault: dict[str, str]) -> None:
+        self.vault = vault
+        self.calls: list[list[str]] = []
+
+    def __call__(self, args: Sequence[str], *, input: str | None = None, **_: Any) -> subprocess.CompletedProcess[str]:  # noqa: A002
+        self.calls.append(list(args))
+        if args[1] == "read":
+            stdout = self.vault[args[2]] + "\n"
+        else:
+            assert input is not None
+            stdout = input
+            for reference, secret in self.vault.items():
+                stdout = stdout.replace(f"{{{{ {reference} }}}}", secret)
+        return subprocess.CompletedProcess(args=list(args), returncode=0, stdout=stdout, stderr="")
+
+
+@pytest.fixture
+def op(monkeypatch: pytest.MonkeyPatch) -> FakeOp:
+    fake = FakeOp(
+        {
+            "op://v/i/username": "me",
+            "op://v/i/password": "pa ss\nword",  # several lines survive the batch
+            "op://v/i/totp": "JBSWY3DPEHPK3PXP",
+        },
+    )
+    monkeypatch.setattr(secrets.shutil, "which", lambda _: "/usr/bin/op")
+    monkeypatch.setattr(secrets.subprocess, "run", fake)
+    return fake
+
+
+def test_every_reference_is_resolved_in_one_run(op: FakeOp) -> None:
+    resolved = secrets.resolve_secrets(["op://v/i/username", "op://v/i/password", "op://v/i/totp"])
+
+    assert resolved == ["me", "pa ss\nword", "JBSWY3DPEHPK3PXP"]
+    assert [call[:2] for call in op.calls] == [["op", "inject"]]
+
+
+def test_plain_values_and_repeats_cost_nothing_extra(op: FakeOp) -> None:
+    resolved = secrets.resolve_secrets(["plain", "op://v/i/username", "", "op://v/i/username"])
+
+    assert resolved == ["plain", "me", "", "me"]
+    assert op.calls == [["op", "read", "op://v/i/username"]]
+
+
+def test_without_references_op_is_not_run(op: FakeOp) -> None:
+    assert secrets.resolve_secrets(["me", "pw", ""]) == ["me", "pw", ""]
+    assert op.calls == []
+
+
+def test_the_cache_skips_op_until_the_ttl_runs_out(monkeypatch: pytest.MonkeyPatch, op: FakeOp) -> None:
+    now = [1000.0]
+    monkeypatch.setattr(secrets.time, "monotonic", lambda: now[0])
+    cache = secrets.SecretCache(ttl=timedelta(minutes=5))
+    references = ["op://v/i/username", "op://v/i/password"]
+
+    secrets.resolve_secrets(references, cache=cache)
+    now[0] += 299
+    assert secrets.resolve_secrets(references, cache=cache) == ["me", "pa ss\nword"]
+    assert len(op.calls) == 1
+
+    now[0] += 1
+    secrets.resolve_secrets(references, cache=cache)
+    assert len(op.calls) == 2
+
+
+def test_only_uncached_references_are_resolved(op: FakeOp) -> None:
+    cache = secrets.SecretCache()
+    secrets.resolve_secret("op://v/i/username", cache=cache)
+
+    secrets.resolve_secrets(["op://v/i/username", "op://v/i/totp"], cache=cache)
+
+    assert op.calls[1] == ["op", "read", "op://v/i/totp"]
+
+
+def test_garbled_inject_output_is_reported(monkeypatch: pytest.MonkeyPatch) -> None:
+    def fake_run(args: Sequence[str], **_: Any) -> subprocess.CompletedProcess[str]:
+        return subprocess.CompletedProcess(args=list(args), returncode=0, stdout="nothing useful", stderr="")
+
+    monkeypatch.setattr(secrets.shutil, "which", lambda _: "/usr/bin/op")
+    monkeypatch.setattr(secrets.subprocess, "run", fake_run)
+
+    with pytest.raises(ValueError, match="Unexpected output from `op inject`"):
+        secrets.resolve_secrets(["op://v/i/username", "op://v/i/password"])
+
+
+def test_get_token_resolves_a_profile_with_one_op_run(
+    monkeypatch: pytest.MonkeyPatch,
+    tmp_path: Path,
+    op: FakeOp,
+) -> None:
+    monkeypatch.setattr(config, "CONFIG_DIR", tmp_path)
+    for name in (config.USERNAME_ENV, config.PASSWORD_ENV, config.TOTP_SECRET_ENV):
+        monkeypatch.delenv(name, raising=False)
+    config.save(
+        "work",
+        config.ProfileConfig(username="op://v/i/username", password="op://v/i/password", totp_secret="op://v/i/totp"),
+    )
+    seen: dict[str, Any] = {}
+
+    def fake_fetch(username: str, password: str, **options: Any) -> Authorization:
+        seen.update(username=username, password=password, **options)
+        return Authorization(code="code", code_verifier="verifier")
+
+    monkeypatch.setattr(api, "fetch_authorization", fake_fetch)
+    monkeypatch.setattr(api, "will_install", lambda **_: False)
+    monkeypatch.setattr(token, "exchange", lambda *_, **__: token.Token("at", "rt", 3600, "2099-01-01T00:00:00+00:00"))
+
+    api.get_token("work", force=True, save=False)
+
+    credentials = seen["credentials"].result()
+    assert (credentials.username, credentials.password) == ("me", "pa ss\nword")
+    assert [call[:2] for call in op.calls] == [["op", "inject"]]
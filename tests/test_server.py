@@ -0,0 +1,277 @@
+from __future__ import annotations
+
+import http.client
+import json
+import os
+import socket
+import threading
+import time
+from datetime import timedelta
+from typing import TYPE_CHECKING, Any
+
+import pytest
+
+from gppt import api, token
+from gppt.endpoints import ENV
+from gppt.retry import RetryPolicy
+from gppt.server import TokenServer
+from gppt.transport import Transport
+from tests.conftest import make_token
+from tests.mock_pixiv import MockPixiv
+
+if TYPE_CHECKING:
+    from collections.abc import Iterator
+    from pathlib import Path
+
+
+@pytest.fixture
+def oauth(monkeypatch: pytest.MonkeyPatch) -> Iterator[MockPixiv]:
+    with MockPixiv() as pixiv:
+        monkeypatch.setenv(ENV["auth_token_url"], pixiv.auth_token_url)
+        yield pixiv
+
+
+@pytest.fixture
+def server(config_dir: Path, oauth: MockPixiv) -> Iterator[TokenServer]:  # noqa: ARG001
+    with TokenServer(("127.0.0.1", 0)) as running:
+        yield running
+
+
+def _connect(server: TokenServer) -> http.client.HTTPConnection:
+    address = server.address
+    assert isinstance(address, tuple)
+    return http.client.HTTPConnection(*address, timeout=5)
+
+
+def _get(server: TokenServer, path: str, headers: dict[str, str] | None = None) -> tuple[int, dict[str, Any]]:
+    connection = _connect(server)
+    try:
+        connection.request("GET", path, headers=headers or {})
+        response = connection.getresponse()
+        return response.status, json.loads(response.read())
+    finally:
+        connection.close()
+
+
+def test_a_valid_token_is_served_without_the_refresh_token(server: TokenServer, oauth: MockPixiv) -> None:
+    token.save("work", make_token("cached"))
+
+    status, body = _get(server, "/token/work")
+
+    assert status == 200
+    assert body["access_token"] == "cached"
+    assert body["user_name"] == "Me"
+    assert 3590 <= body["expires_in"] <= 3600
+    assert "refresh_token" not in body
+    assert oauth.refresh_tokens == []
+
+
+def test_an_expired_token_is_refreshed_once_and_saved(server: TokenServer, oauth: MockPixiv) -> None:
+    token.save("work", make_token("stale", seconds=-10))
+
+    statuses = []
+    bodies = []
+    lock = threading.Lock()
+
+    def fetch() -> None:
+        status, body = _get(server, "/token/work")
+        with lock:
+            statuses.append(status)
+            bodies.append(body)
+
+    workers = [threading.Thread(target=fetch) for _ in range(8)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+
+    assert statuses == [200] * 8
+    assert {body["access_token"] for body in bodies} == {"at1"}
+    assert oauth.refresh_tokens == ["rt-stale"]
+    saved = token.load("work")
+    assert saved is not None
+    assert saved.refresh_token == "rt1"
+
+
+def test_tokens_are_served_from_memory(
+    monkeypatch: pytest.MonkeyPatch,
+    server: TokenServer,
+) -> None:
+    token.save("work", make_token("cached"))
+    _get(server, "/token/work")
+    monkeypatch.setattr(token, "load", lambda _: pytest.fail("the cache file was read again"))
+
+    status, body = _get(server, "/token/work")
+
+    assert status == 200
+    assert body["access_token"] == "cached"
+
+
+def test_a_kept_alive_connection_does_not_stall(server: TokenServer) -> None:
+    token.save("work", make_token("cached"))
+    connection = _connect(server)
+    try:
+        started = time.perf_counter()
+        for _ in range(10):
+            connection.request("GET", "/token/work")
+            assert connection.getresponse().read()
+        elapsed = time.perf_counter() - started
+    finally:
+        connection.close()
+
+    # A response written in two parts waits ~40 ms on delayed ACKs every time.
+    assert elapsed < 0.3
+
+
+def test_a_served_profile_is_refreshed_ahead_of_expiry(
+    config_dir: Path,  # noqa: ARG001
+    oauth: MockPixiv,
+) -> None:
+    token.save("work", make_token("soon", seconds=120))  # inside the lead, but not yet expired
+
+    with TokenServer(("127.0.0.1", 0), lead=timedelta(minutes=5)) as server:
+        status, body = _get(server, "/token/work")
+        assert status == 200
+        assert body["access_token"] == "soon"
+
+        deadline = time.monotonic() + 5
+        while not oauth.refresh_tokens and time.monotonic() < deadline:
+            time.sleep(0.01)
+
+    assert oauth.refresh_tokens == ["rt-soon"]
+
+
+def test_a_profile_without_a_token_is_not_found(server: TokenServer) -> None:
+    status, body = _get(server, "/token/nobody")
+
+    assert status == 404
+    assert "gppt login -p nobody" in body["error"]
+
+
+def test_a_rejected_refresh_is_not_found(server: TokenServer, oauth: MockPixiv) -> None:
+    token.save("work", make_token("revoked", seconds=-10))
+
+    status, _ = _get(server, "/token/work")
+
+    assert status == 404
+    assert oauth.refresh_tokens == ["rt-revoked"]
+
+
+def test_an_unreachable_pixiv_is_unavailable(config_dir: Path, oauth: MockPixiv) -> None:  # noqa: ARG001
+    token.save("work", make_token("stale", seconds=-10))
+    oauth.failures = [503]
+
+    with TokenServer(("127.0.0.1", 0), transport=Transport(retry=RetryPolicy(attempts=1))) as server:
+        status, body = _get(server, "/token/work")
+
+    assert status == 503
+    assert "HTTP 503" in body["error"]
+    assert oauth.refresh_tokens == ["rt-stale"]
+
+
+@pytest.mark.parametrize("path", ["/", "/token/", "/token/..", "/token/../secrets", "/other/work"])
+def test_only_profile_names_are_answered(
+    server: TokenServer,
+    config_dir: Path,
+    path: str,
+) -> None:
+    token.save("work", make_token())
+    (config_dir.parent / "secrets.token.json").write_text(json.dumps({"access_token": "leak"}))
+
+    status, _ = _get(server, path)
+
+    assert status == 404
+
+
+@pytest.mark.parametrize("host", ["gppt.attacker.example", "gppt.attacker.example:8465", ""])
+def test_a_request_for_another_host_name_is_forbidden(server: TokenServer, host: str) -> None:
+    token.save("work", make_token("cached"))
+
+    status, body = _get(server, "/token/work", {"Host": host})
+
+    assert status == 403
+    assert "access_token" not in body
+
+
+@pytest.mark.parametrize("host", ["localhost:8465", "127.0.0.1", "[::1]:8465"])
+def test_a_request_for_this_machine_is_answered(server: TokenServer, host: str) -> None:
+    token.save("work", make_token("cached"))
+
+    status, _ = _get(server, "/token/work", {"Host": host})
+
+    assert status == 200
+
+
+def test_an_unexpected_failure_is_an_internal_error(
+    monkeypatch: pytest.MonkeyPatch,
+    server: TokenServer,
+) -> None:
+    def broken(*_: Any, **__: Any) -> token.Token:
+        msg = "cache corrupted"
+        raise ValueError(msg)
+
+    monkeypatch.setattr(api, "cached_token", broken)
+
+    status, body = _get(server, "/token/work")
+
+    assert status == 500
+    assert body["error"] == "ValueError: cache corrupted"
+
+
+@pytest.mark.skipif(not hasattr(socket, "AF_UNIX"), reason="needs Unix sockets")
+def test_a_unix_socket_is_private_and_removed(
+    config_dir: Path,
+    oauth: MockPixiv,  # noqa: ARG001
+) -> None:
+    token.save("work", make_token("cached"))
+    path = config_dir / "gppt.sock"
+
+    with TokenServer(path):
+        assert path.stat().st_mode & 0o077 == 0
+        with socket.socket(socket.AF_UNIX) as client:
+            client.connect(str(path))
+            client.sendall(b"GET /token/work HTTP/1.1\r\nHost: gppt\r\nConnection: close\r\n\r\n")
+            response = b""
+            while chunk := client.recv(4096):
+                response += chunk
+
+    assert response.startswith(b"HTTP/1.1 200")
+    assert b'"access_token": "cached"' in response
+    assert not path.exists()
+
+
+@pytest.mark.skipif(not hasattr(socket, "AF_UNIX"), reason="needs Unix sockets")
+def test_the_default_is_a_socket_in_the_config_directory(config_dir: Path) -> None:
+    with TokenServer(refresh_ahead=False) as server:
+        assert server.address == str(config_dir / "serve.sock")
+        assert (config_dir / "serve.sock").stat().st_mode & 0o077 == 0
+
+
+@pytest.mark.skipif(not hasattr(socket, "AF_UNIX"), reason="needs Unix sockets")
+def test_binding_the_socket_leaves_the_umask_alone(monkeypatch: pytest.MonkeyPatch, config_dir: Path) -> None:
+    umasks: list[int] = []
+    monkeypatch.setattr(os, "umask", umasks.append)  # process-wide: would touch other threads' files
+
+    with TokenServer(config_dir / "gppt.sock", refresh_ahead=False):
+        pass
+
+    assert umasks == []
+
+
+def test_a_stale_socket_file_is_replaced(config_dir: Path) -> None:
+    path = config_dir / "gppt.sock"
+    with socket.socket(socket.AF_UNIX) as leftover:
+        leftover.bind(str(path))  # bound, never listening: what a crashed server leaves
+
+    with TokenServer(path, refresh_ahead=False) as server:
+        assert server.address == str(path)
+
+
+def test_a_regular_file_is_not_replaced(config_dir: Path) -> None:
+    path = config_dir / "gppt.sock"
+    path.write_text("keep me")
+
+    with pytest.raises(FileExistsError):
+        TokenServer(path)
+
+    assert path.read_text() == "keep me"
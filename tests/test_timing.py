@@ -0,0 +1,87 @@
+from __future__ import annotations
+
+import threading
+import time
+
+import pytest
+
+import gppt
+from gppt import timing
+from gppt.timing import Trace
+
+
+def test_spans_are_timed_from_the_start_of_the_trace() -> None:
+    trace = Trace()
+
+    with trace.span("first"):
+        time.sleep(0.02)
+    with trace.span("second"):
+        pass
+
+    first, second = trace.spans
+    assert (first.name, second.name) == ("first", "second")
+    assert first.duration_s >= 0.02
+    assert second.start_s >= first.end_s
+    assert trace.elapsed_s == second.end_s
+
+
+def test_a_failing_phase_is_still_recorded() -> None:
+    trace = Trace()
+
+    with pytest.raises(RuntimeError), trace.span("launch"):
+        raise RuntimeError
+
+    assert [span.name for span in trace.spans] == ["launch"]
+
+
+def test_overlapping_phases_from_other_threads() -> None:
+    trace = Trace()
+
+    def work() -> None:
+        with trace.span("secrets"):
+            time.sleep(0.05)
+
+    worker = threading.Thread(target=work, name="worker")
+    with trace.span("launch"):
+        worker.start()
+        time.sleep(0.05)
+        worker.join()
+
+    spans = {span.name: span for span in trace.spans}
+    assert spans["secrets"].thread == "worker"
+    assert spans["secrets"].start_s < spans["launch"].end_s
+    # Both took 50 ms, yet the critical path is barely longer than one of them.
+    assert trace.elapsed_s < spans["secrets"].duration_s + spans["launch"].duration_s
+
+
+def test_on_span_hears_of_each_phase_as_it_ends() -> None:
+    heard: list[str] = []
+    trace = Trace(on_span=lambda span: heard.append(span.name))
+
+    with trace.span("launch"):
+        assert heard == []
+    with trace.span("page load"):
+        pass
+
+    assert heard == ["launch", "page load"]
+
+
+def test_the_report_lists_every_phase_and_the_total() -> None:
+    trace = Trace()
+    with trace.span("page load"):
+        pass
+
+    lines = trace.report().splitlines()
+
+    assert "page load" in lines[0]
+    assert lines[-1].endswith("total")
+
+
+def test_no_trace_costs_nothing() -> None:
+    with timing.span(None, "launch"):
+        pass
+    assert timing.span(None, "a") is timing.span(None, "b")
+
+
+def test_the_trace_is_exported() -> None:
+    assert gppt.Trace is Trace
@@ -1,6 +1,9 @@
 from __future__ import annotations
 
+import os
 import stat
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta, timezone
 from typing import TYPE_CHECKING, Any, cast
 
@@ -8,6 +11,7 @@ import pytest
 
 from gppt import config, token
 from gppt.browser import Authorization
+from gppt.consts import AUTH_TOKEN_URL
 
 if TYPE_CHECKING:
     from pathlib import Path
@@ -64,6 +68,13 @@ def test_a_token_expiring_within_the_margin_is_expired() -> None:
     assert almost.is_expired is True
 
 
+def test_expires_within_looks_ahead() -> None:
+    issued = token.Token.from_response(_response(expires_in=600))
+
+    assert issued.expires_within(timedelta(minutes=5)) is False
+    assert issued.expires_within(timedelta(minutes=15)) is True
+
+
 def test_a_corrupt_expiry_counts_as_expired() -> None:
     broken = token.Token(access_token="at", refresh_token="rt", expires_in=0, expires_at="not-a-date")
 
@@ -94,6 +105,58 @@ def test_load_ignores_a_corrupt_cache(monkeypatch: pytest.MonkeyPatch, tmp_path:
     assert token.load("work") is None
 
 
+def test_save_can_fsync(monkeypatch: pytest.MonkeyPatch, tmp_path: Path) -> None:
+    monkeypatch.setattr(config, "CONFIG_DIR", tmp_path)
+    synced: list[int] = []
+    real_fsync = os.fsync
+
+    def spy(fd: int) -> None:
+        synced.append(fd)
+        real_fsync(fd)
+
+    monkeypatch.setattr(os, "fsync", spy)
+
+    token.save("work", token.Token.from_response(_response()))
+    assert synced == []
+
+    token.save("work", token.Token.from_response(_response()), fsync=True)
+    assert synced
+
+
+def test_the_cache_stays_readable_under_concurrent_writes(monkeypatch: pytest.MonkeyPatch, tmp_path: Path) -> None:
+    monkeypatch.setattr(config, "CONFIG_DIR", tmp_path)
+    token.save("work", token.Token.from_response(_response(access_token="at-start")))
+    done = threading.Event()
+    misses: list[int] = []
+    seen: set[str] = set()
+
+    def write(writer: int) -> None:
+        for round_ in range(50):
+            token.save("work", token.Token.from_response(_response(access_token=f"at-{writer}-{round_}" * 50)))
+
+    def read() -> None:
+        while not done.is_set():
+            cached = token.load("work")
+            if cached is None:
+                misses.append(1)
+            else:
+                seen.add(cached.access_token)
+
+    readers = [threading.Thread(target=read) for _ in range(4)]
+    for reader in readers:
+        reader.start()
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        list(executor.map(write, range(8)))
+    done.set()
+    for reader in readers:
+        reader.join()
+
+    assert misses == []
+    assert len(seen) > 1
+    assert token.load("work") is not None
+    assert [path.name for path in tmp_path.iterdir()] == ["work.token.json"]  # no temporary files left over
+
+
 def test_exchange_posts_the_pkce_verifier(monkeypatch: pytest.MonkeyPatch) -> None:
     sent: dict[str, Any] = {}
 
@@ -107,7 +170,7 @@ def test_exchange_posts_the_pkce_verifier(monkeypatch: pytest.MonkeyPatch) -> No
     issued = token.exchange(Authorization(code="the-code", code_verifier="the-verifier"))
 
     assert issued.access_token == "at"
-    assert sent["url"] == token.AUTH_TOKEN_URL
+    assert sent["url"] == AUTH_TOKEN_URL
     assert sent["data"]["grant_type"] == "authorization_code"
     assert sent["data"]["code"] == "the-code"
     assert sent["data"]["code_verifier"] == "the-verifier"
@@ -130,6 +193,9 @@ def test_refresh_posts_the_refresh_token(monkeypatch: pytest.MonkeyPatch) -> Non
 
 
 class _FakeResponse:
+    status_code = 200
+    headers: dict[str, str] = {}  # noqa: RUF012
+
     def __init__(self, payload: dict[str, Any]) -> None:
         self._payload = payload
 
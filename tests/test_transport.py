@@ -0,0 +1,81 @@
+from __future__ import annotations
+
+from typing import Any
+
+import pytest
+from requests.adapters import HTTPAdapter
+
+from gppt import token
+from gppt.consts import AUTH_TOKEN_URL
+from gppt.transport import Transport
+
+RESPONSE: dict[str, Any] = {"access_token": "at", "refresh_token": "rt", "expires_in": 3600}
+
+
+class _FakeResponse:
+    status_code = 200
+    headers: dict[str, str] = {}  # noqa: RUF012
+
+    def __init__(self, payload: dict[str, Any]) -> None:
+        self._payload = payload
+
+    def json(self) -> dict[str, Any]:
+        return self._payload
+
+
+def test_the_pool_is_sized_as_asked() -> None:
+    with Transport(pool_size=4) as transport:
+        adapter = transport._session.get_adapter("https://oauth.secure.pixiv.net/")  # noqa: SLF001
+
+        assert isinstance(adapter, HTTPAdapter)
+        assert adapter._pool_maxsize == 4  # noqa: SLF001
+
+
+def test_keep_alive_is_the_default() -> None:
+    with Transport() as transport:
+        assert transport._session.headers["Connection"] != "close"  # noqa: SLF001
+
+
+def test_keep_alive_can_be_turned_off() -> None:
+    with Transport(keep_alive=False) as transport:
+        assert transport._session.headers["Connection"] == "close"  # noqa: SLF001
+
+
+def test_an_empty_pool_is_rejected() -> None:
+    with pytest.raises(ValueError, match="pool_size"):
+        Transport(pool_size=0)
+
+
+def test_refresh_goes_through_the_transport(monkeypatch: pytest.MonkeyPatch) -> None:
+    sent: list[str] = []
+
+    def one_shot(*_: Any, **__: Any) -> Any:
+        pytest.fail("a one-shot request was made despite the transport")
+
+    def pooled(url: str, **_: Any) -> Any:
+        sent.append(url)
+        return _FakeResponse(RESPONSE)
+
+    monkeypatch.setattr(token.requests, "post", one_shot)
+    with Transport() as transport:
+        monkeypatch.setattr(transport, "post", pooled)
+
+        assert token.refresh("rt", transport=transport).access_token == "at"
+
+    assert sent == [AUTH_TOKEN_URL]
+
+
+def test_the_session_is_reused_between_requests(monkeypatch: pytest.MonkeyPatch) -> None:
+    sessions: list[int] = []
+
+    def fake_session_post(self: Any, _: str, **__: Any) -> Any:
+        sessions.append(id(self))
+        return _FakeResponse(RESPONSE)
+
+    monkeypatch.setattr(token.requests.Session, "post", fake_session_post)
+    with Transport() as transport:
+        token.refresh("rt", transport=transport)
+        token.refresh("rt", transport=transport)
+
+    assert len(sessions) == 2
+    assert len(set(sessions)) == 1